@@ -0,0 +1,5 @@
+import os
+import sys
+
+# Модули сервиса лежат плоско в src/main_version и импортируются по имени
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), os.pardir, os.pardir, "main_version"))
@@ -0,0 +1,45 @@
+from langchain_core.documents import Document
+from langchain_core.embeddings import DeterministicFakeEmbedding
+
+from context_compression import SentenceEmbeddings, ContextCompressor, compress_context, token_budget
+
+
+class CountingEmbedding(DeterministicFakeEmbedding):
+    """Детерминированные векторы с подсчетом закодированных текстов."""
+
+    encoded: list = []
+
+    def embed_documents(self, texts):
+        self.encoded.extend(texts)
+        return super().embed_documents(texts)
+
+
+def test_compression_is_opt_in():
+    retriever = object()
+    assert token_budget(1) == 0
+    assert compress_context(retriever, None, 1) is retriever
+
+
+def test_sentence_vectors_are_cached_in_memory_only():
+    base = CountingEmbedding(size=16, encoded=[])
+    embedding = SentenceEmbeddings(base, base, maxsize=2)
+    first = embedding.embed_documents(["а", "б", "а"])
+    assert first[0] == first[2]
+    assert base.encoded == ["а", "б"] or base.encoded == ["б", "а"]
+    embedding.embed_documents(["а", "б"])
+    assert len(base.encoded) == 2
+    # Кеш ограничен maxsize: третье предложение вытесняет самое старое
+    embedding.embed_documents(["в"])
+    assert embedding.stats()["size"] == 2
+
+
+def test_compressor_keeps_budget_and_order():
+    base = CountingEmbedding(size=16, encoded=[])
+    compressor = ContextCompressor(embedding=SentenceEmbeddings(base, base), token_budget=10)
+    docs = [Document(page_content="Первое предложение. Второе предложение. Третье предложение.",
+                     metadata={"source": "a.txt"})]
+    compressed = compressor.compress_documents(docs, "вопрос")
+    assert sum(len(doc.page_content) for doc in compressed) <= 10 * 3.5
+    text = compressed[0].page_content
+    positions = [docs[0].page_content.find(sentence) for sentence in text.split(". ") if sentence]
+    assert positions == sorted(positions)
@@ -0,0 +1,23 @@
+from dialogue_memory import DialogueMemory
+
+
+def test_truncated_current_question_is_removed():
+    question = "Как оформить требования к интеграции? " + "Подробности задачи. " * 100
+    memory = DialogueMemory(token_budget=200, brief_chars=100)
+    memory.add("assistant", "Короткий ответ.")
+    memory.add("user", question)
+    memory = DialogueMemory.from_payload(memory.to_json(), token_budget=200, brief_chars=100)
+    # Вопрос не влез в бюджет и обрезан, но все равно узнается как текущий
+    assert memory.recent[-1]["content"] != question
+    assert memory.pop_question(question)
+    assert memory.recent == [{"role": "assistant", "content": "Короткий ответ."}]
+
+
+def test_other_last_message_is_kept():
+    memory = DialogueMemory()
+    memory.add("user", "Первый вопрос")
+    memory.add("assistant", "Ответ")
+    assert not memory.pop_question("Второй вопрос")
+    memory.add("user", "Первый вопрос")
+    assert not memory.pop_question("Второй вопрос")
+    assert len(memory.recent) == 3
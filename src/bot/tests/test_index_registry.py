@@ -0,0 +1,32 @@
+import asyncio
+import threading
+
+from index_registry import IndexRegistry, READY, FAILED
+
+
+def test_warm_up_error_keeps_index_ready():
+    def warm_up(name):
+        raise RuntimeError("прогрев упал")
+
+    registry = IndexRegistry({"ok": lambda: object(), "broken": lambda: 1 / 0})
+    registry.load_all(on_ready=warm_up)
+    assert registry.status == {"ok": READY, "broken": FAILED}
+    assert "ok" in registry.indexes
+
+
+def test_wait_ready_wakes_up_when_index_loads():
+    release = threading.Event()
+
+    def loader():
+        release.wait(5)
+        return object()
+
+    async def scenario():
+        registry = IndexRegistry({"slow": loader})
+        registry.start()
+        # Пока индекс грузится, ожидание истекает по таймауту и не держит поток пула
+        assert not await registry.wait_ready("slow", 0.05)
+        release.set()
+        return await registry.wait_ready("slow", 5)
+
+    assert asyncio.run(scenario())
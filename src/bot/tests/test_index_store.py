@@ -0,0 +1,12 @@
+import pytest
+
+import index_store
+from index_store import write_manifest, read_manifest
+
+
+def test_manifest_rejects_other_layout(tmp_path, monkeypatch):
+    monkeypatch.setattr(index_store, "INDEX_CACHE_DIR", str(tmp_path))
+    write_manifest({"docs_unified": {"corpus_hash": "hash"}}, "model", 500, 100, "unified")
+    assert read_manifest("model", 500, 100, "unified")["layout"] == "unified"
+    with pytest.raises(RuntimeError, match="layout"):
+        read_manifest("model", 500, 100, "per_pack")
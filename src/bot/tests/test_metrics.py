@@ -0,0 +1,26 @@
+from metrics import Registry
+
+
+def test_mirrored_counter_and_gauge_render():
+    registry = Registry()
+    shed = registry.counter("rag_generation_shed_total", "Отклоненные генерации", ("model", "priority"))
+    queued = registry.gauge("rag_generation_queued", "Очередь", ("model", "priority"))
+    shed.set(3, model="GigaChat", priority="background")
+    queued.set(2, model="GigaChat", priority="interactive")
+    queued.set(0, model="GigaChat", priority="interactive")
+    lines = registry.render().splitlines()
+    assert "# TYPE rag_generation_shed_total counter" in lines
+    assert 'rag_generation_shed_total{model="GigaChat",priority="background"} 3' in lines
+    assert 'rag_generation_queued{model="GigaChat",priority="interactive"} 0' in lines
+
+
+def test_histogram_buckets_are_cumulative():
+    registry = Registry()
+    stage = registry.histogram("rag_stage_seconds", "Этапы", ("stage",), buckets=(0.1, 1.0))
+    for value in (0.05, 0.5, 5.0):
+        stage.observe(value, stage="ttft")
+    lines = registry.render().splitlines()
+    assert 'rag_stage_seconds_bucket{stage="ttft",le="0.1"} 1' in lines
+    assert 'rag_stage_seconds_bucket{stage="ttft",le="1"} 2' in lines
+    assert 'rag_stage_seconds_bucket{stage="ttft",le="+Inf"} 3' in lines
+    assert 'rag_stage_seconds_count{stage="ttft"} 3' in lines
@@ -0,0 +1,51 @@
+import asyncio
+from langchain_core.documents import Document
+from langchain_core.retrievers import BaseRetriever
+
+from rag_cache import normalize_query
+from stub_llm import StubChatModel
+from prompts import QUESTION_SPECS, question_chain, chain_config
+
+
+class RecordingRetriever(BaseRetriever):
+    """Ретривер, который, как CachedRetriever, нормализует вопрос-строку и запоминает его."""
+
+    queries: list = []
+
+    def _get_relevant_documents(self, query, *, run_manager=None):
+        self.queries.append(normalize_query(query))
+        return [Document(page_content="Документ базы знаний")]
+
+
+def stub_llm():
+    return StubChatModel(ttft=0.0, token_delay=0.0, answer="Ответ заглушки")
+
+
+def test_compiled_chain_passes_question_to_retriever():
+    retriever = RecordingRetriever(queries=[])
+    chain = question_chain(1, "Специалист", "Аналитик")
+    result = chain.invoke({"input": "Какие  Обязанности?"}, config=chain_config(stub_llm(), retriever))
+    assert retriever.queries == ["какие обязанности?"]
+    assert result["context"][0].page_content == "Документ базы знаний"
+    assert result["answer"].strip() == "Ответ заглушки"
+
+
+def test_compiled_chain_streams_for_every_question():
+    async def collect(question_id):
+        retriever = RecordingRetriever(queries=[])
+        chain = question_chain(question_id, "Руководитель", "Тестировщик")
+        answer = ""
+        async for chunk in chain.astream({"input": "вопрос"}, config=chain_config(stub_llm(), retriever)):
+            answer += chunk.get("answer", "")
+        return retriever.queries, answer
+
+    for question_id in [*QUESTION_SPECS, 777]:
+        queries, answer = asyncio.run(collect(question_id))
+        assert queries == ["вопрос"], question_id
+        assert answer.strip() == "Ответ заглушки", question_id
+
+
+def test_chain_is_compiled_once_per_role_and_specialization():
+    assert question_chain(2, "Специалист", "Аналитик") is question_chain(2, "Специалист", "Аналитик")
+    assert question_chain(777, "Специалист", "Аналитик") is question_chain(778, "Специалист", "Аналитик")
+    assert question_chain(2, "Специалист", "Аналитик") is not question_chain(2, "Специалист", "Тестировщик")
@@ -0,0 +1,192 @@
+import time
+import asyncio
+import pytest
+from langchain_core.documents import Document
+
+from stub_llm import StubChatModel
+from llm_pool import LLMPool
+from scheduler import GenerationScheduler, Overloaded, INTERACTIVE
+from answer_cache import SemanticAnswerCache, answer_key
+from resilience import (
+    FallbackGenerator, GenerationFailed, GenerationInterrupted, CircuitBreaker,
+    CLOSED, OPEN, HALF_OPEN, chunk_text, extractive_answer,
+)
+
+PRIMARY = "GigaChat-Max"
+FALLBACK = "GigaChat"
+
+
+def create_generator(primary, fallback=None, ttft_deadline=0.2, total_deadline=1.0,
+                     failure_threshold=2, reset_timeout=0.2):
+    """Генератор над пулами из одной заглушки на модель; сама заглушка доступна как pools[model].all_clients[0]."""
+    fallback = fallback or StubChatModel(ttft=0.0, token_delay=0.0, answer="Запасной ответ")
+    models = {PRIMARY: primary, FALLBACK: fallback}
+    pools = {model: LLMPool(model, 1, lambda model: models[model]) for model in models}
+    generator = FallbackGenerator(GenerationScheduler(pools), pools, ttft_deadline=ttft_deadline,
+                                  total_deadline=total_deadline, fallback_model=FALLBACK)
+    for breaker in generator.breakers.values():
+        breaker.failure_threshold = failure_threshold
+        breaker.reset_timeout = reset_timeout
+    return generator
+
+
+def generate(generator, make_stream=None):
+    """Текст ответа и модели, которые начинали генерацию."""
+    candidates = []
+
+    def default_stream(llm, candidate):
+        candidates.append(candidate)
+        return llm.astream("вопрос")
+
+    async def collect():
+        answer = ""
+        async for chunk in generator.stream(PRIMARY, INTERACTIVE, make_stream or default_stream):
+            answer += chunk_text(chunk)
+        return answer
+
+    return asyncio.run(collect()).strip(), candidates
+
+
+def test_primary_answers_without_fallback():
+    generator = create_generator(StubChatModel(ttft=0.0, token_delay=0.0, answer="Основной ответ"))
+    assert generate(generator) == ("Основной ответ", [PRIMARY])
+    assert generator.stats()["fallbacks"] == 0
+
+
+def test_ttft_deadline_switches_to_fallback_model():
+    primary = StubChatModel(ttft=0.0, token_delay=0.0, stall_rate=1.0, stall=5.0)
+    generator = create_generator(primary, ttft_deadline=0.1)
+    started = time.monotonic()
+    assert generate(generator) == ("Запасной ответ", [PRIMARY, FALLBACK])
+    assert time.monotonic() - started < 1.0
+    stats = generator.stats()
+    assert stats["deadline_misses"] == 1
+    assert stats["fallbacks"] == 1
+    assert stats["breakers"][PRIMARY]["failures"] == 1
+
+
+def test_total_deadline_interrupts_started_answer():
+    primary = StubChatModel(ttft=0.0, token_delay=0.1, answer="слово " * 50)
+    generator = create_generator(primary, ttft_deadline=0.1, total_deadline=0.3)
+    with pytest.raises(GenerationInterrupted):
+        generate(generator)
+    # Часть ответа уже отправлена, поэтому запасная модель не вызывается
+    assert generator.stats()["fallbacks"] == 0
+    assert generator.stats()["deadline_misses"] == 1
+
+
+def test_failure_before_first_token_switches_to_fallback_model():
+    primary = StubChatModel(ttft=0.0, token_delay=0.0, fail_rate=1.0, fail_after=0)
+    generator = create_generator(primary)
+    assert generate(generator) == ("Запасной ответ", [PRIMARY, FALLBACK])
+
+
+def test_failure_after_first_token_interrupts_answer():
+    primary = StubChatModel(ttft=0.0, token_delay=0.0, fail_rate=1.0, fail_after=3)
+    generator = create_generator(primary)
+    with pytest.raises(GenerationInterrupted):
+        generate(generator)
+
+
+def test_generation_failed_when_all_models_fail():
+    generator = create_generator(
+        StubChatModel(ttft=0.0, token_delay=0.0, fail_rate=1.0),
+        StubChatModel(ttft=0.0, token_delay=0.0, stall_rate=1.0, stall=5.0),
+        ttft_deadline=0.1,
+    )
+    with pytest.raises(GenerationFailed):
+        generate(generator)
+    assert generator.stats()["failed"] == 1
+
+
+def test_breaker_opens_and_lets_one_trial_after_reset():
+    primary = StubChatModel(ttft=0.0, token_delay=0.0, fail_rate=1.0, answer="Основной ответ")
+    generator = create_generator(primary, failure_threshold=2, reset_timeout=0.2)
+    breaker = generator.breakers[PRIMARY]
+    for _ in range(2):
+        assert generate(generator)[0] == "Запасной ответ"
+    assert breaker.state == OPEN
+
+    # Пока цепь разомкнута, основная модель не вызывается
+    assert generate(generator) == ("Запасной ответ", [FALLBACK])
+    assert breaker.stats()["rejected"] == 1
+
+    # После reset_timeout пропускается пробный запрос; успех замыкает цепь
+    time.sleep(0.25)
+    primary.fail_rate = 0.0
+    assert generate(generator) == ("Основной ответ", [PRIMARY])
+    assert breaker.state == CLOSED
+
+
+def test_failed_trial_opens_breaker_again():
+    breaker = CircuitBreaker(PRIMARY, failure_threshold=1, reset_timeout=0.05)
+    breaker.record_failure()
+    assert not breaker.allow()
+    time.sleep(0.06)
+    assert breaker.allow()
+    assert breaker.state == HALF_OPEN
+    # Второй запрос во время пробного не пропускается
+    assert not breaker.allow()
+    breaker.record_failure()
+    assert breaker.state == OPEN
+    assert breaker.stats()["opened"] == 2
+
+
+def test_non_model_error_does_not_trip_breaker():
+    generator = create_generator(StubChatModel(ttft=0.0, token_delay=0.0), failure_threshold=1)
+
+    def broken_stream(llm, candidate):
+        raise ValueError("ошибка кода сервиса")
+
+    with pytest.raises(ValueError):
+        generate(generator, broken_stream)
+    stats = generator.stats()
+    assert stats["breakers"][PRIMARY]["failures"] == 0
+    assert stats["fallbacks"] == 0
+
+
+def test_overloaded_queue_releases_half_open_trial():
+    generator = create_generator(StubChatModel(ttft=0.0, token_delay=0.0), failure_threshold=1, reset_timeout=0.05)
+    breaker = generator.breakers[PRIMARY]
+    breaker.record_failure()
+    time.sleep(0.06)
+
+    async def overloaded(model, priority):
+        raise Overloaded("очередь заполнена")
+
+    generator.scheduler.acquire = overloaded
+    with pytest.raises(Overloaded):
+        generate(generator)
+    # Пробный запрос не дошел до модели: следующий пропускается сразу, а не через reset_timeout
+    assert breaker.state == HALF_OPEN
+    assert breaker.allow()
+
+
+def test_menu_answers_are_keyed_by_question(tmp_path):
+    # Q17 и Q20 одного пакета почти совпадают по тексту, но у них разные шаблоны
+    cache = SemanticAnswerCache(path=str(tmp_path / "answers.db"))
+    cache.put(answer_key("docs_pack_3", "hash", "Специалист", "Python", 17), "Что ожидается от меня",
+              [1.0, 0.0], ["Ответ на вопрос 17"])
+    assert cache.lookup(answer_key("docs_pack_3", "hash", "Специалист", "Python", 20), [1.0, 0.0], stale=True) is None
+    assert cache.lookup(answer_key("docs_pack_3", "hash", "Специалист", "Python", 17), [1.0, 0.0],
+                        stale=True) == ["Ответ на вопрос 17"]
+    assert answer_key("docs_pack_3", "hash", "Специалист", "Python") == ("docs_pack_3", "hash", "Специалист", "Python")
+
+
+def test_stale_answer_outlives_ttl(tmp_path):
+    cache = SemanticAnswerCache(path=str(tmp_path / "answers.db"), ttl=0.05, stale_ttl=60)
+    key = ("docs_pack_full", "hash", "Специалист", "Аналитик")
+    cache.put(key, "вопрос", [1.0, 0.0], ["Сохраненный ответ"])
+    assert cache.lookup(key, [1.0, 0.0]) == ["Сохраненный ответ"]
+    time.sleep(0.1)
+    assert cache.lookup(key, [1.0, 0.0]) is None
+    assert cache.lookup(key, [1.0, 0.0], stale=True) == ["Сохраненный ответ"]
+    assert cache.stats()["stale_hits"] == 1
+
+
+def test_extractive_answer_is_bounded():
+    docs = [Document(page_content="Первый   фрагмент\nбазы знаний"), Document(page_content="Второй " * 100)]
+    answer = extractive_answer(docs, max_chars=100)
+    assert "— Первый фрагмент базы знаний" in answer
+    assert len(answer.split("\n\n", 1)[1]) < 120
+    assert extractive_answer([]) == ""
@@ -0,0 +1,36 @@
+from stub_llm import StubChatModel
+from llm_pool import LLMPool
+from scheduler import GenerationScheduler
+
+
+def create_pools(size=4):
+    return {"GigaChat": LLMPool("GigaChat", size, lambda model: StubChatModel(ttft=0.0, token_delay=0.0))}
+
+
+def test_concurrency_is_per_service_and_split_between_workers(monkeypatch):
+    monkeypatch.setenv("LLM_CONCURRENCY_GIGACHAT", "6")
+    monkeypatch.setenv("LLM_BACKGROUND_SLOTS", "4")
+    scheduler = GenerationScheduler(create_pools(), workers=3).schedulers["GigaChat"]
+    assert scheduler.concurrency == 2
+    assert scheduler.background_slots == 1
+
+
+def test_single_worker_keeps_configured_limits():
+    scheduler = GenerationScheduler(create_pools(size=4), workers=1).schedulers["GigaChat"]
+    assert scheduler.concurrency == 4
+    assert scheduler.background_slots == 2
+
+
+def test_every_worker_gets_at_least_one_slot(monkeypatch):
+    monkeypatch.setenv("LLM_CONCURRENCY_GIGACHAT", "2")
+    scheduler = GenerationScheduler(create_pools(), workers=4).schedulers["GigaChat"]
+    assert scheduler.concurrency == 1
+    assert scheduler.background_slots == 1
+
+
+def test_background_never_takes_every_slot(monkeypatch):
+    monkeypatch.setenv("LLM_CONCURRENCY_GIGACHAT", "4")
+    monkeypatch.setenv("LLM_BACKGROUND_SLOTS", "4")
+    scheduler = GenerationScheduler(create_pools(), workers=2).schedulers["GigaChat"]
+    assert scheduler.concurrency == 2
+    assert scheduler.background_slots == 1
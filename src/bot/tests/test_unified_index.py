@@ -0,0 +1,52 @@
+import itertools
+
+import pytest
+from langchain_core.documents import Document
+from langchain_core.embeddings import DeterministicFakeEmbedding
+
+from faiss_indexes import BUILD_PARAMS, STORAGE_PARAMS, INDEX_DEFAULTS
+from index_store import build_vector_store
+from unified_index import UnifiedIndex, UNIFIED_INDEX_NAME
+
+PACKS = ("docs_pack_1", "docs_pack_2")
+SPECIALIZATIONS = ("Python", "Java", None)
+
+
+def make_docs(n_docs=300):
+    return [
+        Document(
+            page_content=f"Документ {i} про {PACKS[i % 2]} и {SPECIALIZATIONS[i % 3]}",
+            metadata={"source": f"{i}.txt", "packs": [PACKS[i % 2]],
+                      "specializations": [SPECIALIZATIONS[i % 3]]},
+        )
+        for i in range(n_docs)
+    ]
+
+
+def make_unified(index_type, storage):
+    embedding = DeterministicFakeEmbedding(size=32)
+    config = {**INDEX_DEFAULTS, "type": index_type, "storage": storage, "pq_m": 8, "nprobe": 4}
+    docs = make_docs()
+    vector_store = build_vector_store(docs, embedding.embed_documents([d.page_content for d in docs]),
+                                      embedding, config)
+    # Без загрузки корпуса: только то, что нужно as_retriever
+    index = UnifiedIndex.__new__(UnifiedIndex)
+    index.pack_name = UNIFIED_INDEX_NAME
+    index.index_config = config
+    index.embedding = embedding
+    index.k = 5
+    index.retrieval_cache = None
+    index.retriever_mode = "dense"
+    index.state = index.make_state(vector_store, None, 0)
+    return index
+
+
+@pytest.mark.parametrize("index_type,storage", list(itertools.product(BUILD_PARAMS, STORAGE_PARAMS)))
+def test_filtered_search_for_every_index_config(index_type, storage):
+    index = make_unified(index_type, storage)
+    retriever = index.as_retriever("docs_pack_2", "Python")
+    docs = retriever.invoke("Документ про docs_pack_2 и Python")
+    assert docs
+    for doc in docs:
+        assert doc.metadata["packs"] == ["docs_pack_2"]
+        assert doc.metadata["specializations"][0] in ("Python", None)
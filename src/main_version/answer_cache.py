@@ -0,0 +1,180 @@
+import os
+import json
+import time
+import sqlite3
+import threading
+import numpy as np
+
+from index_store import INDEX_CACHE_DIR
+
+# Кеш первых ответов хранится рядом с индексами и переживает перезапуск сервиса
+ANSWER_CACHE_PATH = os.getenv("ANSWER_CACHE_PATH", os.path.join(INDEX_CACHE_DIR, "answers.db"))
+
+
+def normalize(vector):
+    vector = np.asarray(vector, dtype=np.float32)
+    norm = np.linalg.norm(vector)
+    return vector / norm if norm > 0 else vector
+
+
+def answer_key(pack_name, corpus_hash, role, specialization, question_id=None):
+    """
+    Ключ кеша ответов. Для вопросов меню в ключ входит номер вопроса: у каждого свой шаблон промпта,
+    и близкие формулировки разных вопросов одного пакета не должны получать ответы друг друга.
+    """
+    key = (pack_name, corpus_hash, role, specialization)
+    return key if question_id is None else (*key, question_id)
+
+
+class SemanticAnswerCache:
+    """
+    Семантический кеш готовых ответов на первые вопросы.
+
+    Ключ — (пакет, хеш корпуса, роль, специализация[, номер вопроса меню]) и вектор вопроса: ответ выдается,
+    если косинусная близость нового вопроса к сохраненному не меньше threshold.
+    Хеш корпуса входит в ключ, поэтому после изменения документов старые ответы не выдаются.
+    Записи выдаются ttl секунд; устаревшие хранятся до stale_ttl секунд как запасные ответы,
+    когда модель недоступна. При превышении maxsize вытесняются давно не использованные.
+    Все записи лежат в SQLite и загружаются в память при старте.
+    """
+
+    def __init__(self, path=ANSWER_CACHE_PATH, threshold=0.92, ttl=86400, maxsize=2000, stale_ttl=604800):
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        self.path = path
+        self.threshold = threshold
+        self.ttl = ttl
+        self.stale_ttl = max(ttl, stale_ttl) if ttl > 0 else 0
+        self.maxsize = maxsize
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.stale_hits = 0
+        # id записи -> словарь с ключом, вектором, фрагментами ответа и временами
+        self.entries = {}
+        # Ключ -> (ids, матрица векторов); пересчитывается после изменения записей ключа
+        self.matrices = {}
+        self.conn = sqlite3.connect(path, check_same_thread=False)
+        self.conn.execute('''
+        CREATE TABLE IF NOT EXISTS Answers (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            cache_key TEXT NOT NULL,
+            question TEXT NOT NULL,
+            vector BLOB NOT NULL,
+            answer TEXT NOT NULL,
+            created_at REAL NOT NULL,
+            used_at REAL NOT NULL
+        )
+        ''')
+        self.conn.commit()
+        self.load()
+
+    def load(self):
+        now = time.time()
+        with self.lock:
+            if self.stale_ttl > 0:
+                self.conn.execute("DELETE FROM Answers WHERE created_at < ?", (now - self.stale_ttl,))
+                self.conn.commit()
+            rows = self.conn.execute(
+                "SELECT id, cache_key, question, vector, answer, created_at, used_at FROM Answers"
+            ).fetchall()
+            for entry_id, cache_key, question, blob, answer, created_at, used_at in rows:
+                self.entries[entry_id] = {
+                    "key": cache_key,
+                    "question": question,
+                    "vector": np.frombuffer(blob, dtype=np.float32),
+                    "answer": json.loads(answer),
+                    "created_at": created_at,
+                    "used_at": used_at,
+                }
+            self.evict()
+        print(f"Кеш ответов загружен: {len(self.entries)} записей")
+
+    def matrix(self, cache_key):
+        if cache_key not in self.matrices:
+            ids = [entry_id for entry_id, entry in self.entries.items() if entry["key"] == cache_key]
+            vectors = np.stack([self.entries[entry_id]["vector"] for entry_id in ids]) if ids else None
+            self.matrices[cache_key] = (ids, vectors)
+        return self.matrices[cache_key]
+
+    def remove(self, entry_ids):
+        for entry_id in entry_ids:
+            entry = self.entries.pop(entry_id)
+            self.matrices.pop(entry["key"], None)
+        self.conn.executemany("DELETE FROM Answers WHERE id = ?", [(entry_id,) for entry_id in entry_ids])
+
+    def evict(self):
+        """Удаляет записи сверх maxsize, начиная с давно не использованных."""
+        excess = len(self.entries) - self.maxsize
+        if excess > 0:
+            oldest = sorted(self.entries, key=lambda entry_id: self.entries[entry_id]["used_at"])[:excess]
+            self.remove(oldest)
+            self.conn.commit()
+
+    def lookup(self, key, vector, stale=False):
+        """
+        Возвращает фрагменты сохраненного ответа на близкий вопрос или None.
+        stale=True — поиск запасного ответа: подходят и устаревшие записи не старше stale_ttl.
+        """
+        cache_key = json.dumps(key, ensure_ascii=False)
+        vector = normalize(vector)
+        now = time.time()
+        max_age = self.stale_ttl if stale else self.ttl
+        with self.lock:
+            ids, vectors = self.matrix(cache_key)
+            if ids:
+                similarities = vectors @ vector
+                for position in np.argsort(-similarities):
+                    if similarities[position] < self.threshold:
+                        break
+                    entry = self.entries[ids[position]]
+                    if max_age > 0 and entry["created_at"] < now - max_age:
+                        continue
+                    if stale:
+                        self.stale_hits += 1
+                    else:
+                        self.hits += 1
+                    entry["used_at"] = now
+                    self.conn.execute("UPDATE Answers SET used_at = ? WHERE id = ?", (now, ids[position]))
+                    self.conn.commit()
+                    print(f"Ответ взят из кеша (близость {similarities[position]:.3f} к «{entry['question']}»)")
+                    return entry["answer"]
+            if not stale:
+                self.misses += 1
+            return None
+
+    def put(self, key, question, vector, answer):
+        """Сохраняет ответ (список отправленных фрагментов) на вопрос с вектором vector."""
+        if not answer or self.maxsize <= 0:
+            return
+        cache_key = json.dumps(key, ensure_ascii=False)
+        vector = normalize(vector)
+        now = time.time()
+        with self.lock:
+            cursor = self.conn.execute(
+                "INSERT INTO Answers (cache_key, question, vector, answer, created_at, used_at) "
+                "VALUES (?, ?, ?, ?, ?, ?)",
+                (cache_key, question, vector.tobytes(), json.dumps(answer, ensure_ascii=False), now, now),
+            )
+            self.entries[cursor.lastrowid] = {
+                "key": cache_key,
+                "question": question,
+                "vector": vector,
+                "answer": list(answer),
+                "created_at": now,
+                "used_at": now,
+            }
+            self.matrices.pop(cache_key, None)
+            self.evict()
+            self.conn.commit()
+
+    def stats(self):
+        with self.lock:
+            lookups = self.hits + self.misses
+            return {
+                "size": len(self.entries),
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": round(self.hits / lookups, 4) if lookups else 0.0,
+                "stale_hits": self.stale_hits,
+                "threshold": self.threshold,
+            }
@@ -0,0 +1,43 @@
+"""
+Офлайн-сборка индексов всех пакетов (например, в CI или на отдельной машине).
+
+Запуск:
+    python build_index.py [--layout per_pack|unified]
+
+Чанкинг и эмбеддинги выполняются один раз; снапшоты индексов с контрольными суммами
+и манифест (модель, chunk_size, overlap, хеши файлов, число чанков) записываются в INDEX_CACHE_DIR.
+Каталог INDEX_CACHE_DIR вместе с embeddings.db копируется на реплики, которые запускаются
+с INDEX_SOURCE=artifacts и только читают готовые индексы.
+"""
+import argparse
+import time
+
+from index_store import manifest_entry, write_manifest, manifest_path
+from index_factory import load_base_embedding, create_ingestion_pipeline, make_index_loaders
+from embedding_store import EmbeddingStore, CachedEmbeddings
+from rag_settings import CHUNK_SIZE, CHUNK_OVERLAP, INDEX_LAYOUT
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--layout", default=INDEX_LAYOUT, choices=["per_pack", "unified"])
+    args = parser.parse_args()
+
+    started = time.perf_counter()
+    base_embedding, embedding_key = load_base_embedding()
+    embedding = CachedEmbeddings(base_embedding, embedding_key, EmbeddingStore())
+    pipeline = create_ingestion_pipeline(embedding)
+
+    entries = {}
+    for name, load in make_index_loaders(embedding, embedding_key, pipeline.run, layout=args.layout).items():
+        index = load()
+        entries[name] = manifest_entry(name, index.meta)
+        print(f"{name}: {index.meta['chunks']} чанков, {len(index.meta['files'])} файлов")
+
+    manifest = write_manifest(entries, embedding_key, CHUNK_SIZE, CHUNK_OVERLAP, args.layout)
+    print(f"Сборка {manifest['build_id']} готова за {time.perf_counter() - started:.1f} с, "
+          f"манифест: {manifest_path()}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,177 @@
+import os
+import re
+import math
+from typing import Any
+import numpy as np
+from langchain_core.documents import Document
+from langchain_core.documents.compressor import BaseDocumentCompressor
+from langchain.retrievers import ContextualCompressionRetriever
+
+from rag_cache import TTLCache, normalize_query
+
+# Средняя длина токена GigaChat на русском тексте, в символах (для оценки без токенизатора)
+CHARS_PER_TOKEN = float(os.getenv("CONTEXT_CHARS_PER_TOKEN", "3.5"))
+# Бюджет контекста в токенах по умолчанию (0 — сжатие выключено)
+DEFAULT_TOKEN_BUDGET = int(os.getenv("CONTEXT_TOKEN_BUDGET", "0"))
+# Бюджеты для отдельных question_id: "1:400,5:800,0:900"
+TOKEN_BUDGETS = {
+    question_id.strip(): int(budget)
+    for question_id, budget in (
+        item.split(":") for item in os.getenv("CONTEXT_TOKEN_BUDGETS", "").split(",") if item.strip()
+    )
+}
+# Сколько векторов предложений держится в памяти процесса
+SENTENCE_CACHE_SIZE = int(os.getenv("CONTEXT_SENTENCE_CACHE_SIZE", "20000"))
+# Косинусное сходство, выше которого предложение считается повтором уже выбранного
+REDUNDANT_SIMILARITY = 0.95
+# Минимальная длина совпадения конца одного чанка с началом другого (перекрытие сплиттера)
+MIN_OVERLAP = 20
+
+SENTENCE_RE = re.compile(r"(?<=[.!?…])\s+|\n+")
+
+
+def count_tokens(text):
+    return math.ceil(len(text) / CHARS_PER_TOKEN)
+
+
+def token_budget(question_id):
+    return TOKEN_BUDGETS.get(str(question_id), DEFAULT_TOKEN_BUDGET)
+
+
+def overlap_join(first, second):
+    """Склеивает два текста, если конец first совпадает с началом second; иначе None."""
+    probe = second[:MIN_OVERLAP]
+    if len(probe) < MIN_OVERLAP:
+        return None
+    start = first.find(probe)
+    while start != -1:
+        if second.startswith(first[start:]):
+            return first[:start] + second
+        start = first.find(probe, start + 1)
+    return None
+
+
+def merge_adjacent_chunks(docs):
+    """
+    Склеивает соседние чанки одного файла, перекрывающиеся на chunk_overlap символов.
+    Порядок документов сохраняется по самому релевантному из склеенных чанков.
+    """
+    merged = []
+    for doc in docs:
+        text = doc.page_content
+        source = doc.metadata.get("source")
+        for i, kept in enumerate(merged):
+            if kept.metadata.get("source") != source:
+                continue
+            joined = overlap_join(kept.page_content, text) or overlap_join(text, kept.page_content)
+            if joined is not None:
+                merged[i] = Document(page_content=joined, metadata=kept.metadata)
+                break
+        else:
+            merged.append(doc)
+    return merged
+
+
+def split_sentences(text):
+    return [sentence.strip() for sentence in SENTENCE_RE.split(text) if sentence.strip()]
+
+
+class SentenceEmbeddings:
+    """
+    Векторы для сжатия контекста: вопрос — через переданные эмбеддинги (с кешем вопросов),
+    предложения — базовой моделью с ограниченным LRU-кешем в памяти. В хранилище чанков
+    (embeddings.db) предложения не пишутся: оно остается хранилищем векторов корпуса.
+    """
+
+    def __init__(self, query_embedding, base_embedding, maxsize=SENTENCE_CACHE_SIZE):
+        self.query_embedding = query_embedding
+        self.base_embedding = base_embedding
+        self.cache = TTLCache(maxsize=maxsize, ttl=0)
+
+    def embed_query(self, text):
+        return self.query_embedding.embed_query(text)
+
+    def embed_documents(self, texts):
+        vectors = {text: self.cache.get(text) for text in set(texts)}
+        missing = [text for text, vector in vectors.items() if vector is None]
+        if missing:
+            for text, vector in zip(missing, self.base_embedding.embed_documents(missing)):
+                vectors[text] = vector
+                self.cache.put(text, vector)
+        return [vectors[text] for text in texts]
+
+    def stats(self):
+        return self.cache.stats()
+
+
+class ContextCompressor(BaseDocumentCompressor):
+    """
+    Сборка контекста под бюджет токенов:
+    склейка перекрывающихся чанков -> разбиение на предложения -> отбор самых близких к вопросу
+    предложений без повторов, пока не исчерпан бюджет. Предложения остаются в исходном порядке.
+    """
+
+    embedding: Any
+    token_budget: int
+    label: str = ""
+
+    def compress_documents(self, documents, query, callbacks=None):
+        documents = list(documents)
+        tokens_before = sum(count_tokens(doc.page_content) for doc in documents)
+        docs = merge_adjacent_chunks(documents)
+
+        sentences = []  # (номер документа, номер предложения, текст)
+        for doc_position, doc in enumerate(docs):
+            for sentence_position, sentence in enumerate(split_sentences(doc.page_content)):
+                sentences.append((doc_position, sentence_position, sentence))
+        if not sentences:
+            return documents
+
+        # Векторы вопроса и предложений кешируются в памяти (см. SentenceEmbeddings)
+        query_vector = np.asarray(self.embedding.embed_query(query), dtype=np.float32)
+        vectors = np.asarray(
+            self.embedding.embed_documents([sentence for _, _, sentence in sentences]), dtype=np.float32
+        )
+        vectors /= np.clip(np.linalg.norm(vectors, axis=1, keepdims=True), 1e-9, None)
+        query_vector /= max(float(np.linalg.norm(query_vector)), 1e-9)
+        similarities = vectors @ query_vector
+
+        selected, selected_vectors, seen = [], [], set()
+        budget_left = self.token_budget
+        for position in np.argsort(-similarities).tolist():
+            doc_position, sentence_position, sentence = sentences[position]
+            tokens = count_tokens(sentence)
+            key = normalize_query(sentence)
+            if tokens > budget_left or key in seen:
+                continue
+            if selected_vectors and float(np.max(np.stack(selected_vectors) @ vectors[position])) >= REDUNDANT_SIMILARITY:
+                continue
+            seen.add(key)
+            selected.append((doc_position, sentence_position, sentence))
+            selected_vectors.append(vectors[position])
+            budget_left -= tokens
+
+        compressed = []
+        for doc_position, doc in enumerate(docs):
+            kept = [sentence for position, _, sentence in sorted(selected) if position == doc_position]
+            if kept:
+                compressed.append(Document(page_content=" ".join(kept), metadata=doc.metadata))
+
+        tokens_after = sum(count_tokens(doc.page_content) for doc in compressed)
+        print(f"Контекст {self.label}: {tokens_before} -> {tokens_after} токенов "
+              f"(сэкономлено {tokens_before - tokens_after}, чанков {len(documents)} -> {len(compressed)})")
+        return compressed
+
+
+def compress_context(retriever, embedding, question_id):
+    """
+    Оборачивает ретривер стадией сжатия контекста с бюджетом для question_id.
+    embedding — SentenceEmbeddings; при нулевом бюджете предложения не кодируются.
+    """
+    budget = token_budget(question_id)
+    if budget <= 0:
+        return retriever
+    return ContextualCompressionRetriever(
+        base_compressor=ContextCompressor(embedding=embedding, token_budget=budget, label=f"q{question_id}"),
+        base_retriever=retriever,
+    )
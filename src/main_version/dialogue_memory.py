@@ -0,0 +1,132 @@
+import os
+import re
+import json
+import math
+
+# Та же оценка длины токена, что и в context_compression (без токенизатора)
+CHARS_PER_TOKEN = float(os.getenv("CONTEXT_CHARS_PER_TOKEN", "3.5"))
+# Сколько последних сообщений диалога передается целиком
+DIALOGUE_RECENT_MESSAGES = int(os.getenv("DIALOGUE_RECENT_MESSAGES", "4"))
+# Бюджет всей памяти диалога (краткое содержание + последние сообщения) в токенах
+DIALOGUE_TOKEN_BUDGET = int(os.getenv("DIALOGUE_TOKEN_BUDGET", "800"))
+# Сколько символов сообщения остается в кратком содержании
+DIALOGUE_BRIEF_CHARS = int(os.getenv("DIALOGUE_BRIEF_CHARS", "200"))
+
+SENTENCE_END_RE = re.compile(r"[.!?…](?=\s)")
+
+
+def count_tokens(text):
+    return math.ceil(len(text) / CHARS_PER_TOKEN)
+
+
+def brief(text, limit):
+    """Начало текста не длиннее limit символов, по возможности до конца предложения."""
+    text = " ".join(text.split())
+    if len(text) <= limit:
+        return text
+    head = text[:limit]
+    ends = [match.end() for match in SENTENCE_END_RE.finditer(head + " ")]
+    if ends and ends[-1] >= limit // 2:
+        return head[:ends[-1]]
+    return head.rstrip() + "…"
+
+
+class DialogueMemory:
+    """
+    Память диалога для уточняющих вопросов: краткое содержание начала беседы
+    и последние recent_messages сообщений целиком, всё вместе — не больше token_budget токенов.
+
+    Сообщение, вытесненное из последних, сворачивается в строку краткого содержания
+    (начало вопроса или ответа); при нехватке бюджета из содержания удаляются самые старые строки,
+    кроме первой — она задает тему беседы, а самое длинное из двух последних сообщений обрезается.
+    Поэтому размер памяти не растет с длиной диалога.
+    """
+
+    def __init__(self, recent_messages=DIALOGUE_RECENT_MESSAGES, token_budget=DIALOGUE_TOKEN_BUDGET,
+                 brief_chars=DIALOGUE_BRIEF_CHARS):
+        self.recent_messages = recent_messages
+        self.token_budget = token_budget
+        self.brief_chars = brief_chars
+        self.summary = []
+        self.recent = []
+
+    def add(self, role, content):
+        self.recent.append({"role": role, "content": content})
+        self.compact()
+
+    def clear(self):
+        self.summary = []
+        self.recent = []
+
+    def fold(self, message):
+        label = "Вопрос" if message["role"] == "user" else "Ответ"
+        self.summary.append(f"{label}: {brief(message['content'], self.brief_chars)}")
+
+    def tokens(self):
+        return count_tokens(self.to_json())
+
+    def compact(self):
+        while len(self.recent) > self.recent_messages:
+            self.fold(self.recent.pop(0))
+        # Последний обмен (ответ и уточняющий вопрос к нему) не сворачивается
+        while self.tokens() > self.token_budget and len(self.recent) > 2:
+            self.fold(self.recent.pop(0))
+        while self.tokens() > self.token_budget and len(self.summary) > 1:
+            del self.summary[1]
+        excess = (self.tokens() - self.token_budget) * CHARS_PER_TOKEN
+        if excess > 0 and self.recent:
+            message = max(self.recent, key=lambda message: len(message["content"]))
+            limit = max(self.brief_chars, int(len(message["content"]) - excess))
+            message["content"] = brief(message["content"], limit)
+
+    def pop_question(self, question):
+        """
+        Убирает из последних сообщений текущий вопрос, если бот положил его в контекст последним.
+        При укладке в бюджет вопрос мог быть обрезан (brief), поэтому сравнивается начало текста.
+        """
+        if not self.recent or self.recent[-1]["role"] != "user":
+            return False
+        stored = " ".join(self.recent[-1]["content"].split()).removesuffix("…").rstrip()
+        if not stored or not " ".join(question.split()).startswith(stored):
+            return False
+        self.recent.pop()
+        return True
+
+    def to_json(self):
+        """Компактный JSON для передачи в rag_service."""
+        return json.dumps({"summary": self.summary, "recent": self.recent}, ensure_ascii=False, separators=(",", ":"))
+
+    @classmethod
+    def from_payload(cls, payload, **kwargs):
+        """
+        Восстанавливает память из строки контекста /ws и заново укладывает ее в бюджет.
+        Понимает и прежний формат — JSON-список всех сообщений диалога.
+        """
+        memory = cls(**kwargs)
+        try:
+            data = json.loads(payload)
+        except (TypeError, ValueError):
+            data = [{"role": "user", "content": str(payload)}]
+        if isinstance(data, dict):
+            memory.summary = [str(line) for line in data.get("summary", [])]
+            messages = data.get("recent", [])
+        elif isinstance(data, list):
+            messages = data
+        else:
+            messages = [{"role": "user", "content": str(data)}]
+        for message in messages:
+            if isinstance(message, dict) and "content" in message:
+                memory.recent.append({"role": message.get("role", "user"), "content": str(message["content"])})
+        memory.compact()
+        return memory
+
+    def render(self):
+        """Текст памяти для промпта."""
+        parts = []
+        if self.summary:
+            parts.append("Краткое содержание начала беседы:\n" + "\n".join(self.summary))
+        if self.recent:
+            parts.append("Последние сообщения:\n" + "\n".join(
+                f"{message['role']}: {message['content']}" for message in self.recent
+            ))
+        return "\n\n".join(parts)
@@ -0,0 +1,90 @@
+"""
+Сравнение бэкендов эмбеддингов: PyTorch (HuggingFaceEmbeddings) и int8 ONNX.
+
+Запуск:
+    python embedding_benchmark.py [--pack docs_pack_full] [--k 5]
+
+Печатает время кодирования корпуса и запросов, косинусное сходство векторов
+и совпадение top-k результатов поиска по предопределенным вопросам.
+"""
+import argparse
+import time
+import numpy as np
+from langchain_huggingface import HuggingFaceEmbeddings
+
+from index_store import list_source_files
+from ingestion import IngestionPipeline
+from onnx_embeddings import load_onnx_embeddings, cosine_parity
+from predefined_questions import PREDEFINED_QUESTIONS
+from rag_settings import PACK_FOLDERS, CHUNK_SIZE, CHUNK_OVERLAP, EMBEDDING_MODEL_NAME
+
+
+def timed(fn, *args):
+    started = time.perf_counter()
+    result = fn(*args)
+    return result, time.perf_counter() - started
+
+
+def query_latencies(backend, queries):
+    latencies = []
+    vectors = []
+    for query in queries:
+        vector, seconds = timed(backend.embed_query, query)
+        vectors.append(vector)
+        latencies.append(seconds * 1000)
+    return np.asarray(vectors, dtype=np.float32), np.asarray(latencies)
+
+
+def top_k(doc_vectors, query_vectors, k):
+    # L2-расстояние, как у IndexFlatL2, который строит FAISS.from_documents
+    distances = ((query_vectors[:, None, :] - doc_vectors[None, :, :]) ** 2).sum(axis=2)
+    return np.argsort(distances, axis=1)[:, :k]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--pack", default="docs_pack_full", choices=sorted(PACK_FOLDERS))
+    parser.add_argument("--k", type=int, default=5)
+    args = parser.parse_args()
+
+    pipeline = IngestionPipeline(None, CHUNK_SIZE, CHUNK_OVERLAP)
+    texts = [doc.page_content for doc in pipeline.load_and_split(list_source_files(PACK_FOLDERS[args.pack]))]
+    queries = list(PREDEFINED_QUESTIONS.values())
+
+    backends = {
+        "torch": HuggingFaceEmbeddings(
+            model_name=EMBEDDING_MODEL_NAME,
+            model_kwargs={'device': 'cpu'},
+            encode_kwargs={'normalize_embeddings': False}
+        ),
+        "onnx-int8": load_onnx_embeddings(EMBEDDING_MODEL_NAME),
+    }
+
+    results = {}
+    for name, backend in backends.items():
+        # Прогрев, чтобы не учитывать ленивую инициализацию
+        backend.embed_query("прогрев")
+        doc_vectors, doc_seconds = timed(backend.embed_documents, texts)
+        query_vectors, latencies = query_latencies(backend, queries)
+        results[name] = {
+            "docs": np.asarray(doc_vectors, dtype=np.float32),
+            "queries": query_vectors,
+        }
+        print(f"[{name}] корпус: {len(texts)} чанков за {doc_seconds:.2f} с "
+              f"({len(texts) / doc_seconds:.1f} чанков/с); "
+              f"запрос: p50 {np.percentile(latencies, 50):.1f} мс, p95 {np.percentile(latencies, 95):.1f} мс")
+
+    reference, candidate = results["torch"], results["onnx-int8"]
+    doc_parity = cosine_parity(reference["docs"], candidate["docs"])
+    query_parity = cosine_parity(reference["queries"], candidate["queries"])
+    print(f"Паритет векторов корпуса: min {doc_parity['min_cosine']:.4f}, mean {doc_parity['mean_cosine']:.4f}")
+    print(f"Паритет векторов запросов: min {query_parity['min_cosine']:.4f}, mean {query_parity['mean_cosine']:.4f}")
+
+    reference_top = top_k(reference["docs"], reference["queries"], args.k)
+    candidate_top = top_k(candidate["docs"], candidate["queries"], args.k)
+    overlaps = [len(set(a) & set(b)) / args.k for a, b in zip(reference_top, candidate_top)]
+    print(f"Совпадение top-{args.k} с PyTorch: среднее {np.mean(overlaps):.3f}, минимум {np.min(overlaps):.3f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,124 @@
+import os
+import sqlite3
+import hashlib
+import threading
+import numpy as np
+from langchain_core.embeddings import Embeddings
+
+from index_store import INDEX_CACHE_DIR
+from rag_cache import normalize_query
+
+# Общее хранилище эмбеддингов чанков для всех пакетов документов
+EMBEDDING_STORE_PATH = os.getenv(
+    "EMBEDDING_STORE_PATH",
+    os.path.join(INDEX_CACHE_DIR, "embeddings.db")
+)
+
+
+def chunk_key(model_name, text):
+    """Ключ эмбеддинга: хеш от имени модели и текста чанка."""
+    return hashlib.sha256(f"{model_name}\n{text}".encode("utf-8")).hexdigest()
+
+
+class EmbeddingStore:
+    """
+    Контентно-адресуемое хранилище эмбеддингов в SQLite.
+    Один и тот же чанк кодируется моделью ровно один раз, сколько бы пакетов его ни содержали.
+    """
+
+    def __init__(self, path=EMBEDDING_STORE_PATH):
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        self.path = path
+        self.lock = threading.Lock()
+        self.conn = sqlite3.connect(path, check_same_thread=False)
+        self.conn.execute('''
+        CREATE TABLE IF NOT EXISTS Embeddings (
+            key TEXT PRIMARY KEY,
+            model_name TEXT NOT NULL,
+            dim INTEGER NOT NULL,
+            vector BLOB NOT NULL
+        )
+        ''')
+        self.conn.commit()
+
+    def get_many(self, keys):
+        """Возвращает словарь key -> вектор для найденных ключей."""
+        found = {}
+        with self.lock:
+            # Ограничение SQLite на число параметров в запросе
+            for start in range(0, len(keys), 500):
+                batch = keys[start:start + 500]
+                placeholders = ",".join("?" * len(batch))
+                rows = self.conn.execute(
+                    f"SELECT key, vector FROM Embeddings WHERE key IN ({placeholders})", batch
+                ).fetchall()
+                for key, blob in rows:
+                    found[key] = np.frombuffer(blob, dtype=np.float32)
+        return found
+
+    def put_many(self, model_name, items):
+        """Сохраняет пары (key, вектор)."""
+        with self.lock:
+            self.conn.executemany(
+                "INSERT OR REPLACE INTO Embeddings (key, model_name, dim, vector) VALUES (?, ?, ?, ?)",
+                [
+                    (key, model_name, len(vector), np.asarray(vector, dtype=np.float32).tobytes())
+                    for key, vector in items
+                ]
+            )
+            self.conn.commit()
+
+    def count(self, model_name):
+        with self.lock:
+            return self.conn.execute(
+                "SELECT COUNT(*) FROM Embeddings WHERE model_name = ?", (model_name,)
+            ).fetchone()[0]
+
+
+class CachedEmbeddings(Embeddings):
+    """
+    Обертка над моделью эмбеддингов, которая берет векторы чанков из EmbeddingStore
+    и отправляет в модель только тексты, которых в хранилище еще нет.
+    Используется везде, где строятся индексы (FAISS.from_documents и т.п.).
+
+    Векторы вопросов кешируются в query_cache (TTLCache) по нормализованному тексту,
+    так что повторный вопрос не доходит до модели.
+    """
+
+    def __init__(self, embedding, model_name, store, query_cache=None):
+        self.embedding = embedding
+        self.model_name = model_name
+        self.store = store
+        self.query_cache = query_cache
+        self.encoded_total = 0
+
+    def embed_documents(self, texts):
+        keys = [chunk_key(self.model_name, text) for text in texts]
+        found = self.store.get_many(list(set(keys)))
+
+        # Кодируем только новые уникальные тексты
+        missing = {}
+        for key, text in zip(keys, texts):
+            if key not in found and key not in missing:
+                missing[key] = text
+        if missing:
+            vectors = self.embedding.embed_documents(list(missing.values()))
+            new_items = list(zip(missing.keys(), vectors))
+            self.store.put_many(self.model_name, new_items)
+            for key, vector in new_items:
+                found[key] = np.asarray(vector, dtype=np.float32)
+            self.encoded_total += len(missing)
+
+            cached = sum(1 for key in keys if key not in missing)
+            print(f"Эмбеддинги: {len(texts)} чанков, из хранилища {cached}, закодировано {len(missing)}")
+        return [found[key].tolist() for key in keys]
+
+    def embed_query(self, text):
+        if self.query_cache is None:
+            return self.embedding.embed_query(text)
+        key = normalize_query(text)
+        vector = self.query_cache.get(key)
+        if vector is None:
+            vector = self.embedding.embed_query(text)
+            self.query_cache.put(key, vector)
+        return list(vector)
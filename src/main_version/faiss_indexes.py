@@ -0,0 +1,191 @@
+import os
+import math
+import numpy as np
+import faiss
+
+# Параметры индекса по умолчанию.
+# type: flat (точный поиск), hnsw (граф), ivf (инвертированные списки)
+INDEX_DEFAULTS = {
+    "type": "flat",
+    # HNSW: число связей на узел, ширина поиска при построении и при запросе
+    "hnsw_m": 32,
+    "ef_construction": 80,
+    "ef_search": 64,
+    # IVF: число кластеров (0 — подобрать по размеру корпуса) и число просматриваемых кластеров
+    "nlist": 0,
+    "nprobe": 8,
+    # Хранение векторов: float32 (как есть), fp16 (вдвое меньше) или pq (продуктовое квантование)
+    "storage": "float32",
+    # PQ: число подвекторов и бит на код подвектора
+    "pq_m": 48,
+    "pq_nbits": 8,
+    # Для сжатых векторов: во сколько раз больше кандидатов брать для точного пересчета расстояний
+    "rescore_factor": 4,
+    # Порог сходства (MinHash), выше которого чанки считаются дубликатами и схлопываются; 0 — выключено.
+    # Дедупликация меняет набор чанков и отключает пофайловую переиндексацию, поэтому включается явно
+    "dedup_threshold": 0.0,
+}
+
+# Параметры, от которых зависит содержимое индекса (входят в хеш снапшота).
+# ef_search и nprobe применяются при загрузке и пересборки не требуют.
+BUILD_PARAMS = {
+    "flat": (),
+    "hnsw": ("hnsw_m", "ef_construction"),
+    "ivf": ("nlist",),
+}
+STORAGE_PARAMS = {
+    "float32": (),
+    "fp16": (),
+    "pq": ("pq_m", "pq_nbits"),
+}
+
+
+def index_config(pack_name):
+    """
+    Читает конфигурацию индекса пакета из переменных окружения.
+    Общие значения задаются как INDEX_TYPE, INDEX_EF_SEARCH, ...,
+    для конкретного пакета — с суффиксом имени пакета: INDEX_TYPE_DOCS_PACK_FULL=hnsw.
+    """
+    config = {}
+    for name, default in INDEX_DEFAULTS.items():
+        env_name = f"INDEX_{name.upper()}"
+        value = os.getenv(f"{env_name}_{pack_name.upper()}", os.getenv(env_name, default))
+        config[name] = type(default)(value)
+    if config["type"] not in BUILD_PARAMS:
+        raise ValueError(f"Неизвестный тип индекса {config['type']} для пакета {pack_name}")
+    if config["storage"] not in STORAGE_PARAMS:
+        raise ValueError(f"Неизвестный формат хранения {config['storage']} для пакета {pack_name}")
+    return config
+
+
+def build_signature(config):
+    """Часть конфигурации, влияющая на построенный индекс."""
+    return {
+        "type": config["type"],
+        "storage": config["storage"],
+        **{name: config[name] for name in BUILD_PARAMS[config["type"]]},
+        **{name: config[name] for name in STORAGE_PARAMS[config["storage"]]},
+        "dedup_threshold": config["dedup_threshold"],
+        # Снапшоты flat + pq, построенные как IndexPQ, пересобираются в IVF с одним списком
+        **({"nlist": 1} if is_ivf(config) and config["type"] == "flat" else {}),
+    }
+
+
+def is_compressed(config):
+    return config["storage"] != "float32"
+
+
+def is_ivf(config):
+    """
+    IVF-индекс в FAISS. Точный поиск по PQ-кодам (flat + pq) тоже строится как IVF, но с одним списком:
+    IndexPQ не принимает параметры запроса и IDSelector, а IVFPQ с nlist=1 просматривает все коды
+    и поддерживает фильтр единого индекса.
+    """
+    return config["type"] == "ivf" or (config["type"] == "flat" and config["storage"] == "pq")
+
+
+def supports_remove(config):
+    """HNSW не умеет удалять векторы, такой индекс при изменениях пересобирается целиком."""
+    return config["type"] != "hnsw"
+
+
+def auto_nlist(n_vectors):
+    # Около sqrt(N) кластеров, но не меньше 39 точек обучения на кластер (рекомендация FAISS)
+    return max(1, min(int(math.sqrt(n_vectors)), n_vectors // 39))
+
+
+def pq_nbits(config, n_vectors):
+    # Для обучения кодовой книги нужно хотя бы 2^nbits векторов, на маленьких пакетах биты урезаются
+    nbits = config["pq_nbits"]
+    while nbits > 1 and (1 << nbits) > n_vectors:
+        nbits -= 1
+    return nbits
+
+
+def create_index(vectors, config):
+    """
+    Создает пустой (но при необходимости обученный) индекс под векторы.
+    Векторы добавляются вызывающим кодом через FAISS.add_embeddings.
+    """
+    vectors = np.asarray(vectors, dtype=np.float32)
+    n_vectors, dim = vectors.shape
+    index_type = config["type"]
+    storage = config["storage"]
+    nbits = pq_nbits(config, n_vectors)
+
+    if index_type == "flat":
+        if storage == "fp16":
+            index = faiss.IndexScalarQuantizer(dim, faiss.ScalarQuantizer.QT_fp16, faiss.METRIC_L2)
+        elif storage == "pq":
+            # Один список и nprobe=1: полный перебор PQ-кодов с поддержкой IDSelector (см. is_ivf)
+            index = faiss.IndexIVFPQ(faiss.IndexFlatL2(dim), dim, 1, config["pq_m"], nbits)
+        else:
+            index = faiss.IndexFlatL2(dim)
+    elif index_type == "hnsw":
+        if storage == "fp16":
+            index = faiss.IndexHNSWSQ(dim, faiss.ScalarQuantizer.QT_fp16, config["hnsw_m"])
+        elif storage == "pq":
+            index = faiss.IndexHNSWPQ(dim, config["pq_m"], config["hnsw_m"], nbits)
+        else:
+            index = faiss.IndexHNSWFlat(dim, config["hnsw_m"])
+        index.hnsw.efConstruction = config["ef_construction"]
+    else:
+        nlist = config["nlist"] or auto_nlist(n_vectors)
+        quantizer = faiss.IndexFlatL2(dim)
+        if storage == "fp16":
+            index = faiss.IndexIVFScalarQuantizer(quantizer, dim, nlist, faiss.ScalarQuantizer.QT_fp16)
+        elif storage == "pq":
+            index = faiss.IndexIVFPQ(quantizer, dim, nlist, config["pq_m"], nbits)
+        else:
+            index = faiss.IndexIVFFlat(quantizer, dim, nlist)
+
+    if not index.is_trained:
+        index.train(vectors)
+
+    apply_search_params(index, config)
+    return index
+
+
+def rescore(query_vector, candidates, vectors, k):
+    """
+    Точный пересчет L2-расстояний для кандидатов, найденных по сжатым векторам.
+    candidates — список кандидатов, vectors — их полные float32-векторы в том же порядке.
+    Возвращает k лучших кандидатов с точными расстояниями.
+    """
+    if not candidates:
+        return []
+    query = np.asarray(query_vector, dtype=np.float32)
+    exact = np.asarray(vectors, dtype=np.float32)
+    distances = ((exact - query[None, :]) ** 2).sum(axis=1)
+    order = np.argsort(distances)[:k]
+    return [(candidates[i], float(distances[i])) for i in order]
+
+
+def nprobe(config):
+    return config["nprobe"] if config["type"] == "ivf" else 1
+
+
+def apply_search_params(index, config):
+    """Выставляет параметры поиска (efSearch для HNSW, nprobe для IVF)."""
+    if config["type"] == "hnsw":
+        faiss.ParameterSpace().set_index_parameter(index, "efSearch", config["ef_search"])
+    elif is_ivf(config):
+        faiss.ParameterSpace().set_index_parameter(index, "nprobe", nprobe(config))
+
+
+def search_parameters(config, selector=None):
+    """
+    Параметры одного запроса: efSearch/nprobe из конфигурации и фильтр по id (IDSelector).
+    Фильтр применяется внутри поиска FAISS, поэтому k результатов набирается только из разрешенных векторов.
+    """
+    if config["type"] == "hnsw":
+        params = faiss.SearchParametersHNSW()
+        params.efSearch = config["ef_search"]
+    elif is_ivf(config):
+        params = faiss.SearchParametersIVF()
+        params.nprobe = nprobe(config)
+    else:
+        params = faiss.SearchParameters()
+    if selector is not None:
+        params.sel = selector
+    return params
@@ -0,0 +1,196 @@
+"""
+Отчет recall / задержка / память для разных типов FAISS-индекса и форматов хранения векторов
+(float32, fp16, PQ) относительно точного flat-индекса.
+
+Запуск:
+    python index_benchmark.py [--pack docs_pack_full] [--k 5] [--queries 200]
+    python index_benchmark.py --worker-memory 4   # память воркеров, читающих один снапшот (Linux)
+
+Векторы чанков берутся из общего хранилища эмбеддингов (index_cache/embeddings.db),
+модель нужна только для чанков и вопросов, которых там еще нет.
+В качестве запросов используются предопределенные вопросы бота и случайная выборка чанков.
+"""
+import os
+import argparse
+import random
+import tempfile
+import time
+import multiprocessing
+import numpy as np
+import faiss
+from langchain_huggingface import HuggingFaceEmbeddings
+
+from index_store import list_source_files, read_faiss_index, mmap_enabled
+from ingestion import IngestionPipeline
+from embedding_store import EmbeddingStore, CachedEmbeddings
+from faiss_indexes import INDEX_DEFAULTS, create_index, rescore
+from predefined_questions import PREDEFINED_QUESTIONS
+from rag_settings import PACK_FOLDERS, CHUNK_SIZE, CHUNK_OVERLAP, EMBEDDING_MODEL_NAME
+
+# Конфигурации для сравнения: (название, переопределения параметров по умолчанию, точный пересчет)
+CONFIGS = [
+    ("flat", {"type": "flat"}, False),
+    *[(f"hnsw ef={ef}", {"type": "hnsw", "ef_search": ef}, False) for ef in (16, 32, 64, 128)],
+    *[(f"ivf nprobe={nprobe}", {"type": "ivf", "nprobe": nprobe}, False) for nprobe in (1, 2, 4, 8, 16)],
+    # Сжатое хранение векторов, с точным пересчетом top-кандидатов и без него
+    ("flat fp16", {"type": "flat", "storage": "fp16"}, False),
+    ("flat pq", {"type": "flat", "storage": "pq"}, False),
+    ("flat pq+rescore", {"type": "flat", "storage": "pq"}, True),
+    ("hnsw fp16", {"type": "hnsw", "storage": "fp16"}, False),
+    ("hnsw pq+rescore", {"type": "hnsw", "storage": "pq"}, True),
+    ("ivf pq+rescore", {"type": "ivf", "storage": "pq"}, True),
+]
+
+# Типы индекса для замера памяти воркеров
+MEMORY_CONFIGS = [("flat", {"type": "flat"}), ("hnsw", {"type": "hnsw"}), ("ivf", {"type": "ivf"})]
+
+
+def search_all(index, queries, k, vectors=None, rescore_factor=0):
+    """
+    Ищет запросы по одному, как в сервисе. Возвращает найденные id и задержки в мс.
+    Если передан rescore_factor, берется rescore_factor * k кандидатов и расстояния
+    пересчитываются по полным векторам (как в CachedRetriever).
+    """
+    ids = np.zeros((len(queries), k), dtype=np.int64)
+    latencies = []
+    for i, query in enumerate(queries):
+        started = time.perf_counter()
+        if rescore_factor > 1:
+            _, found = index.search(query[None, :], k * rescore_factor)
+            candidates = [int(j) for j in found[0] if j >= 0]
+            best = rescore(query, candidates, vectors[candidates], k)
+            row = [candidate for candidate, _ in best]
+        else:
+            _, found = index.search(query[None, :], k)
+            row = found[0]
+        latencies.append((time.perf_counter() - started) * 1000)
+        ids[i, :len(row)] = row
+    return ids, np.asarray(latencies)
+
+
+def recall_at_k(found, reference):
+    return float(np.mean([
+        len(set(row) & set(ref)) / len(ref) for row, ref in zip(found, reference)
+    ]))
+
+
+def load_vectors(embedding, pack_name, queries_sample):
+    pipeline = IngestionPipeline(embedding, CHUNK_SIZE, CHUNK_OVERLAP)
+    docs, vectors = pipeline.run(list_source_files(PACK_FOLDERS[pack_name]), pack_name)
+    vectors = np.asarray(vectors, dtype=np.float32)
+
+    random.seed(0)
+    sample = random.sample(range(len(vectors)), min(queries_sample, len(vectors)))
+    question_vectors = np.asarray(
+        [embedding.embed_query(q) for q in PREDEFINED_QUESTIONS.values()], dtype=np.float32
+    )
+    queries = np.vstack([question_vectors, vectors[sample]])
+    return vectors, queries
+
+
+def report(vectors, queries, configs, k):
+    """Строит каждый индекс и печатает строку отчета. Первая конфигурация — эталон."""
+    print(f"{'индекс':<18}{'recall@' + str(k):>10}{'p50, мс':>10}{'p95, мс':>10}"
+          f"{'сборка, с':>11}{'размер, КБ':>12}{'байт/вектор':>13}")
+    reference = None
+    for name, overrides, with_rescore in configs:
+        config = {**INDEX_DEFAULTS, **overrides}
+        started = time.perf_counter()
+        index = create_index(vectors, config)
+        index.add(vectors)
+        build_seconds = time.perf_counter() - started
+
+        rescore_factor = config["rescore_factor"] if with_rescore else 0
+        found, latencies = search_all(index, queries, k, vectors, rescore_factor)
+        if reference is None:
+            reference = found
+        size_bytes = faiss.serialize_index(index).nbytes
+        print(f"{name:<18}{recall_at_k(found, reference):>10.3f}"
+              f"{np.percentile(latencies, 50):>10.3f}{np.percentile(latencies, 95):>10.3f}"
+              f"{build_seconds:>11.3f}{size_bytes / 1024:>12.1f}{size_bytes / len(vectors):>13.0f}")
+
+
+def process_memory():
+    """
+    Память процесса в МБ: приватная (RssAnon), страницы файлов (RssFile)
+    и пропорциональная доля, в которой общие страницы делятся между процессами (Pss).
+    """
+    values = {}
+    for path in ("/proc/self/status", "/proc/self/smaps_rollup"):
+        with open(path) as f:
+            for line in f:
+                name, _, value = line.partition(":")
+                if name in ("RssAnon", "RssFile", "Pss"):
+                    values[name] = int(value.split()[0]) / 1024
+    return values
+
+
+def worker_memory(index_file, queries, k, barrier, results):
+    """Воркер читает снапшот, как сервис, и замеряет прирост памяти, пока индекс открыт у всех воркеров."""
+    before = process_memory()
+    index = read_faiss_index(index_file)
+    index.search(queries, k)
+    barrier.wait()
+    after = process_memory()
+    results.put((mmap_enabled(index), {name: after[name] - before[name] for name in after}))
+    barrier.wait()
+
+
+def memory_report(vectors, queries, k, workers):
+    """Сколько памяти добавляет индекс каждому из workers процессов, читающих один и тот же файл."""
+    print(f"{'индекс':<8}{'mmap':>6}{'RssAnon, МБ':>13}{'RssFile, МБ':>13}{'Pss, МБ':>10}{'файл, МБ':>10}")
+    context = multiprocessing.get_context("spawn")
+    with tempfile.TemporaryDirectory() as tmp:
+        for name, overrides in MEMORY_CONFIGS:
+            index = create_index(vectors, {**INDEX_DEFAULTS, **overrides})
+            index.add(vectors)
+            index_file = os.path.join(tmp, f"{name}.faiss")
+            faiss.write_index(index, index_file)
+
+            barrier = context.Barrier(workers)
+            results = context.Queue()
+            processes = [
+                context.Process(target=worker_memory, args=(index_file, queries, k, barrier, results))
+                for _ in range(workers)
+            ]
+            for process in processes:
+                process.start()
+            measured = [results.get() for _ in processes]
+            for process in processes:
+                process.join()
+            mapped = all(mapped for mapped, _ in measured)
+            average = {key: np.mean([memory[key] for _, memory in measured]) for key in measured[0][1]}
+            print(f"{name:<8}{'да' if mapped else 'нет':>6}{average['RssAnon']:>13.1f}{average['RssFile']:>13.1f}"
+                  f"{average['Pss']:>10.1f}{os.path.getsize(index_file) / 2 ** 20:>10.1f}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--pack", default=None, choices=sorted(PACK_FOLDERS),
+                        help="пакет для отчета (по умолчанию все)")
+    parser.add_argument("--k", type=int, default=5)
+    parser.add_argument("--queries", type=int, default=200, help="сколько чанков взять как запросы")
+    parser.add_argument("--worker-memory", type=int, default=0, metavar="N",
+                        help="вместо recall замерить память N воркеров, читающих один снапшот")
+    args = parser.parse_args()
+
+    embedding = CachedEmbeddings(
+        HuggingFaceEmbeddings(
+            model_name=EMBEDDING_MODEL_NAME,
+            model_kwargs={'device': 'cpu'},
+            encode_kwargs={'normalize_embeddings': False}
+        ),
+        EMBEDDING_MODEL_NAME,
+        EmbeddingStore(),
+    )
+    for pack_name in [args.pack] if args.pack else PACK_FOLDERS:
+        vectors, queries = load_vectors(embedding, pack_name, args.queries)
+        print(f"\n{pack_name}: {len(vectors)} векторов, {len(queries)} запросов")
+        if args.worker_memory:
+            memory_report(vectors, queries, args.k, args.worker_memory)
+        else:
+            report(vectors, queries, CONFIGS, args.k)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,79 @@
+import os
+from langchain_huggingface import HuggingFaceEmbeddings
+
+from pack_index import PackIndex
+from unified_index import UnifiedIndex, UNIFIED_INDEX_NAME
+from ingestion import IngestionPipeline
+from onnx_embeddings import load_onnx_embeddings
+from faiss_indexes import index_config
+from rag_settings import (
+    PACK_FOLDERS, CHUNK_SIZE, CHUNK_OVERLAP, EMBEDDING_MODEL_NAME, EMBEDDING_BACKEND, INDEX_LAYOUT,
+)
+
+
+def load_base_embedding():
+    """
+    Загружает модель эмбеддингов выбранного бэкенда.
+    Возвращает пару (модель, ключ модели для хранилища эмбеддингов и снапшотов).
+    """
+    model_name = EMBEDDING_MODEL_NAME
+    if EMBEDDING_BACKEND == "onnx":
+        base_embedding = load_onnx_embeddings(
+            model_name,
+            batch_size=int(os.getenv("EMBED_BATCH_SIZE", "64")),
+            num_threads=int(os.getenv("ONNX_NUM_THREADS", "0")),
+        )
+        # Векторы квантованной модели немного отличаются, поэтому кешируются отдельно
+        return base_embedding, f"{model_name}@onnx-int8"
+
+    model_kwargs = {'device': 'cpu'}
+    encode_kwargs = {'normalize_embeddings': False}
+    base_embedding = HuggingFaceEmbeddings(
+        model_name=model_name,
+        model_kwargs=model_kwargs,
+        encode_kwargs=encode_kwargs
+    )
+    return base_embedding, model_name
+
+
+def create_ingestion_pipeline(embedding):
+    # Конвейер загрузки: разбор частей документов (txt-блоки, страницы PDF) и чанкинг в пуле процессов, эмбеддинги пачками
+    return IngestionPipeline(
+        embedding,
+        CHUNK_SIZE,
+        CHUNK_OVERLAP,
+        workers=int(os.getenv("INGEST_WORKERS", "2")),
+        max_pending=int(os.getenv("INGEST_MAX_PENDING", "8")),
+        batch_size=int(os.getenv("EMBED_BATCH_SIZE", "64")),
+        pdf_pages_per_part=int(os.getenv("INGEST_PDF_PAGES_PER_PART", "8")),
+    )
+
+
+def make_index_loaders(embedding, embedding_key, ingest, manifest=None, layout=INDEX_LAYOUT,
+                       **retriever_options):
+    """
+    Функции загрузки индексов: имя индекса -> функция без аргументов.
+    С manifest индексы читаются из артефактов офлайн-сборки, иначе берутся из снапшотов
+    или собираются заново при изменении документов.
+    """
+    if layout == "unified":
+        # docs_pack_full включает остальные пакеты, одинаковые чанки схлопываются при сборке
+        return {
+            UNIFIED_INDEX_NAME: lambda: UnifiedIndex(
+                list(PACK_FOLDERS.values()), embedding, embedding_key,
+                CHUNK_SIZE, CHUNK_OVERLAP, ingest, index_config(UNIFIED_INDEX_NAME),
+                manifest=manifest, **retriever_options,
+            )
+        }
+
+    def load_pack_index(pack_name, folder_path):
+        return PackIndex(
+            pack_name, [folder_path], embedding, embedding_key,
+            CHUNK_SIZE, CHUNK_OVERLAP, ingest, index_config(pack_name),
+            manifest=manifest, **retriever_options,
+        )
+
+    return {
+        pack_name: (lambda pack_name=pack_name, folder_path=folder_path: load_pack_index(pack_name, folder_path))
+        for pack_name, folder_path in PACK_FOLDERS.items()
+    }
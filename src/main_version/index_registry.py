@@ -0,0 +1,117 @@
+import time
+import asyncio
+import threading
+
+LOADING = "loading"
+READY = "ready"
+FAILED = "failed"
+
+
+class IndexRegistry:
+    """
+    Индексы пакетов, которые загружаются в фоне после старта сервиса.
+
+    Пакеты загружаются по очереди; каждый становится доступен сразу после загрузки,
+    не дожидаясь остальных. Словарь indexes содержит только готовые индексы.
+    """
+
+    def __init__(self, loaders):
+        # Имя индекса -> функция без аргументов, возвращающая загруженный индекс
+        self.loaders = dict(loaders)
+        self.indexes = {}
+        self.status = {name: LOADING for name in self.loaders}
+        self.errors = {}
+        self.load_seconds = {}
+        self.events = {name: threading.Event() for name in self.loaders}
+        # Те же события для корутин сервиса: создаются в start() в цикле событий,
+        # поток загрузки выставляет их через call_soon_threadsafe
+        self.loop = None
+        self.async_events = {}
+        self.done = threading.Event()
+
+    def load_all(self, on_ready=None):
+        for name, loader in self.loaders.items():
+            started = time.perf_counter()
+            try:
+                self.indexes[name] = loader()
+                self.status[name] = READY
+                self.load_seconds[name] = round(time.perf_counter() - started, 2)
+                print(f"Индекс {name} готов за {self.load_seconds[name]} с")
+            except Exception as e:
+                self.status[name] = FAILED
+                self.errors[name] = str(e)
+                print(f"Ошибка загрузки индекса {name}: {e}")
+            finally:
+                self.events[name].set()
+                self.notify(name)
+            # Прогрев кешей не влияет на готовность: загруженный индекс обслуживает запросы и без него
+            if on_ready is not None and self.status[name] == READY:
+                try:
+                    on_ready(name)
+                except Exception as e:
+                    print(f"Ошибка прогрева кешей индекса {name}: {e}")
+        self.done.set()
+
+    def notify(self, name):
+        if self.loop is None or name not in self.async_events:
+            return
+        try:
+            self.loop.call_soon_threadsafe(self.async_events[name].set)
+        except RuntimeError:
+            # Цикл событий уже закрыт (остановка сервиса)
+            pass
+
+    def start(self, on_ready=None, on_done=None):
+        """
+        Запускает загрузку в фоновом потоке и сразу возвращает управление.
+        Вызванный из цикла событий, позволяет ждать индексы через wait_ready без потоков пула.
+        """
+        try:
+            self.loop = asyncio.get_running_loop()
+            self.async_events = {name: asyncio.Event() for name in self.loaders}
+        except RuntimeError:
+            self.loop = None
+
+        def run():
+            self.load_all(on_ready)
+            if on_done is not None:
+                on_done()
+
+        thread = threading.Thread(target=run, name="index_loader", daemon=True)
+        thread.start()
+        return thread
+
+    def is_ready(self, name):
+        return self.status.get(name) == READY
+
+    def all_ready(self):
+        return all(status == READY for status in self.status.values())
+
+    def wait(self, name, timeout):
+        """Ждет загрузки индекса не дольше timeout секунд. Возвращает True, если индекс готов."""
+        event = self.events.get(name)
+        if event is None:
+            return False
+        event.wait(timeout)
+        return self.is_ready(name)
+
+    async def wait_ready(self, name, timeout):
+        """Как wait, но для корутин: ожидание не занимает поток пула asyncio.to_thread."""
+        event = self.async_events.get(name)
+        if event is None:
+            return self.is_ready(name)
+        try:
+            await asyncio.wait_for(event.wait(), timeout)
+        except asyncio.TimeoutError:
+            pass
+        return self.is_ready(name)
+
+    def report(self):
+        return {
+            name: {
+                "status": status,
+                **({"seconds": self.load_seconds[name]} if name in self.load_seconds else {}),
+                **({"error": self.errors[name]} if name in self.errors else {}),
+            }
+            for name, status in self.status.items()
+        }
@@ -0,0 +1,346 @@
+import os
+import json
+import pickle
+import shutil
+import hashlib
+import time
+import faiss
+from langchain_community.vectorstores import FAISS
+from langchain_community.docstore.in_memory import InMemoryDocstore
+
+from faiss_indexes import create_index, apply_search_params, build_signature
+from lexical_index import BM25Index
+
+# Каталог для снапшотов индексов (можно переопределить через .env)
+INDEX_CACHE_DIR = os.getenv(
+    "INDEX_CACHE_DIR",
+    os.path.join(os.path.dirname(__file__), "index_cache")
+)
+
+# Версия формата снапшота: при изменении формата старые снапшоты игнорируются
+SNAPSHOT_VERSION = 3
+
+INDEX_FILE = "index.faiss"
+DOCSTORE_FILE = "docstore.pkl"
+META_FILE = "meta.json"
+LEXICAL_FILE = "bm25.pkl"
+# Файлы снапшота, для которых в метаданных хранится sha256
+ARTIFACT_FILES = (INDEX_FILE, DOCSTORE_FILE, LEXICAL_FILE)
+# Манифест офлайн-сборки (build_index.py): какие снапшоты обслуживать
+MANIFEST_FILE = "manifest.json"
+
+
+# Форматы исходных документов, которые умеет читать конвейер загрузки
+SOURCE_EXTENSIONS = (".txt", ".pdf")
+
+
+def list_source_files(folder_path):
+    """Возвращает отсортированный список исходных файлов пакета."""
+    return sorted(
+        os.path.join(folder_path, f) for f in os.listdir(folder_path)
+        if f.lower().endswith(SOURCE_EXTENSIONS)
+    )
+
+
+def file_sha256(file_path):
+    """Считает sha256 содержимого файла."""
+    h = hashlib.sha256()
+    with open(file_path, "rb") as f:
+        for block in iter(lambda: f.read(1 << 20), b""):
+            h.update(block)
+    return h.hexdigest()
+
+
+def source_key(file_path):
+    """Ключ исходного файла в снапшоте: '<каталог пакета>/<имя файла>'."""
+    return f"{os.path.basename(os.path.dirname(file_path))}/{os.path.basename(file_path)}"
+
+
+def list_sources(folder_paths):
+    """Возвращает словарь ключ файла -> путь для всех исходных файлов в каталогах."""
+    return {
+        source_key(file_path): file_path
+        for folder_path in folder_paths
+        for file_path in list_source_files(folder_path)
+    }
+
+
+def scan_sources(sources):
+    """Возвращает словарь ключ файла -> sha256 содержимого."""
+    return {key: file_sha256(file_path) for key, file_path in sources.items()}
+
+
+def compute_corpus_hash(file_hashes, model_name, chunk_size, chunk_overlap, index_config):
+    """
+    Считает хеш пакета документов: содержимое файлов + модель эмбеддингов + параметры чанкинга
+    + тип и параметры построения индекса.
+    Любое изменение одного из них приводит к пересборке индекса.
+    """
+    h = hashlib.sha256()
+    params = {
+        "version": SNAPSHOT_VERSION,
+        "model_name": model_name,
+        "chunk_size": chunk_size,
+        "chunk_overlap": chunk_overlap,
+        "index": build_signature(index_config),
+    }
+    h.update(json.dumps(params, sort_keys=True).encode("utf-8"))
+    for name in sorted(file_hashes):
+        h.update(name.encode("utf-8"))
+        h.update(file_hashes[name].encode("ascii"))
+    return h.hexdigest()
+
+
+def snapshot_path(pack_name, corpus_hash):
+    return os.path.join(INDEX_CACHE_DIR, pack_name, corpus_hash[:16])
+
+
+def save_snapshot(vector_store, path, meta, lexical_index):
+    """
+    Сохраняет векторы, docstore, инвертированный индекс BM25 и метаданные в каталог снапшота.
+    Запись идет во временный каталог, который затем атомарно переименовывается,
+    чтобы прерванная сборка не оставила битый снапшот.
+    """
+    tmp_path = path + ".tmp"
+    shutil.rmtree(tmp_path, ignore_errors=True)
+    os.makedirs(tmp_path)
+
+    faiss.write_index(vector_store.index, os.path.join(tmp_path, INDEX_FILE))
+    with open(os.path.join(tmp_path, DOCSTORE_FILE), "wb") as f:
+        pickle.dump((vector_store.docstore, vector_store.index_to_docstore_id), f)
+    with open(os.path.join(tmp_path, LEXICAL_FILE), "wb") as f:
+        pickle.dump(lexical_index, f)
+    # Контрольные суммы позволяют убедиться, что скопированный на реплику снапшот не поврежден
+    meta["artifacts"] = {name: file_sha256(os.path.join(tmp_path, name)) for name in ARTIFACT_FILES}
+    with open(os.path.join(tmp_path, META_FILE), "w", encoding="utf-8") as f:
+        json.dump(meta, f, ensure_ascii=False, indent=4)
+
+    shutil.rmtree(path, ignore_errors=True)
+    os.replace(tmp_path, path)
+
+
+def mmap_enabled(index):
+    """
+    Отображены ли данные индекса в память. В faiss-cpu 1.10 IO_FLAG_MMAP действует только
+    на инвертированные списки IVF (они читаются как OnDiskInvertedLists поверх файла индекса).
+    """
+    try:
+        ivf = faiss.extract_index_ivf(index)
+    except RuntimeError:
+        return False
+    return isinstance(faiss.downcast_InvertedLists(ivf.invlists), faiss.OnDiskInvertedLists)
+
+
+def read_faiss_index(index_file):
+    """
+    Читает FAISS-индекс с отображением в память, если формат индекса это позволяет.
+    У IVF отображаются инвертированные списки: их страницы лежат в page cache и общие для воркеров.
+    Векторы flat и HNSW читаются в кучу, и у каждого процесса своя копия — об этом печатается предупреждение.
+    """
+    try:
+        index = faiss.read_index(index_file, faiss.IO_FLAG_MMAP | faiss.IO_FLAG_READ_ONLY)
+    except RuntimeError as e:
+        print(f"Индекс {index_file} не читается с отображением в память ({e}), читаем целиком")
+        index = faiss.read_index(index_file)
+    if mmap_enabled(index):
+        print(f"Индекс {index_file}: инвертированные списки отображены в память (mmap)")
+    else:
+        print(f"Внимание: индекс {index_file} ({type(faiss.downcast_index(index)).__name__}) прочитан "
+              f"в память процесса без mmap, у каждого воркера своя копия векторов; "
+              f"общие страницы между воркерами дает только INDEX_TYPE=ivf")
+    return index
+
+
+def load_snapshot(path, embedding, index_config):
+    """
+    Загружает снапшот в FAISS-хранилище LangChain.
+    Возвращает тройку (хранилище, метаданные, индекс BM25) или None, если снапшот неполный.
+    """
+    index_file = os.path.join(path, INDEX_FILE)
+    docstore_file = os.path.join(path, DOCSTORE_FILE)
+    meta_file = os.path.join(path, META_FILE)
+    lexical_file = os.path.join(path, LEXICAL_FILE)
+    if not all(os.path.exists(f) for f in (index_file, docstore_file, meta_file, lexical_file)):
+        return None
+
+    index = read_faiss_index(index_file)
+    apply_search_params(index, index_config)
+    with open(docstore_file, "rb") as f:
+        docstore, index_to_docstore_id = pickle.load(f)
+    with open(meta_file, encoding="utf-8") as f:
+        meta = json.load(f)
+    with open(lexical_file, "rb") as f:
+        lexical_index = pickle.load(f)
+
+    vector_store = FAISS(
+        embedding_function=embedding,
+        index=index,
+        docstore=docstore,
+        index_to_docstore_id=index_to_docstore_id,
+    )
+    return vector_store, meta, lexical_index
+
+
+def build_lexical_index(vector_store, pack_name):
+    started = time.perf_counter()
+    lexical_index = BM25Index.from_vector_store(vector_store)
+    print(f"BM25-индекс {pack_name}: {len(lexical_index.postings)} терминов "
+          f"за {time.perf_counter() - started:.3f} с")
+    return lexical_index
+
+
+def make_meta(pack_name, corpus_hash, file_hashes, model_name, chunk_size, chunk_overlap,
+              index_config, chunks):
+    return {
+        "version": SNAPSHOT_VERSION,
+        "pack": pack_name,
+        "corpus_hash": corpus_hash,
+        "model_name": model_name,
+        "chunk_size": chunk_size,
+        "chunk_overlap": chunk_overlap,
+        "index": build_signature(index_config),
+        "chunks": chunks,
+        "files": file_hashes,
+    }
+
+
+def build_vector_store(docs, vectors, embedding, index_config):
+    """Собирает FAISS-хранилище LangChain из готовых чанков и векторов с индексом нужного типа."""
+    vector_store = FAISS(
+        embedding_function=embedding,
+        index=create_index(vectors, index_config),
+        docstore=InMemoryDocstore(),
+        index_to_docstore_id={},
+    )
+    vector_store.add_embeddings(
+        zip([doc.page_content for doc in docs], vectors),
+        metadatas=[doc.metadata for doc in docs],
+    )
+    return vector_store
+
+
+def remove_stale_snapshots(pack_name, keep_path):
+    """Удаляет снапшоты пакета, не совпадающие с актуальным."""
+    pack_dir = os.path.join(INDEX_CACHE_DIR, pack_name)
+    if not os.path.isdir(pack_dir):
+        return
+    for name in os.listdir(pack_dir):
+        path = os.path.join(pack_dir, name)
+        if path != keep_path:
+            shutil.rmtree(path, ignore_errors=True)
+
+
+def load_or_build_vector_store(pack_name, folder_paths, embedding, model_name,
+                               chunk_size, chunk_overlap, ingest, index_config):
+    """
+    Загружает FAISS-хранилище из снапшота или собирает его заново.
+    Индекс строится по всем .txt файлам из каталогов folder_paths.
+
+    ingest(file_paths, label) — функция, возвращающая пару (чанки, векторы) для файлов пакета;
+    вызывается только если актуального снапшота нет.
+    Возвращает тройку (хранилище, метаданные снапшота, индекс BM25).
+    """
+    sources = list_sources(folder_paths)
+    file_hashes = scan_sources(sources)
+    corpus_hash = compute_corpus_hash(file_hashes, model_name, chunk_size, chunk_overlap, index_config)
+    path = snapshot_path(pack_name, corpus_hash)
+
+    loaded = load_snapshot(path, embedding, index_config)
+    if loaded is not None:
+        print(f"Индекс {pack_name} загружен из снапшота {path}")
+        return loaded
+
+    print(f"Снапшот для {pack_name} не найден, собираем индекс заново")
+    split_docs, vectors = ingest(
+        [sources[key] for key in sorted(file_hashes)], pack_name
+    )
+    vector_store = build_vector_store(split_docs, vectors, embedding, index_config)
+    lexical_index = build_lexical_index(vector_store, pack_name)
+
+    meta = make_meta(pack_name, corpus_hash, file_hashes, model_name,
+                     chunk_size, chunk_overlap, index_config, len(split_docs))
+    save_snapshot(vector_store, path, meta, lexical_index)
+    remove_stale_snapshots(pack_name, path)
+    print(f"Индекс {pack_name} сохранен в {path}")
+    return vector_store, meta, lexical_index
+
+
+def manifest_path():
+    return os.path.join(INDEX_CACHE_DIR, MANIFEST_FILE)
+
+
+def manifest_entry(pack_name, meta):
+    """Запись манифеста для собранного снапшота; путь хранится относительно INDEX_CACHE_DIR."""
+    path = snapshot_path(pack_name, meta["corpus_hash"])
+    # У снапшотов старого формата контрольных сумм в метаданных нет
+    artifacts = meta.get("artifacts") or {
+        name: file_sha256(os.path.join(path, name)) for name in ARTIFACT_FILES
+    }
+    return {
+        "path": os.path.relpath(path, INDEX_CACHE_DIR),
+        **{key: meta[key] for key in ("corpus_hash", "index", "chunks", "files")},
+        "artifacts": artifacts,
+    }
+
+
+def write_manifest(entries, model_name, chunk_size, chunk_overlap, layout):
+    """Атомарно записывает манифест офлайн-сборки. Версия сборки — хеш всех снапшотов."""
+    build_hash = hashlib.sha256(
+        "".join(entries[name]["corpus_hash"] for name in sorted(entries)).encode("ascii")
+    ).hexdigest()
+    manifest = {
+        "version": SNAPSHOT_VERSION,
+        "build_id": build_hash[:16],
+        "built_at": time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+        "model_name": model_name,
+        "chunk_size": chunk_size,
+        "chunk_overlap": chunk_overlap,
+        "layout": layout,
+        "indexes": entries,
+    }
+    path = manifest_path()
+    with open(path + ".tmp", "w", encoding="utf-8") as f:
+        json.dump(manifest, f, ensure_ascii=False, indent=4)
+    os.replace(path + ".tmp", path)
+    return manifest
+
+
+def read_manifest(model_name, chunk_size, chunk_overlap, layout):
+    """
+    Читает манифест и проверяет, что он собран той же моделью, с теми же параметрами чанкинга
+    и в той же раскладке индексов (per_pack или unified), что ожидает сервис.
+    """
+    path = manifest_path()
+    if not os.path.exists(path):
+        raise RuntimeError(f"Манифест {path} не найден, соберите индексы: python build_index.py")
+    with open(path, encoding="utf-8") as f:
+        manifest = json.load(f)
+    expected = {"version": SNAPSHOT_VERSION, "model_name": model_name,
+                "chunk_size": chunk_size, "chunk_overlap": chunk_overlap, "layout": layout}
+    for key, value in expected.items():
+        if manifest.get(key) != value:
+            raise RuntimeError(f"Манифест собран с {key}={manifest.get(key)!r}, сервис ожидает {value!r}; "
+                               f"пересоберите индексы: python build_index.py")
+    return manifest
+
+
+def load_artifact(pack_name, manifest, embedding, index_config):
+    """
+    Загружает снапшот, указанный в манифесте, без пересборки и без обращения к исходным файлам.
+    Проверяет параметры индекса и контрольные суммы файлов.
+    """
+    entry = manifest["indexes"].get(pack_name)
+    if entry is None:
+        raise RuntimeError(f"Индекса {pack_name} нет в манифесте сборки {manifest['build_id']}")
+    if entry["index"] != build_signature(index_config):
+        raise RuntimeError(f"Индекс {pack_name} собран с параметрами {entry['index']}, "
+                           f"сервис ожидает {build_signature(index_config)}")
+    path = os.path.join(INDEX_CACHE_DIR, entry["path"])
+    for name, checksum in entry["artifacts"].items():
+        if file_sha256(os.path.join(path, name)) != checksum:
+            raise RuntimeError(f"Контрольная сумма {name} индекса {pack_name} не совпадает с манифестом")
+    loaded = load_snapshot(path, embedding, index_config)
+    if loaded is None:
+        raise RuntimeError(f"Снапшот {path} индекса {pack_name} неполный")
+    print(f"Индекс {pack_name} загружен из сборки {manifest['build_id']} ({path})")
+    return loaded
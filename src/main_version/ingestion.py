@@ -0,0 +1,250 @@
+import os
+import re
+import time
+import multiprocessing
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor
+from langchain.text_splitter import RecursiveCharacterTextSplitter
+from langchain_core.documents import Document
+
+from near_duplicates import NearDuplicateFilter, merge_chunk_metadata
+
+
+# Суффикс в имени файла (С1_java.txt) -> специализация пользователя в боте
+SPECIALIZATION_SUFFIXES = {
+    "bsa": "Аналитик",
+    "java": "Java",
+    "py": "Python",
+    "python": "Python",
+    "test": "Тестировщик",
+    "web": "WEB",
+}
+# Цифра в имени файла -> уровень (роль), для которого написан документ
+LEVELS = {"1": "Специалист", "2": "Лид компетенций", "3": "PO/PM"}
+# Документ без суффикса специализации подходит всем
+ANY_SPECIALIZATION = "*"
+
+
+def document_tags(file_path):
+    """Метаданные чанка из пути к файлу: пакет, уровень и специализация."""
+    name = os.path.splitext(os.path.basename(file_path))[0]
+    level = re.search(r"\d", name)
+    suffix = name.rsplit("_", 1)[-1].lower() if "_" in name else ""
+    return {
+        "pack": os.path.basename(os.path.dirname(file_path)),
+        "level": LEVELS.get(level.group(), "") if level else "",
+        "specialization": SPECIALIZATION_SUFFIXES.get(suffix, ANY_SPECIALIZATION),
+    }
+
+
+def pdf_page_count(file_path):
+    from pypdf import PdfReader
+    return len(PdfReader(file_path).pages)
+
+
+def read_pdf_pages(file_path, start, stop):
+    """Разбирает страницы [start, stop) PDF-файла. Метаданные как у PyPDFLoader: source и page."""
+    from pypdf import PdfReader
+    reader = PdfReader(file_path)
+    tags = document_tags(file_path)
+    return [
+        (reader.pages[page].extract_text() or "", {"source": file_path, "page": page, **tags})
+        for page in range(start, stop)
+    ]
+
+
+def iter_text_blocks(file_path, block_chars):
+    """Читает текстовый файл блоками примерно по block_chars символов, разрезая по пустым строкам."""
+    block, size = [], 0
+    with open(file_path, encoding="utf-8") as f:
+        for line in f:
+            block.append(line)
+            size += len(line)
+            if size >= block_chars and not line.strip():
+                yield "".join(block)
+                block, size = [], 0
+    if block:
+        yield "".join(block)
+
+
+def iter_parts(file_paths, pdf_pages_per_part, text_block_chars):
+    """
+    Разбивает файлы на независимые части: блоки текстовых файлов и диапазоны страниц PDF.
+    Части создаются лениво, поэтому целиком в памяти не держится ни один документ.
+    """
+    for file_path in file_paths:
+        if file_path.lower().endswith(".pdf"):
+            n_pages = pdf_page_count(file_path)
+            for start in range(0, n_pages, pdf_pages_per_part):
+                yield "pdf", file_path, (start, min(n_pages, start + pdf_pages_per_part))
+        else:
+            for block in iter_text_blocks(file_path, text_block_chars):
+                yield "text", file_path, block
+
+
+def split_texts(items, chunk_size, chunk_overlap):
+    """Чанкинг списка пар (текст, метаданные). Возвращает такие же пары для чанков."""
+    started = time.perf_counter()
+    text_splitter = RecursiveCharacterTextSplitter(
+        chunk_size=chunk_size,  # Размер чанка
+        chunk_overlap=chunk_overlap  # Перекрытие между чанками
+    )
+    chunks = []
+    for text, metadata in items:
+        for doc in text_splitter.create_documents([text], [metadata]):
+            chunks.append((doc.page_content, doc.metadata))
+    return chunks, time.perf_counter() - started
+
+
+def process_part(part, chunk_size, chunk_overlap):
+    """
+    Стадии 1-2 для одной части документа: чтение (разбор страниц PDF) и чанкинг.
+    Выполняется в пуле процессов, поэтому принимает и возвращает только простые типы.
+    """
+    started = time.perf_counter()
+    kind, file_path, payload = part
+    if kind == "pdf":
+        items = read_pdf_pages(file_path, *payload)
+    else:
+        items = [(payload, {"source": file_path, **document_tags(file_path)})]
+    read_seconds = time.perf_counter() - started
+    chunks, chunk_seconds = split_texts(items, chunk_size, chunk_overlap)
+    return chunks, len(items), read_seconds, chunk_seconds
+
+
+class StageStats:
+    """Счетчики одной стадии конвейера: сколько элементов обработано и сколько времени заняла работа."""
+
+    def __init__(self, name, unit):
+        self.name = name
+        self.unit = unit
+        self.items = 0
+        self.busy_seconds = 0.0
+
+    def add(self, items, seconds):
+        self.items += items
+        self.busy_seconds += seconds
+
+    def throughput(self):
+        return self.items / self.busy_seconds if self.busy_seconds > 0 else 0.0
+
+    def __str__(self):
+        return f"{self.name}: {self.items} {self.unit} за {self.busy_seconds:.2f} с ({self.throughput():.1f} {self.unit}/с)"
+
+
+class IngestionPipeline:
+    """
+    Потоковый конвейер загрузки документов (.txt и .pdf):
+    файлы режутся на части (блоки текста, диапазоны страниц PDF) -> разбор и чанкинг частей
+    в пуле процессов -> эмбеддинги пачками фиксированного размера.
+
+    Пока модель кодирует очередную пачку, следующие части уже разбираются и режутся на чанки.
+    В работе одновременно не больше max_pending частей, поэтому память под исходный текст
+    не зависит от размера документа.
+    """
+
+    def __init__(self, embedding, chunk_size, chunk_overlap, workers=2, max_pending=8, batch_size=64,
+                 pdf_pages_per_part=8, text_block_chars=200_000):
+        self.embedding = embedding
+        self.chunk_size = chunk_size
+        self.chunk_overlap = chunk_overlap
+        self.workers = workers
+        self.max_pending = max(1, max_pending)
+        self.batch_size = max(1, batch_size)
+        self.pdf_pages_per_part = max(1, pdf_pages_per_part)
+        self.text_block_chars = max(1, text_block_chars)
+
+    def chunk_pool(self):
+        if self.workers <= 0:
+            # Чанкинг в текущем процессе (удобно для отладки и маленьких пакетов)
+            return ThreadPoolExecutor(max_workers=1)
+        # fork не переимпортирует rag_service.py в дочерних процессах, в отличие от spawn
+        context = multiprocessing.get_context("fork") if hasattr(os, "fork") else None
+        return ProcessPoolExecutor(max_workers=self.workers, mp_context=context)
+
+    def iter_chunks(self, file_paths, stats):
+        """Отдает чанки по мере готовности, сохраняя порядок файлов и страниц."""
+        pending = deque()
+
+        def take_oldest():
+            chunks, items, read_seconds, chunk_seconds = pending.popleft().result()
+            stats["read"].add(items, read_seconds)
+            stats["chunk"].add(len(chunks), chunk_seconds)
+            return chunks
+
+        with self.chunk_pool() as pool:
+            for part in iter_parts(file_paths, self.pdf_pages_per_part, self.text_block_chars):
+                pending.append(pool.submit(process_part, part, self.chunk_size, self.chunk_overlap))
+                if len(pending) >= self.max_pending:
+                    for text, metadata in take_oldest():
+                        yield Document(page_content=text, metadata=metadata)
+            while pending:
+                for text, metadata in take_oldest():
+                    yield Document(page_content=text, metadata=metadata)
+
+    def new_stats(self):
+        return {
+            "read": StageStats("чтение", "частей"),
+            "chunk": StageStats("чанкинг", "чанков"),
+            "embed": StageStats("эмбеддинги", "чанков"),
+        }
+
+    def iter_docs(self, file_paths):
+        """Только чтение и чанкинг, без эмбеддингов; чанки отдаются по мере готовности."""
+        return self.iter_chunks(file_paths, self.new_stats())
+
+    def load_and_split(self, file_paths):
+        return list(self.iter_docs(file_paths))
+
+    def run(self, file_paths, label="", dedup_threshold=0.0):
+        """
+        Прогоняет файлы через все стадии.
+        При dedup_threshold > 0 почти одинаковые чанки схлопываются до вычисления эмбеддингов.
+        Возвращает пару (чанки, векторы) в одинаковом порядке.
+        """
+        stats = self.new_stats()
+        started = time.perf_counter()
+        docs, vectors, batch = [], [], []
+        dedup = NearDuplicateFilter(dedup_threshold) if dedup_threshold > 0 else None
+
+        def flush():
+            batch_started = time.perf_counter()
+            vectors.extend(self.embedding.embed_documents([doc.page_content for doc in batch]))
+            stats["embed"].add(len(batch), time.perf_counter() - batch_started)
+            docs.extend(batch)
+            batch.clear()
+
+        for doc in self.iter_chunks(file_paths, stats):
+            if dedup is not None and dedup.add(doc) is None:
+                continue
+            batch.append(doc)
+            if len(batch) >= self.batch_size:
+                flush()
+        if batch:
+            flush()
+
+        total = time.perf_counter() - started
+        print(f"Ингест {label}: {len(docs)} чанков за {total:.2f} с; "
+              + "; ".join(str(stage) for stage in stats.values()))
+        if dedup is not None:
+            print(f"Почти-дубликаты {label} (порог {dedup_threshold}): {dedup.report()}")
+        return docs, vectors
+
+
+def merge_duplicate_chunks(docs, vectors):
+    """
+    Схлопывает одинаковые чанки из разных файлов (пакеты пересекаются) в одну запись.
+    Пакеты, специализации и источники объединяются в списки packs / specializations / sources.
+    """
+    merged = {}
+    for doc, vector in zip(docs, vectors):
+        entry = merged.get(doc.page_content)
+        if entry is None:
+            merged[doc.page_content] = (doc, vector)
+        else:
+            merge_chunk_metadata(entry[0].metadata, doc.metadata)
+
+    merged_docs = [doc for doc, _ in merged.values()]
+    merged_vectors = [vector for _, vector in merged.values()]
+    print(f"Дедупликация: {len(docs)} чанков -> {len(merged_docs)}")
+    return merged_docs, merged_vectors
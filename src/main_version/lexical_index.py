@@ -0,0 +1,146 @@
+import re
+import math
+import time
+from collections import Counter
+from typing import Any
+import numpy as np
+from langchain_core.retrievers import BaseRetriever
+from langchain.retrievers import EnsembleRetriever
+
+from rag_cache import normalize_query
+
+# Слова вида "1-2-1", "openAPI", "C#" остаются одним токеном
+TOKEN_RE = re.compile(r"\w+(?:[-+#.]\w+)*[+#]*")
+# Длина "псевдоосновы": обрезка окончаний дает дешевую нормализацию русских словоформ
+STEM_LENGTH = 6
+
+
+def tokenize(text):
+    tokens = []
+    for token in TOKEN_RE.findall(text.lower()):
+        if token.isalpha() and len(token) > STEM_LENGTH:
+            token = token[:STEM_LENGTH]
+        tokens.append(token)
+    return tokens
+
+
+class BM25Index:
+    """
+    Инвертированный индекс BM25 по чанкам пакета.
+    Строится один раз вместе с векторным индексом и сохраняется в снапшот.
+    Поиск затрагивает только списки терминов запроса, а не весь корпус.
+    """
+
+    def __init__(self, doc_ids, texts, k1=1.5, b=0.75):
+        self.doc_ids = list(doc_ids)
+        self.k1 = k1
+        self.b = b
+
+        postings = {}
+        lengths = np.zeros(len(texts), dtype=np.float32)
+        for position, text in enumerate(texts):
+            counts = Counter(tokenize(text))
+            lengths[position] = sum(counts.values())
+            for term, tf in counts.items():
+                postings.setdefault(term, []).append((position, tf))
+
+        avg_length = float(lengths.mean()) if len(texts) else 0.0
+        # Нормировка длины документа считается заранее, в запросе остаются только сложения
+        self.length_norm = k1 * (1 - b + b * lengths / avg_length) if avg_length else lengths
+        self.postings = {}
+        self.idf = {}
+        n_docs = len(texts)
+        for term, items in postings.items():
+            positions = np.array([position for position, _ in items], dtype=np.int32)
+            tfs = np.array([tf for _, tf in items], dtype=np.float32)
+            self.postings[term] = (positions, tfs)
+            self.idf[term] = math.log(1 + (n_docs - len(items) + 0.5) / (len(items) + 0.5))
+
+    @classmethod
+    def from_vector_store(cls, vector_store):
+        """Строит индекс по чанкам FAISS-хранилища (в порядке векторного индекса)."""
+        doc_ids = [vector_store.index_to_docstore_id[i] for i in range(len(vector_store.index_to_docstore_id))]
+        texts = [vector_store.docstore.search(doc_id).page_content for doc_id in doc_ids]
+        return cls(doc_ids, texts)
+
+    def search(self, query, k, allowed=None):
+        """
+        Возвращает до k пар (docstore id, score), лучшие первыми.
+        allowed — необязательная булева маска по позициям чанков (фильтр по метаданным).
+        """
+        scores = {}
+        for term in set(tokenize(query)):
+            if term not in self.postings:
+                continue
+            positions, tfs = self.postings[term]
+            if allowed is not None:
+                keep = allowed[positions]
+                positions, tfs = positions[keep], tfs[keep]
+            term_scores = self.idf[term] * tfs * (self.k1 + 1) / (tfs + self.length_norm[positions])
+            for position, score in zip(positions.tolist(), term_scores.tolist()):
+                scores[position] = scores.get(position, 0.0) + score
+        best = sorted(scores.items(), key=lambda item: item[1], reverse=True)[:k]
+        return [(self.doc_ids[position], score) for position, score in best]
+
+
+class BM25Retriever(BaseRetriever):
+    """Разреженный ретривер: BM25 по инвертированному индексу, документы берутся из docstore FAISS."""
+
+    lexical_index: Any
+    docstore: Any
+    k: int = 5
+    allowed: Any = None
+
+    def _get_relevant_documents(self, query, *, run_manager=None):
+        return [
+            self.docstore.search(doc_id)
+            for doc_id, _ in self.lexical_index.search(query, self.k, self.allowed)
+        ]
+
+
+class HybridRetriever(BaseRetriever):
+    """
+    Гибридный поиск: BM25 + FAISS, результаты объединяются взвешенным RRF из EnsembleRetriever.
+
+    Короткие запросы из ключевых слов (роль, "1-2-1", "Java"), по которым BM25 находит
+    не меньше k чанков, обслуживаются только разреженным индексом без вызова модели эмбеддингов.
+    """
+
+    dense: Any
+    sparse: Any
+    pack_name: str
+    version: int
+    k: int = 5
+    sparse_weight: float = 0.5
+    short_query_tokens: int = 3
+    cache: Any = None
+
+    def _get_relevant_documents(self, query, *, run_manager=None):
+        key = (self.pack_name, self.version, self.k, "hybrid", normalize_query(query))
+        if self.cache is not None:
+            docs = self.cache.get(key)
+            if docs is not None:
+                return list(docs)
+
+        started = time.perf_counter()
+        sparse_docs = self.sparse.invoke(query)
+        sparse_ms = (time.perf_counter() - started) * 1000
+
+        if len(tokenize(query)) <= self.short_query_tokens and len(sparse_docs) >= self.k:
+            docs = sparse_docs[:self.k]
+            print(f"Гибридный поиск {self.pack_name}: BM25 {sparse_ms:.1f} мс, FAISS пропущен")
+        else:
+            started = time.perf_counter()
+            dense_docs = self.dense.invoke(query)
+            dense_ms = (time.perf_counter() - started) * 1000
+
+            ensemble = EnsembleRetriever(
+                retrievers=[self.dense, self.sparse],
+                weights=[1 - self.sparse_weight, self.sparse_weight],
+            )
+            docs = ensemble.weighted_reciprocal_rank([dense_docs, sparse_docs])[:self.k]
+            print(f"Гибридный поиск {self.pack_name}: BM25 {sparse_ms:.1f} мс, FAISS {dense_ms:.1f} мс")
+
+        if self.cache is not None:
+            self.cache.put(key, tuple(docs))
+        return docs
@@ -0,0 +1,73 @@
+"""
+Пропускная способность одновременных уточняющих вопросов (count 2-9): синхронный stream()
+внутри async-обработчика (как было) против astream().
+
+Запуск:
+    python llm_benchmark.py [--clients 20] [--ttft 0.5] [--token-delay 0.05]
+
+Вместо GigaChat используется заглушка с задержками (stub_llm.StubChatModel), сеть не нужна.
+Обработчик повторяет цикл из rag_service.websocket_endpoint: очистка фрагмента и отправка клиенту.
+"""
+import argparse
+import asyncio
+import time
+import numpy as np
+
+from stub_llm import StubChatModel
+
+PROMPT = "Использую контекст нашей прошлой беседы [], ответь на уточняющий вопрос"
+
+
+async def send(answer, first_chunk_at, started):
+    # Отправка в websocket: управление возвращается циклу событий
+    if first_chunk_at[0] is None:
+        first_chunk_at[0] = time.perf_counter() - started
+    await asyncio.sleep(0)
+
+
+async def handle_sync(llm):
+    started = time.perf_counter()
+    first_chunk_at = [None]
+    for chunk in llm.stream(PROMPT):
+        await send(" ".join(chunk.content.split()), first_chunk_at, started)
+    return first_chunk_at[0], time.perf_counter() - started
+
+
+async def handle_async(llm):
+    started = time.perf_counter()
+    first_chunk_at = [None]
+    async for chunk in llm.astream(PROMPT):
+        await send(" ".join(chunk.content.split()), first_chunk_at, started)
+    return first_chunk_at[0], time.perf_counter() - started
+
+
+async def run(handler, llm, clients):
+    started = time.perf_counter()
+    results = await asyncio.gather(*(handler(llm) for _ in range(clients)))
+    wall = time.perf_counter() - started
+    ttft = np.array([first for first, _ in results]) * 1000
+    total = np.array([seconds for _, seconds in results]) * 1000
+    return {
+        "wall_s": round(wall, 2),
+        "streams_per_s": round(clients / wall, 2),
+        "ttft_p50_ms": round(float(np.percentile(ttft, 50)), 1),
+        "ttft_p95_ms": round(float(np.percentile(ttft, 95)), 1),
+        "total_p95_ms": round(float(np.percentile(total, 95)), 1),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--clients", type=int, default=20)
+    parser.add_argument("--ttft", type=float, default=0.5)
+    parser.add_argument("--token-delay", type=float, default=0.05)
+    args = parser.parse_args()
+
+    llm = StubChatModel(ttft=args.ttft, token_delay=args.token_delay)
+    print(f"{args.clients} одновременных потоков, ttft {args.ttft} с, задержка слова {args.token_delay} с")
+    for name, handler in (("stream (синхронно)", handle_sync), ("astream", handle_async)):
+        print(f"{name:>20}: {asyncio.run(run(handler, llm, args.clients))}")
+
+
+if __name__ == "__main__":
+    main()
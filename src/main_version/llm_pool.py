@@ -0,0 +1,110 @@
+import os
+import time
+import asyncio
+import contextlib
+from langchain_gigachat import GigaChat
+
+from stub_llm import StubChatModel
+
+# Модели, для которых держатся пулы клиентов
+LLM_MODELS = ("GigaChat-Max", "GigaChat")
+# Размер пула по умолчанию; для отдельной модели — LLM_POOL_SIZE_GIGACHAT_MAX и т. п.
+DEFAULT_POOL_SIZE = int(os.getenv("LLM_POOL_SIZE", "4"))
+# gigachat — настоящий API, stub — заглушка с задержками STUB_TTFT / STUB_TOKEN_DELAY (для нагрузочных тестов)
+LLM_BACKEND = os.getenv("LLM_BACKEND", "gigachat")
+
+
+def model_env(name, model, default):
+    """Значение переменной окружения для модели (NAME_GIGACHAT_MAX), иначе общее (NAME)."""
+    return os.getenv(f"{name}_{model.upper().replace('-', '_')}", os.getenv(name, default))
+
+
+def pool_size(model):
+    return int(model_env("LLM_POOL_SIZE", model, DEFAULT_POOL_SIZE))
+
+
+class LLMPool:
+    """
+    Пул переиспользуемых клиентов GigaChat одной модели.
+
+    Клиент создается один раз на процесс и держит HTTP-соединения (keep-alive) и токен доступа,
+    который сам обновляет по истечении срока. Запрос берет клиент на время генерации (lease);
+    если все клиенты заняты, запрос ждет в очереди, так что size ограничивает число
+    одновременных генераций модели.
+    """
+
+    def __init__(self, model, size, factory):
+        self.model = model
+        self.size = size
+        self.all_clients = [factory(model) for _ in range(size)]
+        self.clients = asyncio.Queue()
+        for client in self.all_clients:
+            self.clients.put_nowait(client)
+        self.in_use = 0
+        self.waiting = 0
+        self.leases = 0
+        self.wait_seconds = 0.0
+        self.max_wait_seconds = 0.0
+
+    @contextlib.asynccontextmanager
+    async def lease(self):
+        started = time.perf_counter()
+        self.waiting += 1
+        try:
+            client = await self.clients.get()
+        finally:
+            self.waiting -= 1
+        waited = time.perf_counter() - started
+        self.leases += 1
+        self.wait_seconds += waited
+        self.max_wait_seconds = max(self.max_wait_seconds, waited)
+        self.in_use += 1
+        try:
+            yield client
+        finally:
+            self.in_use -= 1
+            self.clients.put_nowait(client)
+
+    async def warm_up(self):
+        """Получает токены доступа заранее, чтобы OAuth не попадал в первый запрос."""
+        if LLM_BACKEND == "stub":
+            return
+        try:
+            for client in self.all_clients:
+                await client._client.aget_token()
+        except Exception as e:
+            print(f"Не удалось заранее получить токен для {self.model}: {e}")
+
+    def stats(self):
+        return {
+            "size": self.size,
+            "in_use": self.in_use,
+            "idle": self.clients.qsize(),
+            "waiting": self.waiting,
+            "utilization": self.in_use / self.size if self.size else 0.0,
+            "leases": self.leases,
+            "avg_wait_ms": round(self.wait_seconds / self.leases * 1000, 2) if self.leases else 0.0,
+            "max_wait_ms": round(self.max_wait_seconds * 1000, 2),
+        }
+
+
+def create_llm_pools(api_key, models=LLM_MODELS):
+    def factory(model):
+        if LLM_BACKEND == "stub":
+            # Задержки и сбои задаются для всех моделей или для одной (STUB_STALL_RATE_GIGACHAT_MAX)
+            return StubChatModel(
+                ttft=float(model_env("STUB_TTFT", model, "0.5")),
+                token_delay=float(model_env("STUB_TOKEN_DELAY", model, "0.05")),
+                stall_rate=float(model_env("STUB_STALL_RATE", model, "0")),
+                stall=float(model_env("STUB_STALL", model, "0")),
+                fail_rate=float(model_env("STUB_FAIL_RATE", model, "0")),
+                fail_after=int(model_env("STUB_FAIL_AFTER", model, "0")),
+            )
+        return GigaChat(
+            credentials=api_key,
+            model=model,
+            verify_ssl_certs=False,
+            profanity_check=False
+        )
+
+    return {model: LLMPool(model, pool_size(model), factory) for model in models}
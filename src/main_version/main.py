@@ -1,24 +1,79 @@
+import os
 import subprocess
 import sys
 import time
+import json
+import urllib.request
+import urllib.error
 
 # Пути к скриптам, которые нужно запустить
-script1 = 'rag_service.py'
+script1 = 'serve.py'
 script2 = 'telegram_bot.py'
 
+# Адрес проверки готовности rag_service и максимальное время ожидания в секундах
+READY_URL = os.getenv("RAG_READY_URL", "http://127.0.0.1:8000/readyz")
+READY_TIMEOUT = float(os.getenv("RAG_READY_TIMEOUT", "600"))
+READY_POLL_INTERVAL = 1.0
+
 # Функция для запуска скрипта в фоновом режиме
 def run_script_in_background(script_path):
     try:
-        # Запуск скрипта в фоновом режиме с использованием Popen
-        process = subprocess.Popen([sys.executable, script_path], stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+        # Запуск скрипта в фоновом режиме с использованием Popen.
+        # Вывод не перехватывается: непрочитанный PIPE переполняется и блокирует дочерний процесс
+        process = subprocess.Popen([sys.executable, script_path])
         print(f"Скрипт {script_path} запущен в фоновом режиме с PID: {process.pid}")
         return process
     except Exception as e:
         print(f"Ошибка при запуске скрипта {script_path}: {e}")
         return None
 
+def not_ready_indexes(response):
+    """Состояние незагруженных индексов из ответа 503 /readyz: имя -> (статус, ошибка)."""
+    try:
+        indexes = json.loads(response.read()).get("indexes", {})
+    except (ValueError, AttributeError):
+        return {}
+    return {
+        name: (state.get("status"), state.get("error"))
+        for name, state in indexes.items() if state.get("status") != "ready"
+    }
+
+# Ждем, пока rag_service загрузит все индексы (вместо фиксированной паузы).
+# Индекс, который не загрузился, уже не станет готов — ждать таймаута бессмысленно
+def wait_until_ready(process, url=READY_URL, timeout=READY_TIMEOUT):
+    started = time.monotonic()
+    pending = {}
+    while time.monotonic() - started < timeout:
+        if process is not None and process.poll() is not None:
+            print(f"rag_service завершился с кодом {process.returncode}")
+            return False
+        try:
+            with urllib.request.urlopen(url, timeout=2) as response:
+                if response.status == 200:
+                    print(f"rag_service готов через {time.monotonic() - started:.1f} с")
+                    return True
+        except urllib.error.HTTPError as e:
+            # 503: индексы еще загружаются или какой-то из них не загрузился
+            pending = not_ready_indexes(e)
+            failed = {name: error for name, (status, error) in pending.items() if status == "failed"}
+            if failed:
+                for name, error in failed.items():
+                    print(f"Индекс {name} не загрузился: {error}")
+                return False
+        except (urllib.error.URLError, ConnectionError, TimeoutError):
+            # Сервер еще не слушает порт
+            pass
+        time.sleep(READY_POLL_INTERVAL)
+    print(f"rag_service не стал готов за {timeout:.0f} с, не загружены: {', '.join(pending) or 'нет данных'}")
+    return False
+
 # Запуск скриптов в фоновом режиме
 if __name__ == "__main__":
     process1 = run_script_in_background(script1)
-    time.sleep(30)
-    process2 = run_script_in_background(script2)
\ No newline at end of file
+    if wait_until_ready(process1):
+        process2 = run_script_in_background(script2)
+    else:
+        print("Бот не запущен: rag_service не готов")
+        if process1 is not None and process1.poll() is None:
+            process1.terminate()
+        sys.exit(1)
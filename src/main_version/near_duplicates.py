@@ -0,0 +1,100 @@
+import zlib
+from collections import Counter
+import numpy as np
+
+# Простое число Мерсенна 2^31 - 1: a * h + b помещается в uint64 без переполнения
+PRIME = (1 << 31) - 1
+
+# Поля метаданных, которые у схлопнутого чанка превращаются в списки
+MERGED_FIELDS = (("sources", "source"), ("packs", "pack"), ("specializations", "specialization"))
+
+
+def merge_chunk_metadata(target, metadata):
+    """Добавляет источники, пакеты и специализации чанка-дубликата в метаданные оставленного чанка."""
+    for list_field, field in MERGED_FIELDS:
+        values = target.get(list_field) or ([target[field]] if field in target else [])
+        for value in metadata.get(list_field) or ([metadata[field]] if field in metadata else []):
+            if value not in values:
+                values.append(value)
+        target[list_field] = values
+
+
+class MinHasher:
+    """MinHash-сигнатуры текстов по множеству словесных шинглов."""
+
+    def __init__(self, num_perm=64, shingle_size=3, seed=1):
+        rng = np.random.default_rng(seed)
+        self.a = rng.integers(1, PRIME, num_perm, dtype=np.uint64)
+        self.b = rng.integers(0, PRIME, num_perm, dtype=np.uint64)
+        self.shingle_size = shingle_size
+
+    def shingles(self, text):
+        words = text.lower().split()
+        n = self.shingle_size
+        if len(words) <= n:
+            return {" ".join(words)}
+        return {" ".join(words[i:i + n]) for i in range(len(words) - n + 1)}
+
+    def signature(self, text):
+        hashes = np.fromiter(
+            (zlib.crc32(shingle.encode("utf-8")) % PRIME for shingle in self.shingles(text)),
+            dtype=np.uint64,
+        )
+        return ((self.a[:, None] * hashes[None, :] + self.b[:, None]) % PRIME).min(axis=1)
+
+
+class NearDuplicateFilter:
+    """
+    Потоковое удаление почти одинаковых чанков (MinHash + LSH).
+
+    Сигнатура чанка режется на bands полос; чанки, совпавшие хотя бы в одной полосе, — кандидаты.
+    Если оценка сходства Жаккара с кандидатом не ниже threshold, чанк не попадает в индекс,
+    а его источники, пакеты и специализации дописываются в метаданные оставленного чанка.
+    """
+
+    def __init__(self, threshold, num_perm=64, bands=16):
+        self.threshold = threshold
+        self.hasher = MinHasher(num_perm)
+        self.bands = bands
+        self.rows = num_perm // bands
+        self.buckets = {}
+        self.kept = []
+        self.total = Counter()
+        self.removed = Counter()
+
+    def add(self, doc):
+        """Возвращает doc, если чанк новый, или None, если он схлопнут с уже встреченным."""
+        pack = doc.metadata.get("pack", "")
+        self.total[pack] += 1
+        signature = self.hasher.signature(doc.page_content)
+        keys = [
+            (band, signature[band * self.rows:(band + 1) * self.rows].tobytes())
+            for band in range(self.bands)
+        ]
+
+        candidates = set()
+        for key in keys:
+            candidates.update(self.buckets.get(key, ()))
+        best, best_similarity = None, 0.0
+        for position in sorted(candidates):
+            similarity = float((self.kept[position][1] == signature).mean())
+            if similarity > best_similarity:
+                best, best_similarity = position, similarity
+
+        if best is not None and best_similarity >= self.threshold:
+            merge_chunk_metadata(self.kept[best][0].metadata, doc.metadata)
+            self.removed[pack] += 1
+            return None
+
+        position = len(self.kept)
+        self.kept.append((doc, signature))
+        for key in keys:
+            self.buckets.setdefault(key, []).append(position)
+        return doc
+
+    def report(self):
+        """Сколько чанков встречено и удалено по каждому пакету."""
+        return {
+            pack: {"chunks": self.total[pack], "removed": self.removed[pack]}
+            for pack in sorted(self.total)
+        }
@@ -0,0 +1,125 @@
+import os
+import numpy as np
+from langchain_core.embeddings import Embeddings
+
+# Каталог с экспортированными ONNX-моделями
+ONNX_MODELS_DIR = os.getenv(
+    "ONNX_MODELS_DIR",
+    os.path.join(os.path.dirname(__file__), "onnx_models")
+)
+
+FP32_FILE = "model.onnx"
+INT8_FILE = "model.int8.onnx"
+
+# Такая же максимальная длина, как у sentence-transformers для paraphrase-multilingual-mpnet-base-v2
+MAX_SEQ_LENGTH = 128
+
+
+def onnx_model_dir(model_name):
+    return os.path.join(ONNX_MODELS_DIR, model_name.replace("/", "__"))
+
+
+def export_onnx_model(model_name, output_dir):
+    """
+    Экспортирует трансформер модели эмбеддингов в ONNX и квантует веса в int8.
+    Нужны torch и transformers (ставятся вместе с sentence-transformers) и onnxruntime.
+    """
+    import torch
+    from transformers import AutoTokenizer, AutoModel
+    from onnxruntime.quantization import quantize_dynamic, QuantType
+
+    os.makedirs(output_dir, exist_ok=True)
+    tokenizer = AutoTokenizer.from_pretrained(model_name)
+    model = AutoModel.from_pretrained(model_name).eval()
+
+    sample = tokenizer(["пример текста для экспорта"], return_tensors="pt")
+    fp32_path = os.path.join(output_dir, FP32_FILE)
+    with torch.no_grad():
+        torch.onnx.export(
+            model,
+            (sample["input_ids"], sample["attention_mask"]),
+            fp32_path,
+            input_names=["input_ids", "attention_mask"],
+            output_names=["last_hidden_state"],
+            dynamic_axes={
+                "input_ids": {0: "batch", 1: "sequence"},
+                "attention_mask": {0: "batch", 1: "sequence"},
+                "last_hidden_state": {0: "batch", 1: "sequence"},
+            },
+            opset_version=14,
+        )
+
+    quantize_dynamic(fp32_path, os.path.join(output_dir, INT8_FILE), weight_type=QuantType.QInt8)
+    tokenizer.save_pretrained(output_dir)
+    print(f"ONNX-модель {model_name} экспортирована в {output_dir}")
+
+
+class OnnxEmbeddings(Embeddings):
+    """
+    Эмбеддинги на int8-квантованной ONNX-версии модели.
+    Повторяет пулинг sentence-transformers (среднее по токенам с учетом маски),
+    поэтому подставляется вместо HuggingFaceEmbeddings без изменений в остальном коде.
+    """
+
+    def __init__(self, model_dir, batch_size=32, max_length=MAX_SEQ_LENGTH, num_threads=0):
+        import onnxruntime as ort
+        from transformers import AutoTokenizer
+
+        options = ort.SessionOptions()
+        if num_threads > 0:
+            options.intra_op_num_threads = num_threads
+        self.session = ort.InferenceSession(
+            os.path.join(model_dir, INT8_FILE), options, providers=["CPUExecutionProvider"]
+        )
+        self.tokenizer = AutoTokenizer.from_pretrained(model_dir)
+        self.batch_size = batch_size
+        self.max_length = max_length
+
+    def encode(self, texts):
+        vectors = []
+        for start in range(0, len(texts), self.batch_size):
+            batch = texts[start:start + self.batch_size]
+            encoded = self.tokenizer(
+                batch, padding=True, truncation=True, max_length=self.max_length, return_tensors="np"
+            )
+            attention_mask = encoded["attention_mask"].astype(np.int64)
+            hidden = self.session.run(None, {
+                "input_ids": encoded["input_ids"].astype(np.int64),
+                "attention_mask": attention_mask,
+            })[0]
+            # Mean pooling по токенам без паддинга
+            mask = attention_mask[..., None].astype(np.float32)
+            pooled = (hidden * mask).sum(axis=1) / np.clip(mask.sum(axis=1), 1e-9, None)
+            vectors.append(pooled.astype(np.float32))
+        if not vectors:
+            return np.zeros((0, 0), dtype=np.float32)
+        return np.vstack(vectors)
+
+    def embed_documents(self, texts):
+        return self.encode(list(texts)).tolist()
+
+    def embed_query(self, text):
+        return self.encode([text])[0].tolist()
+
+
+def load_onnx_embeddings(model_name, batch_size=32, num_threads=0):
+    """Загружает ONNX-эмбеддинги, при первом запуске экспортируя и квантуя модель."""
+    model_dir = onnx_model_dir(model_name)
+    if not os.path.exists(os.path.join(model_dir, INT8_FILE)):
+        export_onnx_model(model_name, model_dir)
+    return OnnxEmbeddings(model_dir, batch_size=batch_size, num_threads=num_threads)
+
+
+def cosine_parity(reference_vectors, candidate_vectors):
+    """Минимальное и среднее косинусное сходство между соответствующими векторами двух бэкендов."""
+    a = np.asarray(reference_vectors, dtype=np.float32)
+    b = np.asarray(candidate_vectors, dtype=np.float32)
+    a = a / np.linalg.norm(a, axis=1, keepdims=True)
+    b = b / np.linalg.norm(b, axis=1, keepdims=True)
+    cosine = (a * b).sum(axis=1)
+    return {"min_cosine": float(cosine.min()), "mean_cosine": float(cosine.mean())}
+
+
+def check_parity(reference, candidate, texts):
+    """Сравнивает векторы двух бэкендов эмбеддингов на одних и тех же текстах."""
+    return cosine_parity(reference.embed_documents(texts), candidate.embed_documents(texts))
@@ -0,0 +1,272 @@
+import time
+import threading
+import functools
+from typing import Any, NamedTuple
+import faiss
+from langchain_community.vectorstores import FAISS
+from langchain_community.docstore.in_memory import InMemoryDocstore
+
+from index_store import (
+    source_key,
+    list_sources,
+    scan_sources,
+    compute_corpus_hash,
+    snapshot_path,
+    save_snapshot,
+    remove_stale_snapshots,
+    make_meta,
+    load_or_build_vector_store,
+    load_artifact,
+    build_vector_store,
+    build_lexical_index,
+)
+from faiss_indexes import supports_remove, apply_search_params, is_compressed
+from rag_cache import CachedRetriever
+from lexical_index import BM25Retriever, HybridRetriever
+
+
+def clone_vector_store(vector_store):
+    """Создает независимую копию FAISS-хранилища (индекс + docstore)."""
+    return FAISS(
+        embedding_function=vector_store.embedding_function,
+        index=faiss.clone_index(vector_store.index),
+        docstore=InMemoryDocstore(dict(vector_store.docstore._dict)),
+        index_to_docstore_id=dict(vector_store.index_to_docstore_id),
+    )
+
+
+def file_doc_ids(vector_store):
+    """Группирует id чанков хранилища по ключу исходного файла (см. index_store.source_key)."""
+    ids = {}
+    for doc_id in vector_store.index_to_docstore_id.values():
+        doc = vector_store.docstore.search(doc_id)
+        for source in doc.metadata.get("sources") or [doc.metadata.get("source", "")]:
+            ids.setdefault(source_key(source), []).append(doc_id)
+    return ids
+
+
+class PackState(NamedTuple):
+    """Согласованная версия индексов пакета: векторный индекс, BM25, номер версии и фильтры."""
+    vector_store: Any
+    lexical_index: Any
+    version: int
+    filters: Any = None
+
+
+class PackIndex:
+    """
+    Живой индекс одного пакета документов.
+
+    Запрос берет ссылку на текущее состояние (as_retriever) в самом начале и работает с ней до конца.
+    Переиндексация меняет копию хранилища и подменяет состояние одним присваиванием,
+    поэтому читатели никогда не видят наполовину обновленный индекс.
+    """
+
+    def __init__(self, pack_name, folder_paths, embedding, model_name,
+                 chunk_size, chunk_overlap, ingest, index_config, k=5, retrieval_cache=None,
+                 retriever_mode="dense", sparse_weight=0.5, full_rebuild=False, manifest=None):
+        self.pack_name = pack_name
+        # Каталоги с исходными файлами; у обычного пакета он один
+        self.folder_paths = list(folder_paths)
+        self.embedding = embedding
+        self.model_name = model_name
+        self.chunk_size = chunk_size
+        self.chunk_overlap = chunk_overlap
+        dedup_threshold = index_config["dedup_threshold"]
+        if dedup_threshold > 0:
+            ingest = functools.partial(ingest, dedup_threshold=dedup_threshold)
+        self.ingest = ingest
+        # Схлопнутый чанк принадлежит нескольким файлам, поэтому точечно удалять чанки одного файла нельзя:
+        # при изменениях индекс собирается заново (векторы берутся из хранилища эмбеддингов)
+        self.full_rebuild = full_rebuild or dedup_threshold > 0
+        self.index_config = index_config
+        self.k = k
+        self.retrieval_cache = retrieval_cache
+        # dense — только FAISS, hybrid — BM25 + FAISS
+        self.retriever_mode = retriever_mode
+        self.sparse_weight = sparse_weight
+        self.reindex_lock = threading.Lock()
+        # С манифестом офлайн-сборки индекс только читается: модель для корпуса не нужна
+        self.read_only = manifest is not None
+        if self.read_only:
+            vector_store, self.meta, lexical_index = load_artifact(pack_name, manifest, embedding, index_config)
+        else:
+            vector_store, self.meta, lexical_index = load_or_build_vector_store(
+                pack_name, self.folder_paths, embedding, model_name,
+                chunk_size, chunk_overlap, ingest, index_config
+            )
+        self.state = self.make_state(vector_store, lexical_index, 0)
+
+    @property
+    def vector_store(self):
+        return self.state.vector_store
+
+    def make_state(self, vector_store, lexical_index, version):
+        return PackState(vector_store, lexical_index, version)
+
+    def owns_cache_key(self, key):
+        """Относится ли ключ кеша поиска к этому индексу."""
+        return key[0] == self.pack_name
+
+    def as_retriever(self, k=None):
+        k = k or self.k
+        state = self.state
+        dense = CachedRetriever(
+            vector_store=state.vector_store,
+            pack_name=self.pack_name,
+            version=state.version,
+            k=k,
+            cache=self.retrieval_cache,
+            embedding=self.embedding,
+            rescore_factor=self.index_config["rescore_factor"] if is_compressed(self.index_config) else 0,
+        )
+        if self.retriever_mode != "hybrid":
+            return dense
+
+        sparse = BM25Retriever(
+            lexical_index=state.lexical_index,
+            docstore=state.vector_store.docstore,
+            k=k,
+        )
+        return HybridRetriever(
+            dense=dense,
+            sparse=sparse,
+            pack_name=self.pack_name,
+            version=state.version,
+            k=k,
+            sparse_weight=self.sparse_weight,
+            cache=self.retrieval_cache,
+        )
+
+    def patch_store(self, current, stale_ids, fresh_docs, vectors):
+        """Правит копию индекса на месте: удаляет старые чанки, добавляет новые."""
+        new_store = clone_vector_store(current)
+        if stale_ids:
+            new_store.delete(stale_ids)
+        if fresh_docs:
+            new_store.add_embeddings(
+                zip([doc.page_content for doc in fresh_docs], vectors),
+                metadatas=[doc.metadata for doc in fresh_docs],
+            )
+        return new_store
+
+    def rebuild_store(self, current, stale_ids, fresh_docs, vectors):
+        """
+        Пересобирает индекс целиком (нужно для HNSW, который не умеет удалять векторы).
+        Векторы оставшихся чанков берутся из хранилища эмбеддингов без обращения к модели.
+        """
+        stale = set(stale_ids)
+        kept_docs = [
+            current.docstore.search(doc_id)
+            for doc_id in current.index_to_docstore_id.values()
+            if doc_id not in stale
+        ]
+        kept_vectors = self.embedding.embed_documents([doc.page_content for doc in kept_docs])
+        return build_vector_store(
+            kept_docs + fresh_docs, kept_vectors + vectors, self.embedding, self.index_config
+        )
+
+    def update_store(self, current, sources, added, changed, removed):
+        """
+        Обновляет только чанки добавленных, измененных и удаленных файлов.
+        Возвращает новое хранилище и число удаленных/добавленных чанков.
+        """
+        if self.full_rebuild:
+            docs, vectors = self.ingest([sources[name] for name in sorted(sources)], self.pack_name)
+            new_store = build_vector_store(docs, vectors, self.embedding, self.index_config)
+            return new_store, current.index.ntotal, len(docs)
+
+        doc_ids = file_doc_ids(current)
+        stale_ids = [doc_id for name in changed + removed for doc_id in doc_ids.get(name, [])]
+
+        # Чанкуем и кодируем только новые и измененные файлы
+        fresh_docs, vectors = self.ingest([sources[name] for name in added + changed], self.pack_name)
+
+        new_store = None
+        if supports_remove(self.index_config):
+            try:
+                new_store = self.patch_store(current, stale_ids, fresh_docs, vectors)
+            except RuntimeError as e:
+                # Например, отображенные в память списки IVF не клонируются
+                print(f"Индекс {self.pack_name} нельзя изменить на месте ({e}), пересобираем")
+        if new_store is None:
+            new_store = self.rebuild_store(current, stale_ids, fresh_docs, vectors)
+        return new_store, len(stale_ids), len(fresh_docs)
+
+    def reindex(self):
+        """
+        Находит добавленные, измененные и удаленные файлы пакета и обновляет индекс.
+        Возвращает отчет об изменениях или None, если пакет не менялся.
+        """
+        if self.read_only:
+            raise RuntimeError(f"Индекс {self.pack_name} загружен из артефактов сборки, "
+                               "обновите его через build_index.py")
+        with self.reindex_lock:
+            old_files = self.meta["files"]
+            sources = list_sources(self.folder_paths)
+            new_files = scan_sources(sources)
+
+            added = sorted(name for name in new_files if name not in old_files)
+            changed = sorted(
+                name for name in new_files
+                if name in old_files and new_files[name] != old_files[name]
+            )
+            removed = sorted(name for name in old_files if name not in new_files)
+            if not (added or changed or removed):
+                return None
+
+            new_store, removed_chunks, added_chunks = self.update_store(
+                self.vector_store, sources, added, changed, removed
+            )
+            apply_search_params(new_store.index, self.index_config)
+            lexical_index = build_lexical_index(new_store, self.pack_name)
+
+            corpus_hash = compute_corpus_hash(new_files, self.model_name, self.chunk_size,
+                                              self.chunk_overlap, self.index_config)
+            meta = make_meta(self.pack_name, corpus_hash, new_files, self.model_name, self.chunk_size,
+                             self.chunk_overlap, self.index_config, new_store.index.ntotal)
+            path = snapshot_path(self.pack_name, corpus_hash)
+            save_snapshot(new_store, path, meta, lexical_index)
+            remove_stale_snapshots(self.pack_name, path)
+
+            # Атомарная подмена: новые запросы пойдут уже в обновленный индекс
+            self.meta = meta
+            self.state = self.make_state(new_store, lexical_index, self.state.version + 1)
+
+            # Результаты поиска по старой версии индекса больше не нужны
+            if self.retrieval_cache is not None:
+                self.retrieval_cache.invalidate(self.owns_cache_key)
+
+            report = {
+                "added": added,
+                "changed": changed,
+                "removed": removed,
+                "removed_chunks": removed_chunks,
+                "added_chunks": added_chunks,
+                "chunks": meta["chunks"],
+            }
+            print(f"Индекс {self.pack_name} обновлен: {report}")
+            return report
+
+
+def reindex_packs(pack_indexes, pack_names=None):
+    """Переиндексирует указанные пакеты (по умолчанию все). Возвращает отчет по каждому пакету."""
+    reports = {}
+    for name in pack_names or list(pack_indexes):
+        reports[name] = pack_indexes[name].reindex()
+    return reports
+
+
+def start_watcher(pack_indexes, interval):
+    """Запускает фоновый поток, который раз в interval секунд проверяет txt_docs на изменения."""
+    def watch():
+        while True:
+            time.sleep(interval)
+            try:
+                reindex_packs(pack_indexes)
+            except Exception as e:
+                print(f"Ошибка при переиндексации: {e}")
+
+    thread = threading.Thread(target=watch, name="txt_docs_watcher", daemon=True)
+    thread.start()
+    return thread
@@ -0,0 +1,30 @@
+# Тексты предопределенных вопросов из меню telegram_bot.py (question_id -> текст вопроса).
+# Должны совпадать с тем, что бот отправляет в /ws, иначе кеши по тексту вопроса не сработают.
+PREDEFINED_QUESTIONS = {
+    1: "Что я могу ожидать от своего PO/PM?",
+    2: "Что я могу ожидать от своего Лида?",
+    3: "Посмотерть матрицу компетенций",
+    4: "Что я могу ожидать от специалиста компетенции",
+    5: "Что я могу ожидать от своего PO/PM специалиста",
+    6: "Поиск кандидатов на рбаоту",
+    7: "Проведение собеседований",
+    8: "Работа со стажерами/джунами",
+    9: "Проведение 1-2-1",
+    10: "Проведение встреч компетенции",
+    11: "Построение структуры компетенции",
+    12: "Создание ИПР",
+    13: "Как провести онбординг",
+    14: "Оптимизация процессов разработки",
+    15: "Что я могу ожидать от специалиста",
+    16: "Что я могу ожидать от лида компетенции",
+    17: "Что ожидается от меня",
+    18: "Что я могу ожидать от специалиста компетенции?",
+    19: "Что я могу ожидать от своего PO/PM специалиста",
+    20: "Что ожидается от меня?",
+}
+
+# Роли и специализации, которые бот отправляет в /ws (у PO/PM специализация совпадает с ролью)
+BOT_PROFILES = (
+    ("PO/PM", "PO/PM"),
+    *(("Специалист", specialization) for specialization in ("Аналитик", "Тестировщик", "WEB", "Java", "Python")),
+)
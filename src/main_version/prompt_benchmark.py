@@ -0,0 +1,75 @@
+"""
+Время подготовки запроса /ws до начала генерации: сборка промпта и retrieval-цепочки
+на каждый запрос (как было) против скомпилированной цепочки из prompts.question_chain.
+
+Запуск:
+    python prompt_benchmark.py [--repeats 200]
+
+Вместо GigaChat используется заглушка (stub_llm.StubChatModel), вместо индекса — пустой ретривер,
+поэтому замеряется только подготовка, сеть и индексы не нужны.
+"""
+import argparse
+import string
+import time
+import numpy as np
+from langchain_core.prompts import ChatPromptTemplate
+from langchain_core.runnables import RunnableLambda
+from langchain.chains.combine_documents import create_stuff_documents_chain
+from langchain.chains import create_retrieval_chain
+
+from stub_llm import StubChatModel
+from prompts import QUESTION_SPECS, CUSTOM_QUESTION, question_spec, question_chain, chain_config
+
+ROLE = "Специалист"
+SPECIALIZATION = "Аналитик"
+
+
+def build_per_request(question_id, llm, retriever):
+    # Прежний путь: разбор шаблона и сборка цепочек на каждый запрос
+    filled_prompt = string.Template(question_spec(question_id).template).substitute(
+        role=ROLE, specialization=SPECIALIZATION
+    )
+    prompt = ChatPromptTemplate.from_template(filled_prompt)
+    document_chain = create_stuff_documents_chain(llm=llm, prompt=prompt)
+    return create_retrieval_chain(retriever, document_chain)
+
+
+def lookup_compiled(question_id, llm, retriever):
+    return question_chain(question_id, ROLE, SPECIALIZATION), chain_config(llm, retriever)
+
+
+def measure(setup, question_ids, llm, retriever, repeats):
+    timings = []
+    for _ in range(repeats):
+        for question_id in question_ids:
+            started = time.perf_counter()
+            setup(question_id, llm, retriever)
+            timings.append(time.perf_counter() - started)
+    return np.array(timings) * 1000
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--repeats", type=int, default=200)
+    args = parser.parse_args()
+
+    llm = StubChatModel(ttft=0.0, token_delay=0.0)
+    retriever = RunnableLambda(lambda query: [])
+    question_ids = [*QUESTION_SPECS, 777]
+    print(f"Вопросов: {len(question_ids)} (шаблоны {len(CUSTOM_QUESTION.template)}-"
+          f"{max(len(spec.template) for spec in QUESTION_SPECS.values())} символов), повторов: {args.repeats}")
+
+    # Первое обращение компилирует цепочки, дальше — только поиск в кеше
+    started = time.perf_counter()
+    for question_id in question_ids:
+        question_chain(question_id, ROLE, SPECIALIZATION)
+    print(f"Компиляция всех цепочек: {(time.perf_counter() - started) * 1000:.1f} мс")
+
+    for name, setup in (("на каждый запрос", build_per_request), ("скомпилированная", lookup_compiled)):
+        timings = measure(setup, question_ids, llm, retriever, args.repeats)
+        print(f"{name:>18}: среднее {timings.mean():.3f} мс, p50 {np.percentile(timings, 50):.3f} мс, "
+              f"p99 {np.percentile(timings, 99):.3f} мс")
+
+
+if __name__ == "__main__":
+    main()
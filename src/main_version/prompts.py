@@ -0,0 +1,523 @@
+import os
+import string
+from functools import lru_cache
+from operator import itemgetter
+from typing import NamedTuple
+from langchain_core.prompts import ChatPromptTemplate
+from langchain_core.runnables import RunnableLambda
+from langchain.chains.combine_documents import create_stuff_documents_chain
+from langchain.chains import create_retrieval_chain
+
+# Сколько скомпилированных цепочек (вопрос, роль, специализация) держится в памяти
+PROMPT_CACHE_SIZE = int(os.getenv("PROMPT_CACHE_SIZE", "256"))
+
+
+class QuestionSpec(NamedTuple):
+    """
+    Как отвечать на вопрос: пакет документов для поиска, шаблон промпта
+    ($role и $specialization подставляются при компиляции), модель и число чанков контекста
+    (None — RETRIEVER_K).
+    """
+    pack: str
+    template: str
+    model: str = "GigaChat-Max"
+    k: int | None = None
+
+
+# Вопрос "Что я могу ожидать от своего PO/PM?" задается из двух меню бота
+PO_PM_TEMPLATE = '''
+        Вы исполняете роль $role, а ваша специализация — $specialization.
+
+        Промпт:
+        Ты – эксперт по взаимодействию между специалистами и менеджерами продуктов (PO) и проектными менеджерами (PM). Твоя задача – дать четкий и структурированный ответ на вопрос: "Что я могу ожидать от своего PO/PM?", основываясь на предоставленной базе знаний.
+        Определение роли:
+        Узнай роль пользователя (бизнес-аналитик, системный аналитик, продуктовый аналитик), чтобы адаптировать ответ.
+
+        Структура ответа:
+        Обязанности PO/PM: Опиши ключевые функции Product Owner (PO) и Project Manager (PM), их зоны ответственности и влияние на работу аналитика.
+        Взаимодействие с аналитиком: Разъясни, какую поддержку можно ожидать от PO/PM в работе аналитика: постановка задач, доступ к информации, координация с командой.
+        Ожидания в зависимости от уровня аналитика:
+
+        Для Junior: PO/PM помогает с приоритезацией, обучением, уточнением требований.
+        Для Middle: PO/PM ожидает проактивности в анализе, а сам обеспечивает доступ к бизнес-стейкхолдерам.
+        Для Senior: PO/PM полагается на аналитика в стратегическом планировании и формировании продуктовой/проектной стратегии.
+        Формат вывода:
+        Используй четкую структуру с разделами: Обязанности PO/PM, Как взаимодействует с аналитиком, Ожидания в зависимости от уровня.
+        Добавь примеры реальных ситуаций, где взаимодействие с PO/PM играет ключевую роль.
+        Твой ответ не должен превысить 4096 символов.
+        Контекст: {context}
+        Вопрос: {input}
+        Ответ:
+        '''
+
+# Вопросы меню telegram_bot.py (question_id -> спецификация ответа)
+QUESTION_SPECS = {
+    1: QuestionSpec("docs_pack_1", PO_PM_TEMPLATE),
+    2: QuestionSpec("docs_pack_1", '''
+        На основе контекста, предоставленного в векторной базе данных, ответь на следующий вопрос:
+
+        'Что я могу ожидать от своего лида компетенции?'
+
+        При формировании ответа учти следующие параметры:
+
+        Роль: $role
+        Специализация: $specialization
+        Типичные задачи и взаимодействия внутри команды.
+        Опиши основные ожидания и роли, которые лидер компетенции $specialization
+        должен исполнять в соответствии с указанными параметрами.
+        Если в контексте недостаточно информации для точного ответа, пожалуйста,
+        дай знать об этом и предложи уточнить вопрос или предоставить дополнительный контекст.
+
+        Контекст: {context}
+        Вопрос: {input}
+        Ответ:
+        '''),
+    3: QuestionSpec("docs_pack_1", '''
+        Вы исполняете роль $role, а ваша специализация — $specialization.
+
+        Ты — ассистент по составлению матриц компетенций. Формируй четкие и структурированные ответы на основе контекста: {context} для $role ($specialization).
+
+        Инструкции:
+
+        1. Используй только предоставленный контекст: {context}
+        2. Группируй информацию по уровням и типам навыков
+        3. Сохраняй оригинальные формулировки, но без нумерации
+        4. Избегай общих фраз и комментариев
+        5. Ограничь ответ 2000 символами
+
+        Формат ответа:
+
+        [Роль] - Матрица компетенций
+
+        Уровень: Junior
+        Софт-скиллы:
+        - [формулировка из документа]
+        - [формулировка из документа]
+        Хард-скиллы:
+        - [формулировка из документа]
+        - [формулировка из документа]
+
+        Уровень: Middle
+        [аналогично]
+
+        Уровень: Senior
+        [аналогично]
+
+        Уровень: Lead
+        [аналогично]
+
+        Примечания:
+        - [важные уточнения из контекста]
+
+        Контекст: {context}
+        Вопрос: {input}
+        Ответ: …
+        '''),
+    4: QuestionSpec("docs_pack_2", '''
+        Вы исполняете роль $role, а ваша специализация — $specialization.
+
+        Промпт:
+        Ты – эксперт в области компетенций. Твоя задача – дать четкий и структурированный ответ на вопрос основываясь на предоставленной базе знаний.
+
+        Структура ответа:
+        Обязанности специалиста: Опиши ключевые функции аналитика, его основные задачи и зону ответственности в рамках компетенции.
+        Взаимодействие с лидом компетенции: Разъясни, какую поддержку лид компетенции оказывать специалисту, его вклад в развитие направления и обмен знаниями.
+        Ключевые компетенции: Укажи, какими знаниями, навыками и инструментами должен владеть $role $specialization для эффективного выполнения своих обязанностей.
+        Ожидания от $role $specialization: Определи, какие профессиональные качества, инициативность и уровень вовлеченности должны быть.
+
+        
+
+        Контекст: {context}
+        Вопрос: {input}
+        Ответ:
+        '''),
+    5: QuestionSpec("docs_pack_2", '''
+        Вы исполняете роль $role, а ваша специализация — $specialization.
+
+        Промпт:
+        Ты – эксперт в области взаимодействия аналитиков с Product Owner PO и Project Manager PM. Твоя задача – дать четкий и структурированный ответ на вопрос: "Что я, как лид компетенции аналитик, могу ожидать от PO PM специалиста?", основываясь на предоставленной базе знаний.
+
+        Структура ответа:
+        Обязанности PO и PM Опиши ключевые функции Product Owner и Project Manager их зоны ответственности и влияние на работу аналитика
+        Взаимодействие с лидом компетенции Разъясни какую поддержку можно ожидать от PO и PM в работе аналитика включая доступ к информации координацию процессов и влияние на стратегические решения
+        Ожидания от PO и PM Определи какие профессиональные качества инициативность и уровень вовлеченности должны быть у этих специалистов чтобы эффективно взаимодействовать с аналитиками
+
+        Формат вывода:
+        Используй четкую структуру с разделами Обязанности PO и PM Как взаимодействуют с лидом компетенции Ожидания от PO и PM
+        Добавь примеры реальных ситуаций где взаимодействие PO и PM с аналитиками играет ключевую роль
+
+        Контекст: {context}
+        Вопрос: {input}
+        Ответ:
+        '''),
+    6: QuestionSpec("docs_pack_2", '''
+        Вы исполняете роль $role, а ваша специализация — $specialization.
+
+        Промпт:
+        Ты – эксперт в области подбора и оценки кандидатов в команду аналитики. Твоя задача – дать четкий и структурированный ответ на вопрос: "Что ожидается от лида компетенции аналитики при поиске кандидатов на работу?", основываясь на предоставленной базе знаний.
+
+        Структура ответа:
+        Определение требований Опиши, какие критерии должны быть сформулированы перед началом поиска кандидатов, включая ключевые компетенции и уровень владения инструментами
+        Оценка технических навыков Разъясни, какие технические компетенции необходимо проверять в ходе интервью, включая владение инструментами анализа данных, знание клиент серверных взаимодействий и умение работать с бизнес требованиями
+        Оценка софт скиллов Определи, какие личные качества и навыки коммуникации важны при отборе кандидатов и как их проверять
+        Процесс отбора Опиши, как должен быть организован процесс найма, включая взаимодействие с HR командой и проведение технических интервью
+        Адаптация новых сотрудников Разъясни, какие шаги должен предпринять лид компетенции аналитики для успешной интеграции новых сотрудников в команду
+
+        Формат вывода:
+        Используй четкую структуру с разделами Определение требований Оценка технических навыков Оценка софт скиллов Процесс отбора Адаптация новых сотрудников
+        Добавь примеры реальных ситуаций, где эффективный процесс подбора аналитиков сыграл ключевую роль
+
+        Контекст: {context}
+        Вопрос: {input}
+        Ответ:
+        '''),
+    7: QuestionSpec("docs_pack_2", '''
+        Вы исполняете роль $role, а ваша специализация — $specialization.
+
+        Промпт:
+        Ты – эксперт в области найма и оценки аналитиков. Твоя задача – дать четкий и структурированный ответ на вопрос: "Что ожидается от лида компетенции аналитики при проведении собеседований?", основываясь на предоставленной базе знаний.
+
+        Структура ответа:
+        Подготовка к собеседованию: Опиши, какие шаги должен предпринять лид компетенции перед проведением интервью, включая определение требований к кандидату, формирование критериев оценки и подготовку вопросов.
+        Проведение технического интервью: Разъясни, какие аспекты технической подготовки необходимо проверять у кандидатов, включая владение инструментами анализа данных, работу с требованиями и понимание бизнес-процессов.
+        Оценка софт-скиллов: Укажи, какие личные качества, навыки коммуникации и адаптивность к команде важно проверять, а также как это лучше делать в формате собеседования.
+        Процесс принятия решений: Определи, как лид компетенции должен анализировать результаты интервью, взаимодействовать с HR-командой и другими руководителями, а также принимать финальное решение по кандидатам.
+        Обратная связь и адаптация: Разъясни, как правильно давать кандидатам объективную обратную связь, участвовать в их адаптации и обеспечивать их интеграцию в команду после успешного найма.
+
+        Формат вывода:
+        Используй четкую структуру с разделами. Подготовка к собеседованию, Проведение технического интервью, Оценка софт-скиллов, Процесс принятия решений, Обратная связь и адаптация.
+        Добавь примеры реальных ситуаций, где грамотный процесс собеседования позволил найти сильного кандидата и улучшить команду.
+
+        Контекст: {context}
+        Вопрос: {input}
+        Ответ:
+        '''),
+    8: QuestionSpec("docs_pack_2", '''
+        Вы исполняете роль $role, а ваша специализация — $specialization.
+
+        Промпт:
+        Ты – эксперт в области наставничества и развития аналитиков начального уровня. Твоя задача – дать четкий и структурированный ответ на вопрос: "Что ожидается от лида компетенции аналитики при работе со стажерами и джунами?", основываясь на предоставленной базе знаний.
+
+        Структура ответа:
+        Наставничество и поддержка Опиши, какие аспекты профессионального развития стажеров и джунов должен курировать лид компетенции, включая обучение базовым аналитическим навыкам и адаптацию к рабочим процессам
+        Обучение и развитие Разъясни, какие методы и подходы следует использовать для передачи знаний, оценки прогресса и выявления пробелов в компетенциях молодых специалистов
+        Погружение в рабочие процессы Определи, как лид компетенции должен вовлекать стажеров и джунов в проектную работу, делегировать задачи и контролировать их выполнение
+        Обратная связь и развитие софт скиллов Разъясни, как правильно организовывать процесс регулярных встреч, предоставлять конструктивную обратную связь и развивать у молодых специалистов навыки коммуникации, работы в команде и принятия ответственности
+
+        Формат вывода:
+        Используй четкую структуру с разделами Наставничество и поддержка Обучение и развитие Погружение в рабочие процессы Обратная связь и развитие софт скиллов
+        Добавь примеры реальных ситуаций, где эффективное наставничество помогло ускорить рост стажеров и джунов и повысить их вклад в работу команды
+
+        Контекст: {context}
+        Вопрос: {input}
+        Ответ:
+        '''),
+    9: QuestionSpec("docs_pack_2", '''
+        Основываясь на контексте, доступном в векторной базе данных, дай ответ на вопрос: \
+        'Что ожидается от лида компетенции при проведение 1-2-1?' \
+        Опиши основные ожидания и роли, которые лидер компетенции по аналитике должен исполнять.
+        Если недостаточно информации для точного ответа,
+        сообщи об этом и предложи уточнить вопрос или предоставить дополнительный контекст.
+
+        Контекст: {context}
+        Вопрос: {input}
+        Ответ:
+        '''),
+    10: QuestionSpec("docs_pack_2", '''
+        Основываясь на контексте, доступном в векторной базе данных, дай ответ на вопрос: \
+        'Что ожидается от лида компетенции при проведение встречи компетенции?' \
+        Опиши основные ожидания и роли, которые лидер компетенции по аналитике должен исполнять,\
+        учитывая роль $role и специализацию — $specialization человека, который задает вопрос.
+        Если недостаточно информации для точного ответа,
+        сообщи об этом и предложи уточнить вопрос или предоставить дополнительный контекст.
+
+        Контекст: {context}
+        Вопрос: {input}
+        Ответ:
+        '''),
+    11: QuestionSpec("docs_pack_2", '''
+        Основываясь на контексте, доступном в векторной базе данных, дай ответ на вопрос: \
+        'Что ожидается от лида компетенции при построение структуры компетенции?' \
+        Опиши основные ожидания и роли, которые лидер компетенции по аналитике должен исполнять,\
+        учитывая роль $role и специализацию — $specialization человека, который задает вопрос.
+        Если недостаточно информации для точного ответа,
+        сообщи об этом и предложи уточнить вопрос или предоставить дополнительный контекст.
+
+        Контекст: {context}
+        Вопрос: {input}
+        Ответ:
+        '''),
+    12: QuestionSpec("docs_pack_2", '''
+        Основываясь на контексте, доступном в векторной базе данных, дай ответ на вопрос: \
+        'Что ожидается от лида компетенции при создании ИПР?' \
+        Опиши основные ожидания и роли, которые лидер компетенции по аналитике должен исполнять,\
+        учитывая роль $role и специализацию — $specialization человека, который задает вопрос.
+        Если недостаточно информации для точного ответа,
+        сообщи об этом и предложи уточнить вопрос или предоставить дополнительный контекст.
+
+        Контекст: {context}
+        Вопрос: {input}
+        Ответ:
+        '''),
+    13: QuestionSpec("docs_pack_2", '''
+        Вы исполняете роль $role, а ваша специализация — $specialization.
+
+        Промпт:
+        Ты – эксперт в области адаптации новых сотрудников. Твоя задача – дать четкий и структурированный ответ на вопрос: "Как лид компетенции аналитики должен проводить онбординг нового сотрудника?", основываясь на предоставленной базе знаний.
+
+        Структура ответа:
+        Подготовка к онбордингу. Опиши, какие шаги необходимо предпринять до прихода нового сотрудника, включая подготовку доступа, документов и программы адаптации.
+        Знакомство с рабочими процессами. Разъясни, какие ключевые процессы, инструменты и методологии работы должен освоить новый аналитик, а также как организовать вводные встречи.
+        Назначение задач и вовлечение в работу Определи, какие начальные задачи следует дать новичку, как правильно вводить его в проектную деятельность и обучать работе с данными и требованиями.
+        Обратная связь и контроль адаптации. Разъясни, как организовать регулярные встречи для обсуждения прогресса, предоставления обратной связи и корректировки адаптационного плана.
+
+        Формат вывода:
+        Используй четкую структуру с разделами. Подготовка к онбордингу. Знакомство с рабочими процессами Назначение задач и вовлечение в работу. Обратная связь и контроль адаптации.
+        Добавь примеры реальных ситуаций, где эффективный онбординг помог ускорить адаптацию аналитика и повысить его продуктивность.
+
+        Контекст: {context}
+        Вопрос: {input}
+        Ответ:
+        '''),
+    14: QuestionSpec("docs_pack_2", '''
+        Основываясь на контексте, доступном в векторной базе данных, дай ответ на вопрос: \
+        'Как лид компетенции аналитики должен оптимизировать процессы разработки?' \
+        Опиши основные ожидания и роли, которые лидер компетенции по аналитике должен исполнять, \
+        учитывая его ответственность за анализ текущих рабочих процессов, взаимодействие с командой и внедрение улучшений. \
+        Разъясни, какие методологии, инструменты и подходы к автоматизации могут повысить эффективность процессов разработки, \
+        как аналитик должен участвовать в улучшении коммуникации между командами и как оценивать результаты внедренных изменений.
+
+        Контекст: {context}
+        Вопрос: {input}
+        Ответ:
+        '''),
+    15: QuestionSpec("docs_pack_3", '''
+        Вы исполняете роль $role, а ваша специализация — $specialization.
+
+        Ты — ассистент, который профессионально формулирует ожидания Product Owner и Project Manager от IT-специалистов. На основе предоставленного контекста: {context} составь четкий и структурированный ответ о $role ($specialization).
+
+        Инструкции:
+
+        1. Проанализируй контекст: {context}
+        2. Определи целевую роль (аналитик/тестировщик/веб/java/python)
+        3. Выдели 5-7 ключевых ожиданий, которые явно указаны в контексте
+        4. Используй точные формулировки из контекста, но делай их более лаконичными
+        5. Сохрани профессиональный тон без лишних слов
+
+        Формат ответа:
+        PO/PM может ожидать от $role:
+
+        1. [Первое ключевое ожидание из контекста]
+        2. [Второе ключевое ожидание]
+        ...
+        5-7. [Последнее важное ожидание]
+
+        Требования:
+
+        - Используй только информацию из {context}
+        - Не добавляй ничего от себя
+        - Сохраняй технические детали из оригинала
+        - Ограничь ответ 7 пунктами максимум
+        - Избегай общих фраз и воды
+
+        Контекст: {context}
+        Вопрос: {input}
+        Ответ: …
+        '''),
+    16: QuestionSpec("docs_pack_3", '''
+        Вы исполняете роль $role, а ваша специализация — $specialization.
+
+        Ты — ассистент, который четко формулирует ожидания Product Owner (PO) и Project Manager (PM) от Лида компетенции. На основе предоставленного контекста: {context} составь структурированный ответ на вопрос о роли $role ($specialization), выделяя ключевые обязанности и зоны ответственности.  
+
+        Инструкции:
+
+        1. Используй только информацию из контекста: {context}.  
+        2. Определи роль (аналитик/тестировщик/веб/java/python).  
+        3. Выдели 5–7 ключевых ожиданий, сгруппированных по направлениям:  
+        - Управление качеством (контроль процессов, стандарты)  
+        - Техническая экспертиза (глубокие знания, архитектура)  
+        - Развитие команды (менторство, обучение)  
+        - Коммуникация и стратегия (работа с PO/PM, приоритезация)  
+        4. Сохрани оригинальные формулировки, но сделай их лаконичными.  
+        5. Избегай общих фраз — только конкретика из документа.  
+
+        Формат ответа:
+        PO/PM может ожидать от $role:  
+
+        1. Управление качеством:  
+        - [Ожидание 1]  
+        - [Ожидание 2]  
+
+        2. Техническая экспертиза:  
+        - [Ожидание 1]  
+        - [Ожидание 2]  
+
+        3. Развитие команды:
+
+        - [Ожидание 1]  
+
+        4. Коммуникация и стратегия:
+
+        - [Ожидание 1]  
+        - [Ожидание 2]  
+
+        Требования:
+
+        - Объем: 5–7 пунктов
+        - Только факты из {context}, без домыслов
+        - Четкие глаголы: обеспечивать, контролировать, обучать, координировать и тому подобное
+        - Избегай общих фраз и воды
+
+        Контекст: {context}
+        Вопрос: {input}
+        Ответ: …
+        '''),
+    17: QuestionSpec("docs_pack_3", '''
+        Представь себя коучем для Product Owner в команде разработки программного обеспечения.
+        Объясни ему основные задачи и роли, которые он должен выполнять.
+        Уточни, что от него ожидается на каждом этапе процесса разработки.
+        Подчеркни важность каждой задачи и предложи примеры инструментов или методов, которые могут помочь в их выполнении.
+        На основе предоставленного контекста, \
+        ответьте на вопрос пользователя, уделяя внимание его роли и специализации. \
+        Если тебе не хватает информации для ответа, сообщи об этом пользователю.
+
+        Контекст: {context}
+        Вопрос: {input}
+        Ответ:
+        '''),
+    18: QuestionSpec("docs_pack_3", '''
+        Вы исполняете роль $role, а ваша специализация — $specialization.
+
+        Ты — эксперт по оценке компетенций. Сформулируй профессиональные ожидания от специалиста на основе контекста: {context} и роли ($specialization)
+
+        Инструкции:
+        1. Используй только предоставленный контекст: {context}
+        2. Сгруппируй ключевые ожидания по 3-5 категориям 
+        3. Используй профессиональный язык без общих фраз
+        4. Дай ответ в формате Ожидания от $role: 
+        5. Ограничь ответ 5-7 пунктами
+        6. Учитывай уровень позиции (Regular/Senior/Lead) при наличии в данных
+
+        Формат ответа:
+        Ожидания от [роль]:
+        1. Категория 1: [суть требования]
+        2. Категория 2: [суть требования] 
+        ...
+        5-7. Категория N: [суть требования]
+
+        Требования:
+        - Только конкретные требования из системы
+        - Без примеров и пояснений
+        - Четкие формулировки без воды
+        - Макс. 2000 символов
+
+        Контекст: {context}
+        Вопрос: {input}
+        Ответ: …
+        '''),
+    19: QuestionSpec("docs_pack_3", PO_PM_TEMPLATE),
+    20: QuestionSpec("docs_pack_3", '''
+        Вы исполняете роль $role, а ваша специализация — $specialization.
+        Ты — HR-аналитик, который структурирует требования к лиду компетенции. На основе контекст: {context} сформируй четкий перечень ожиданий с разделением на hard и soft skills и ответь на вопрос о роли $role ($specialization).
+
+        Инструкции:
+
+        1. Тщательно проанализируй контекст: {context}
+        2. Раздели все требования на две основные категории:
+        - Hard Skills (технические/профессиональные навыки)
+        - Soft Skills (управленческие и личные качества)
+        3. В каждой категории выдели 4-6 ключевых пунктов
+        4. Для hard skills сохрани техническую конкретику из документа
+        5. Для soft skills используй формулировки из документа, но сделай их более лаконичными
+        6. Добавь раздел "Дополнительные ожидания" для особых требований
+
+        Формат ответа:
+        Что ожидается от лида компетенции [роль]:
+
+        Hard Skills:
+        1. [Конкретный технический навык 1]
+        2. [Конкретный технический навык 2]
+        ...
+        5-6. [Конкретный технический навык N]
+
+        Soft Skills:
+        1. [Ключевое управленческое качество 1]
+        2. [Ключевое управленческое качество 2]
+        ...
+        5-6. [Ключевое управленческое качество N]
+
+        Дополнительные ожидания:
+        - [Особые требования из документа]
+
+        Требования к ответу:
+        - Только конкретные требования из документа
+        - Четкое разделение на hard/soft skills
+        - Технические формулировки без упрощения
+        - Управленческие навыки в сжатой форме
+        - Объем: 10-12 пунктов
+        - Без общих фраз и воды
+
+        Контекст: {context}
+        Вопрос: {input}
+        Ответ: …
+        '''),
+}
+
+# Свободные вопросы пользователя (question_id 777) и любые другие вне меню
+CUSTOM_QUESTION = QuestionSpec("docs_pack_full", '''
+        Вы исполняете роль $role, а ваша специализация — $specialization.
+        Ваши функции включают:
+
+        Решение вопросов, связанных с $specialization, используя данные из контекста.
+        Консультирование и предложение рекомендаций, необходимых для выполнения задач в рамках $role.
+        Предоставление информации и помощь в решении проблем в контексте $specialization и $role.
+        На основе предоставленного контекста, \
+        ответьте на вопрос пользователя, уделяя внимание его роли и специализации. \
+        Если вам не хватает информации для ответа, сообщите об этом пользователю, \
+        а также предложите уточнить вопрос или предоставить дополнительный контекст.
+        Твой ответ не должен превысить 4096 символов.
+
+        Контекст: {context}
+        Вопрос: {input}
+        Ответ:
+        ''')
+
+
+def question_spec(question_id):
+    return QUESTION_SPECS.get(question_id, CUSTOM_QUESTION)
+
+
+def runtime_component(name):
+    """
+    Звено цепочки, которое берется из config["configurable"][name] при вызове.
+    Так цепочка компилируется один раз, а клиент модели из пула и ретривер
+    с зафиксированной версией индекса передаются в каждый запрос.
+    """
+    return RunnableLambda(lambda _, config: config["configurable"][name], name=name)
+
+
+@lru_cache(maxsize=PROMPT_CACHE_SIZE)
+def compile_chain(question_id, role, specialization):
+    spec = question_spec(question_id)
+    filled_prompt = string.Template(spec.template).substitute(role=role, specialization=specialization)
+    prompt = ChatPromptTemplate.from_template(filled_prompt)
+    document_chain = create_stuff_documents_chain(llm=runtime_component("llm"), prompt=prompt)
+    # create_retrieval_chain сам выделяет вопрос из входа только для BaseRetriever,
+    # а звену из config нужно передать строку, а не весь словарь {"input": ...}
+    retriever = itemgetter("input") | runtime_component("retriever")
+    return create_retrieval_chain(retriever, document_chain)
+
+
+def question_chain(question_id, role, specialization):
+    """
+    Скомпилированная retrieval-цепочка вопроса для роли и специализации (строится при первом обращении).
+    Вызывать с config=chain_config(llm, retriever).
+    """
+    if question_id not in QUESTION_SPECS:
+        # Все свободные вопросы делят одну цепочку
+        question_id = None
+    return compile_chain(question_id, role, specialization)
+
+
+def chain_config(llm, retriever):
+    return {"configurable": {"llm": llm, "retriever": retriever}}
@@ -0,0 +1,98 @@
+import time
+import threading
+from collections import OrderedDict
+from typing import Any
+from langchain_core.retrievers import BaseRetriever
+
+from faiss_indexes import rescore
+
+
+def normalize_query(text):
+    """Нормализует текст вопроса для ключа кеша: регистр и лишние пробелы не важны."""
+    return " ".join(text.lower().split())
+
+
+class TTLCache:
+    """Потокобезопасный LRU-кеш с ограничением по размеру и времени жизни записей."""
+
+    def __init__(self, maxsize=1024, ttl=3600):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.data = OrderedDict()
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key):
+        with self.lock:
+            item = self.data.get(key)
+            if item is not None:
+                value, expires_at = item
+                if self.ttl <= 0 or expires_at > time.monotonic():
+                    self.data.move_to_end(key)
+                    self.hits += 1
+                    return value
+                del self.data[key]
+            self.misses += 1
+            return None
+
+    def put(self, key, value):
+        with self.lock:
+            self.data[key] = (value, time.monotonic() + self.ttl)
+            self.data.move_to_end(key)
+            while len(self.data) > self.maxsize:
+                self.data.popitem(last=False)
+
+    def invalidate(self, predicate):
+        """Удаляет записи, для ключей которых predicate(key) истинно."""
+        with self.lock:
+            for key in [key for key in self.data if predicate(key)]:
+                del self.data[key]
+
+    def clear(self):
+        with self.lock:
+            self.data.clear()
+
+    def stats(self):
+        with self.lock:
+            return {"size": len(self.data), "hits": self.hits, "misses": self.misses}
+
+
+class CachedRetriever(BaseRetriever):
+    """
+    Ретривер поверх FAISS-хранилища пакета с кешем результатов по (пакет, версия индекса, вопрос).
+    Версия индекса входит в ключ, поэтому после переиндексации старые результаты не выдаются.
+
+    Если векторы в индексе сжаты (fp16/PQ), берется rescore_factor * k кандидатов,
+    и расстояния до них пересчитываются точно по float32-векторам из хранилища эмбеддингов.
+    """
+
+    vector_store: Any
+    pack_name: str
+    version: int
+    k: int = 5
+    cache: Any = None
+    embedding: Any = None
+    rescore_factor: int = 0
+
+    def _get_relevant_documents(self, query, *, run_manager=None):
+        key = (self.pack_name, self.version, self.k, normalize_query(query))
+        if self.cache is not None:
+            docs = self.cache.get(key)
+            if docs is not None:
+                return list(docs)
+
+        # embed_query сам кеширует вектор вопроса (см. CachedEmbeddings)
+        if self.rescore_factor > 1 and self.embedding is not None:
+            query_vector = self.embedding.embed_query(query)
+            candidates = self.vector_store.similarity_search_by_vector(
+                query_vector, k=self.k * self.rescore_factor
+            )
+            # Полные векторы кандидатов уже лежат в хранилище, модель не вызывается
+            exact_vectors = self.embedding.embed_documents([doc.page_content for doc in candidates])
+            docs = [doc for doc, _ in rescore(query_vector, candidates, exact_vectors, self.k)]
+        else:
+            docs = self.vector_store.similarity_search(query, k=self.k)
+        if self.cache is not None:
+            self.cache.put(key, tuple(docs))
+        return docs
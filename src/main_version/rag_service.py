@@ -1,22 +1,31 @@
 import os
 from dotenv import load_dotenv
 import string
+import time
 import asyncio
-from fastapi import FastAPI, WebSocket
-import websockets
-from langchain_community.document_loaders import TextLoader
-from langchain_community.document_loaders import PyPDFLoader
-from langchain.text_splitter import RecursiveCharacterTextSplitter
-from langchain_community.embeddings import HuggingFaceEmbeddings
-from langchain_community.vectorstores import FAISS
-from langchain_community.chat_models import GigaChat
-from langchain_gigachat import GigaChat
-from langchain_huggingface import HuggingFaceEmbeddings
-from langchain_core.documents import Document
-from langchain.chains.combine_documents import create_stuff_documents_chain
-from langchain_core.prompts import ChatPromptTemplate
-from langchain.chains import create_retrieval_chain
-from langchain.retrievers import EnsembleRetriever
+from fastapi import FastAPI, WebSocket, Header, HTTPException
+from fastapi.responses import JSONResponse, PlainTextResponse
+from langchain_core.runnables import RunnableLambda
+from index_store import read_manifest
+from pack_index import reindex_packs, start_watcher
+from unified_index import UNIFIED_INDEX_NAME
+from index_registry import IndexRegistry
+from index_factory import load_base_embedding, create_ingestion_pipeline, make_index_loaders
+from embedding_store import EmbeddingStore, CachedEmbeddings
+from rag_cache import TTLCache
+from answer_cache import SemanticAnswerCache, answer_key
+from context_compression import SentenceEmbeddings, compress_context
+from dialogue_memory import DialogueMemory
+from llm_pool import create_llm_pools
+from scheduler import GenerationScheduler, Overloaded, INTERACTIVE, BACKGROUND, PRIORITY_NAMES
+from single_flight import SingleFlight
+from resilience import (
+    FallbackGenerator, FallbackAnswer, GenerationFailed, GenerationInterrupted, chunk_text, extractive_answer,
+)
+from metrics import REGISTRY
+from predefined_questions import PREDEFINED_QUESTIONS, BOT_PROFILES
+from prompts import question_spec, question_chain, chain_config
+from rag_settings import CHUNK_SIZE, CHUNK_OVERLAP, INDEX_LAYOUT, INDEX_SOURCE
 
 load_dotenv()
 # Инициализация FastAPI
@@ -24,678 +33,298 @@ app = FastAPI()
 
 api_key = os.getenv("GIGACHAT_API_KEY")
 
-folder_path_1 = os.path.join(os.path.dirname(__file__), "txt_docs/docs_pack_1")
-folder_path_2 = os.path.join(os.path.dirname(__file__), "txt_docs/docs_pack_2")
-folder_path_3 = os.path.join(os.path.dirname(__file__), "txt_docs/docs_pack_3")
-
-folder_path_full = os.path.join(os.path.dirname(__file__), "txt_docs/docs_pack_full")
-
-def create_docs_from_txt(folder_path):
-    # Получаем список всех файлов .txt в указанной директории
-    file_paths = [os.path.join(folder_path, f) for f in os.listdir(folder_path) if f.endswith(".txt")]
-
-    # Список для хранения загруженных документов
-    docs = []
-
-    # Загружаем текст из файлов
-    for file_path in file_paths:
-        loader = TextLoader(file_path)
-        docs.extend(loader.load())
-
-    # Разделяем текст на чанки
-    text_splitter = RecursiveCharacterTextSplitter(
-        chunk_size=500,  # Размер чанка
-        chunk_overlap=100  # Перекрытие между чанками
-    )
-    split_docs = text_splitter.split_documents(docs)
-    return split_docs
-
-# Документы по Специалисту аналитику
-split_docs_1 = create_docs_from_txt(folder_path_1)
-# Документы по Лиду аналитику
-split_docs_2 = create_docs_from_txt(folder_path_2)
-# Документы по PO/PM
-split_docs_3 = create_docs_from_txt(folder_path_3)
-# Полный пакет
-split_docs_full = create_docs_from_txt(folder_path_full)
-
 # Инициализация модели для эмбеддингов
-model_name = "sentence-transformers/paraphrase-multilingual-mpnet-base-v2"
-model_kwargs = {'device': 'cpu'}
-encode_kwargs = {'normalize_embeddings': False}
-embedding = HuggingFaceEmbeddings(
-    model_name=model_name,
-    model_kwargs=model_kwargs,
-    encode_kwargs=encode_kwargs
-)
-
-# Создание векторного хранилища 1
-vector_store_1 = FAISS.from_documents(split_docs_1, embedding=embedding)
-embedding_retriever_1 = vector_store_1.as_retriever(search_kwargs={"k": 5})
+base_embedding, embedding_key = load_base_embedding()
 
-# Создание векторного хранилища 2
-vector_store_2 = FAISS.from_documents(split_docs_2, embedding=embedding)
-embedding_retriever_2 = vector_store_2.as_retriever(search_kwargs={"k": 5})
+# Все индексы строятся через общее хранилище эмбеддингов:
+# каждый уникальный чанк кодируется моделью один раз для всех пакетов
+embedding_store = EmbeddingStore()
 
-# Создание векторного хранилища 3
-vector_store_3 = FAISS.from_documents(split_docs_3, embedding=embedding)
-embedding_retriever_3 = vector_store_3.as_retriever(search_kwargs={"k": 5})
-
-# Создание векторного хранилища со всеми данными
-vector_store_full = FAISS.from_documents(split_docs_full, embedding=embedding)
-embedding_retriever_full = vector_store_full.as_retriever(search_kwargs={"k": 5})
-
-
-# Инициализация модели GigaChat
-
-def create_retrieval_chain_from_folder(role, specialization, prompt_template, embedding_retriever):
+# Кеш векторов вопросов (нормализованный текст -> вектор) и результатов поиска ((пакет, вопрос) -> чанки)
+query_embedding_cache = TTLCache(
+    maxsize=int(os.getenv("QUERY_CACHE_SIZE", "2048")),
+    ttl=int(os.getenv("QUERY_CACHE_TTL", "86400")),
+)
+retrieval_cache = TTLCache(
+    maxsize=int(os.getenv("RETRIEVAL_CACHE_SIZE", "2048")),
+    ttl=int(os.getenv("RETRIEVAL_CACHE_TTL", "86400")),
+)
+embedding = CachedEmbeddings(base_embedding, embedding_key, embedding_store, query_cache=query_embedding_cache)
+# Векторы предложений для сжатия контекста (CONTEXT_TOKEN_BUDGET) держатся только в памяти
+sentence_embedding = SentenceEmbeddings(embedding, base_embedding)
+
+# Семантический кеш первых ответов: перефразированный свободный вопрос той же роли и специализации
+# получает сохраненный ответ без поиска и генерации, ответы на вопросы меню — запасные при сбое модели
+answer_cache = SemanticAnswerCache(
+    threshold=float(os.getenv("ANSWER_CACHE_THRESHOLD", "0.92")),
+    ttl=int(os.getenv("ANSWER_CACHE_TTL", "86400")),
+    stale_ttl=int(os.getenv("ANSWER_CACHE_STALE_TTL", "604800")),
+    maxsize=int(os.getenv("ANSWER_CACHE_SIZE", "2000")),
+)
 
-    # Заполнение шаблона промпта
-    template = string.Template(prompt_template)
-    filled_prompt = template.substitute(role=role, specialization=specialization)
+ingestion_pipeline = create_ingestion_pipeline(embedding)
 
-    # Создание промпта
-    prompt = ChatPromptTemplate.from_template(filled_prompt)
+# Режим поиска: dense (только FAISS) или hybrid (BM25 + FAISS)
+RETRIEVER_MODE = os.getenv("RETRIEVER_MODE", "dense")
 
-    llm = GigaChat(
-    credentials=api_key,
-    model='GigaChat-Max',
-    verify_ssl_certs=False,
-    profanity_check=False
+# INDEX_SOURCE=artifacts: индексы только читаются из офлайн-сборки (build_index.py), корпус не кодируется
+build_manifest = (
+    read_manifest(embedding_key, CHUNK_SIZE, CHUNK_OVERLAP, INDEX_LAYOUT) if INDEX_SOURCE == "artifacts" else None
 )
 
-    # Создание цепочки для работы с документами
-    document_chain = create_stuff_documents_chain(
-        llm=llm,
-        prompt=prompt
-    )
-
-    # Создание retrieval_chain
-    retrieval_chain = create_retrieval_chain(embedding_retriever, document_chain)
-
-    return retrieval_chain
+index_loaders = make_index_loaders(
+    embedding, embedding_key, ingestion_pipeline.run,
+    manifest=build_manifest,
+    k=int(os.getenv("RETRIEVER_K", "5")),
+    retrieval_cache=retrieval_cache,
+    retriever_mode=RETRIEVER_MODE,
+    sparse_weight=float(os.getenv("HYBRID_SPARSE_WEIGHT", "0.5")),
+)
 
-@app.websocket("/ws")
-async def websocket_endpoint(websocket: WebSocket):
-    """Обрабатывает WebSocket соединение и передает стриминг ответа GigaChat."""
-    await websocket.accept()
-    question = await websocket.receive_text()
-    role = await websocket.receive_text()
-    specialization = await websocket.receive_text()
-    question_id = await websocket.receive_text()
-    context = await websocket.receive_text()
-    print(context)
-    count = await websocket.receive_text()
-    question_id = int(question_id)
-    count = int(count)
-    print(question)
-    print(role)
-    print(specialization)
-    print(f"количество {count}")
-    print(f"айди {question_id}")
-    prompt_template = ""
-    embedding_retriever = embedding_retriever_full
-    if (question_id == 1):
-        embedding_retriever = embedding_retriever_1
-        prompt_template = '''
-        Вы исполняете роль $role, а ваша специализация — $specialization.
-
-        Промпт:
-        Ты – эксперт по взаимодействию между специалистами и менеджерами продуктов (PO) и проектными менеджерами (PM). Твоя задача – дать четкий и структурированный ответ на вопрос: "Что я могу ожидать от своего PO/PM?", основываясь на предоставленной базе знаний.
-        Определение роли:
-        Узнай роль пользователя (бизнес-аналитик, системный аналитик, продуктовый аналитик), чтобы адаптировать ответ.
-
-        Структура ответа:
-        Обязанности PO/PM: Опиши ключевые функции Product Owner (PO) и Project Manager (PM), их зоны ответственности и влияние на работу аналитика.
-        Взаимодействие с аналитиком: Разъясни, какую поддержку можно ожидать от PO/PM в работе аналитика: постановка задач, доступ к информации, координация с командой.
-        Ожидания в зависимости от уровня аналитика:
-
-        Для Junior: PO/PM помогает с приоритезацией, обучением, уточнением требований.
-        Для Middle: PO/PM ожидает проактивности в анализе, а сам обеспечивает доступ к бизнес-стейкхолдерам.
-        Для Senior: PO/PM полагается на аналитика в стратегическом планировании и формировании продуктовой/проектной стратегии.
-        Формат вывода:
-        Используй четкую структуру с разделами: Обязанности PO/PM, Как взаимодействует с аналитиком, Ожидания в зависимости от уровня.
-        Добавь примеры реальных ситуаций, где взаимодействие с PO/PM играет ключевую роль.
-        Твой ответ не должен превысить 4096 символов.
-        Контекст: {context}
-        Вопрос: {input}
-        Ответ:
-        '''
-    elif (question_id == 2):
-        embedding_retriever = embedding_retriever_1
-
-        prompt_template = '''
-        На основе контекста, предоставленного в векторной базе данных, ответь на следующий вопрос:
-
-        'Что я могу ожидать от своего лида компетенции?'
-
-        При формировании ответа учти следующие параметры:
-
-        Роль: $role
-        Специализация: $specialization
-        Типичные задачи и взаимодействия внутри команды.
-        Опиши основные ожидания и роли, которые лидер компетенции $specialization
-        должен исполнять в соответствии с указанными параметрами.
-        Если в контексте недостаточно информации для точного ответа, пожалуйста,
-        дай знать об этом и предложи уточнить вопрос или предоставить дополнительный контекст.
-
-        Контекст: {context}
-        Вопрос: {input}
-        Ответ:
-        '''
-    elif (question_id == 3):
-        embedding_retriever = embedding_retriever_1
-
-        prompt_template = '''
-        Вы исполняете роль $role, а ваша специализация — $specialization.
-
-        Ты — ассистент по составлению матриц компетенций. Формируй четкие и структурированные ответы на основе контекста: {context} для $role ($specialization).
-
-        Инструкции:
-
-        1. Используй только предоставленный контекст: {context}
-        2. Группируй информацию по уровням и типам навыков
-        3. Сохраняй оригинальные формулировки, но без нумерации
-        4. Избегай общих фраз и комментариев
-        5. Ограничь ответ 2000 символами
-
-        Формат ответа:
-
-        [Роль] - Матрица компетенций
-
-        Уровень: Junior
-        Софт-скиллы:
-        - [формулировка из документа]
-        - [формулировка из документа]
-        Хард-скиллы:
-        - [формулировка из документа]
-        - [формулировка из документа]
-
-        Уровень: Middle
-        [аналогично]
-
-        Уровень: Senior
-        [аналогично]
-
-        Уровень: Lead
-        [аналогично]
-
-        Примечания:
-        - [важные уточнения из контекста]
-
-        Контекст: {context}
-        Вопрос: {input}
-        Ответ: …
-        '''
-    elif (question_id == 4):
-        embedding_retriever = embedding_retriever_2
-
-        prompt_template = '''
-        Вы исполняете роль $role, а ваша специализация — $specialization.
-
-        Промпт:
-        Ты – эксперт в области компетенций. Твоя задача – дать четкий и структурированный ответ на вопрос основываясь на предоставленной базе знаний.
-
-        Структура ответа:
-        Обязанности специалиста: Опиши ключевые функции аналитика, его основные задачи и зону ответственности в рамках компетенции.
-        Взаимодействие с лидом компетенции: Разъясни, какую поддержку лид компетенции оказывать специалисту, его вклад в развитие направления и обмен знаниями.
-        Ключевые компетенции: Укажи, какими знаниями, навыками и инструментами должен владеть $role $specialization для эффективного выполнения своих обязанностей.
-        Ожидания от $role $specialization: Определи, какие профессиональные качества, инициативность и уровень вовлеченности должны быть.
-
-        
-
-        Контекст: {context}
-        Вопрос: {input}
-        Ответ:
-        '''
-    elif (question_id == 5):
-        embedding_retriever = embedding_retriever_2
-        prompt_template = '''
-        Вы исполняете роль $role, а ваша специализация — $specialization.
-
-        Промпт:
-        Ты – эксперт в области взаимодействия аналитиков с Product Owner PO и Project Manager PM. Твоя задача – дать четкий и структурированный ответ на вопрос: "Что я, как лид компетенции аналитик, могу ожидать от PO PM специалиста?", основываясь на предоставленной базе знаний.
-
-        Структура ответа:
-        Обязанности PO и PM Опиши ключевые функции Product Owner и Project Manager их зоны ответственности и влияние на работу аналитика
-        Взаимодействие с лидом компетенции Разъясни какую поддержку можно ожидать от PO и PM в работе аналитика включая доступ к информации координацию процессов и влияние на стратегические решения
-        Ожидания от PO и PM Определи какие профессиональные качества инициативность и уровень вовлеченности должны быть у этих специалистов чтобы эффективно взаимодействовать с аналитиками
-
-        Формат вывода:
-        Используй четкую структуру с разделами Обязанности PO и PM Как взаимодействуют с лидом компетенции Ожидания от PO и PM
-        Добавь примеры реальных ситуаций где взаимодействие PO и PM с аналитиками играет ключевую роль
-
-        Контекст: {context}
-        Вопрос: {input}
-        Ответ:
-        '''
-    elif (question_id == 6):
-        embedding_retriever = embedding_retriever_2
-        prompt_template = '''
-        Вы исполняете роль $role, а ваша специализация — $specialization.
-
-        Промпт:
-        Ты – эксперт в области подбора и оценки кандидатов в команду аналитики. Твоя задача – дать четкий и структурированный ответ на вопрос: "Что ожидается от лида компетенции аналитики при поиске кандидатов на работу?", основываясь на предоставленной базе знаний.
-
-        Структура ответа:
-        Определение требований Опиши, какие критерии должны быть сформулированы перед началом поиска кандидатов, включая ключевые компетенции и уровень владения инструментами
-        Оценка технических навыков Разъясни, какие технические компетенции необходимо проверять в ходе интервью, включая владение инструментами анализа данных, знание клиент серверных взаимодействий и умение работать с бизнес требованиями
-        Оценка софт скиллов Определи, какие личные качества и навыки коммуникации важны при отборе кандидатов и как их проверять
-        Процесс отбора Опиши, как должен быть организован процесс найма, включая взаимодействие с HR командой и проведение технических интервью
-        Адаптация новых сотрудников Разъясни, какие шаги должен предпринять лид компетенции аналитики для успешной интеграции новых сотрудников в команду
-
-        Формат вывода:
-        Используй четкую структуру с разделами Определение требований Оценка технических навыков Оценка софт скиллов Процесс отбора Адаптация новых сотрудников
-        Добавь примеры реальных ситуаций, где эффективный процесс подбора аналитиков сыграл ключевую роль
-
-        Контекст: {context}
-        Вопрос: {input}
-        Ответ:
-        '''
-    elif (question_id == 7):
-        embedding_retriever = embedding_retriever_2
-        prompt_template = '''
-        Вы исполняете роль $role, а ваша специализация — $specialization.
-
-        Промпт:
-        Ты – эксперт в области найма и оценки аналитиков. Твоя задача – дать четкий и структурированный ответ на вопрос: "Что ожидается от лида компетенции аналитики при проведении собеседований?", основываясь на предоставленной базе знаний.
-
-        Структура ответа:
-        Подготовка к собеседованию: Опиши, какие шаги должен предпринять лид компетенции перед проведением интервью, включая определение требований к кандидату, формирование критериев оценки и подготовку вопросов.
-        Проведение технического интервью: Разъясни, какие аспекты технической подготовки необходимо проверять у кандидатов, включая владение инструментами анализа данных, работу с требованиями и понимание бизнес-процессов.
-        Оценка софт-скиллов: Укажи, какие личные качества, навыки коммуникации и адаптивность к команде важно проверять, а также как это лучше делать в формате собеседования.
-        Процесс принятия решений: Определи, как лид компетенции должен анализировать результаты интервью, взаимодействовать с HR-командой и другими руководителями, а также принимать финальное решение по кандидатам.
-        Обратная связь и адаптация: Разъясни, как правильно давать кандидатам объективную обратную связь, участвовать в их адаптации и обеспечивать их интеграцию в команду после успешного найма.
-
-        Формат вывода:
-        Используй четкую структуру с разделами. Подготовка к собеседованию, Проведение технического интервью, Оценка софт-скиллов, Процесс принятия решений, Обратная связь и адаптация.
-        Добавь примеры реальных ситуаций, где грамотный процесс собеседования позволил найти сильного кандидата и улучшить команду.
-
-        Контекст: {context}
-        Вопрос: {input}
-        Ответ:
-        '''
-    elif (question_id == 8):
-        embedding_retriever = embedding_retriever_2
-        prompt_template = '''
-        Вы исполняете роль $role, а ваша специализация — $specialization.
-
-        Промпт:
-        Ты – эксперт в области наставничества и развития аналитиков начального уровня. Твоя задача – дать четкий и структурированный ответ на вопрос: "Что ожидается от лида компетенции аналитики при работе со стажерами и джунами?", основываясь на предоставленной базе знаний.
-
-        Структура ответа:
-        Наставничество и поддержка Опиши, какие аспекты профессионального развития стажеров и джунов должен курировать лид компетенции, включая обучение базовым аналитическим навыкам и адаптацию к рабочим процессам
-        Обучение и развитие Разъясни, какие методы и подходы следует использовать для передачи знаний, оценки прогресса и выявления пробелов в компетенциях молодых специалистов
-        Погружение в рабочие процессы Определи, как лид компетенции должен вовлекать стажеров и джунов в проектную работу, делегировать задачи и контролировать их выполнение
-        Обратная связь и развитие софт скиллов Разъясни, как правильно организовывать процесс регулярных встреч, предоставлять конструктивную обратную связь и развивать у молодых специалистов навыки коммуникации, работы в команде и принятия ответственности
-
-        Формат вывода:
-        Используй четкую структуру с разделами Наставничество и поддержка Обучение и развитие Погружение в рабочие процессы Обратная связь и развитие софт скиллов
-        Добавь примеры реальных ситуаций, где эффективное наставничество помогло ускорить рост стажеров и джунов и повысить их вклад в работу команды
-
-        Контекст: {context}
-        Вопрос: {input}
-        Ответ:
-        '''
-    elif (question_id == 9):
-        embedding_retriever = embedding_retriever_2
-        prompt_template = '''
-        Основываясь на контексте, доступном в векторной базе данных, дай ответ на вопрос: \
-        'Что ожидается от лида компетенции при проведение 1-2-1?' \
-        Опиши основные ожидания и роли, которые лидер компетенции по аналитике должен исполнять.
-        Если недостаточно информации для точного ответа,
-        сообщи об этом и предложи уточнить вопрос или предоставить дополнительный контекст.
-
-        Контекст: {context}
-        Вопрос: {input}
-        Ответ:
-        '''
-    elif (question_id == 10):
-        embedding_retriever = embedding_retriever_2
-        prompt_template = '''
-        Основываясь на контексте, доступном в векторной базе данных, дай ответ на вопрос: \
-        'Что ожидается от лида компетенции при проведение встречи компетенции?' \
-        Опиши основные ожидания и роли, которые лидер компетенции по аналитике должен исполнять,\
-        учитывая роль $role и специализацию — $specialization человека, который задает вопрос.
-        Если недостаточно информации для точного ответа,
-        сообщи об этом и предложи уточнить вопрос или предоставить дополнительный контекст.
-
-        Контекст: {context}
-        Вопрос: {input}
-        Ответ:
-        '''
-    elif (question_id == 11):
-        embedding_retriever = embedding_retriever_2
-        prompt_template = '''
-        Основываясь на контексте, доступном в векторной базе данных, дай ответ на вопрос: \
-        'Что ожидается от лида компетенции при построение структуры компетенции?' \
-        Опиши основные ожидания и роли, которые лидер компетенции по аналитике должен исполнять,\
-        учитывая роль $role и специализацию — $specialization человека, который задает вопрос.
-        Если недостаточно информации для точного ответа,
-        сообщи об этом и предложи уточнить вопрос или предоставить дополнительный контекст.
-
-        Контекст: {context}
-        Вопрос: {input}
-        Ответ:
-        '''
-    elif (question_id == 12):
-        embedding_retriever = embedding_retriever_2
-        prompt_template = '''
-        Основываясь на контексте, доступном в векторной базе данных, дай ответ на вопрос: \
-        'Что ожидается от лида компетенции при создании ИПР?' \
-        Опиши основные ожидания и роли, которые лидер компетенции по аналитике должен исполнять,\
-        учитывая роль $role и специализацию — $specialization человека, который задает вопрос.
-        Если недостаточно информации для точного ответа,
-        сообщи об этом и предложи уточнить вопрос или предоставить дополнительный контекст.
-
-        Контекст: {context}
-        Вопрос: {input}
-        Ответ:
-        '''
-
-    elif (question_id == 13):
-        embedding_retriever = embedding_retriever_2
-        prompt_template = '''
-        Вы исполняете роль $role, а ваша специализация — $specialization.
-
-        Промпт:
-        Ты – эксперт в области адаптации новых сотрудников. Твоя задача – дать четкий и структурированный ответ на вопрос: "Как лид компетенции аналитики должен проводить онбординг нового сотрудника?", основываясь на предоставленной базе знаний.
-
-        Структура ответа:
-        Подготовка к онбордингу. Опиши, какие шаги необходимо предпринять до прихода нового сотрудника, включая подготовку доступа, документов и программы адаптации.
-        Знакомство с рабочими процессами. Разъясни, какие ключевые процессы, инструменты и методологии работы должен освоить новый аналитик, а также как организовать вводные встречи.
-        Назначение задач и вовлечение в работу Определи, какие начальные задачи следует дать новичку, как правильно вводить его в проектную деятельность и обучать работе с данными и требованиями.
-        Обратная связь и контроль адаптации. Разъясни, как организовать регулярные встречи для обсуждения прогресса, предоставления обратной связи и корректировки адаптационного плана.
-
-        Формат вывода:
-        Используй четкую структуру с разделами. Подготовка к онбордингу. Знакомство с рабочими процессами Назначение задач и вовлечение в работу. Обратная связь и контроль адаптации.
-        Добавь примеры реальных ситуаций, где эффективный онбординг помог ускорить адаптацию аналитика и повысить его продуктивность.
-
-        Контекст: {context}
-        Вопрос: {input}
-        Ответ:
-        '''
-
-    elif (question_id == 14):
-        embedding_retriever = embedding_retriever_2
-        prompt_template = '''
-        Основываясь на контексте, доступном в векторной базе данных, дай ответ на вопрос: \
-        'Как лид компетенции аналитики должен оптимизировать процессы разработки?' \
-        Опиши основные ожидания и роли, которые лидер компетенции по аналитике должен исполнять, \
-        учитывая его ответственность за анализ текущих рабочих процессов, взаимодействие с командой и внедрение улучшений. \
-        Разъясни, какие методологии, инструменты и подходы к автоматизации могут повысить эффективность процессов разработки, \
-        как аналитик должен участвовать в улучшении коммуникации между командами и как оценивать результаты внедренных изменений.
-
-        Контекст: {context}
-        Вопрос: {input}
-        Ответ:
-        '''
-    elif (question_id == 15):
-        embedding_retriever = embedding_retriever_3
-        prompt_template = '''
-        Вы исполняете роль $role, а ваша специализация — $specialization.
-
-        Ты — ассистент, который профессионально формулирует ожидания Product Owner и Project Manager от IT-специалистов. На основе предоставленного контекста: {context} составь четкий и структурированный ответ о $role ($specialization).
-
-        Инструкции:
-
-        1. Проанализируй контекст: {context}
-        2. Определи целевую роль (аналитик/тестировщик/веб/java/python)
-        3. Выдели 5-7 ключевых ожиданий, которые явно указаны в контексте
-        4. Используй точные формулировки из контекста, но делай их более лаконичными
-        5. Сохрани профессиональный тон без лишних слов
-
-        Формат ответа:
-        PO/PM может ожидать от $role:
-
-        1. [Первое ключевое ожидание из контекста]
-        2. [Второе ключевое ожидание]
-        ...
-        5-7. [Последнее важное ожидание]
-
-        Требования:
-
-        - Используй только информацию из {context}
-        - Не добавляй ничего от себя
-        - Сохраняй технические детали из оригинала
-        - Ограничь ответ 7 пунктами максимум
-        - Избегай общих фраз и воды
-
-        Контекст: {context}
-        Вопрос: {input}
-        Ответ: …
-        '''
-    elif (question_id == 16):
-        embedding_retriever = embedding_retriever_3
-        prompt_template = '''
-        Вы исполняете роль $role, а ваша специализация — $specialization.
-
-        Ты — ассистент, который четко формулирует ожидания Product Owner (PO) и Project Manager (PM) от Лида компетенции. На основе предоставленного контекста: {context} составь структурированный ответ на вопрос о роли $role ($specialization), выделяя ключевые обязанности и зоны ответственности.  
-
-        Инструкции:
-
-        1. Используй только информацию из контекста: {context}.  
-        2. Определи роль (аналитик/тестировщик/веб/java/python).  
-        3. Выдели 5–7 ключевых ожиданий, сгруппированных по направлениям:  
-        - Управление качеством (контроль процессов, стандарты)  
-        - Техническая экспертиза (глубокие знания, архитектура)  
-        - Развитие команды (менторство, обучение)  
-        - Коммуникация и стратегия (работа с PO/PM, приоритезация)  
-        4. Сохрани оригинальные формулировки, но сделай их лаконичными.  
-        5. Избегай общих фраз — только конкретика из документа.  
-
-        Формат ответа:
-        PO/PM может ожидать от $role:  
-
-        1. Управление качеством:  
-        - [Ожидание 1]  
-        - [Ожидание 2]  
-
-        2. Техническая экспертиза:  
-        - [Ожидание 1]  
-        - [Ожидание 2]  
-
-        3. Развитие команды:
-
-        - [Ожидание 1]  
-
-        4. Коммуникация и стратегия:
-
-        - [Ожидание 1]  
-        - [Ожидание 2]  
-
-        Требования:
-
-        - Объем: 5–7 пунктов
-        - Только факты из {context}, без домыслов
-        - Четкие глаголы: обеспечивать, контролировать, обучать, координировать и тому подобное
-        - Избегай общих фраз и воды
-
-        Контекст: {context}
-        Вопрос: {input}
-        Ответ: …
-        '''
-    
-    elif (question_id == 17):
-        embedding_retriever = embedding_retriever_3
-        prompt_template = '''
-        Представь себя коучем для Product Owner в команде разработки программного обеспечения.
-        Объясни ему основные задачи и роли, которые он должен выполнять.
-        Уточни, что от него ожидается на каждом этапе процесса разработки.
-        Подчеркни важность каждой задачи и предложи примеры инструментов или методов, которые могут помочь в их выполнении.
-        На основе предоставленного контекста, \
-        ответьте на вопрос пользователя, уделяя внимание его роли и специализации. \
-        Если тебе не хватает информации для ответа, сообщи об этом пользователю.
-
-        Контекст: {context}
-        Вопрос: {input}
-        Ответ:
-        '''
-    elif (question_id == 18):
-        embedding_retriever = embedding_retriever_3
-        prompt_template = '''
-        Вы исполняете роль $role, а ваша специализация — $specialization.
-
-        Ты — эксперт по оценке компетенций. Сформулируй профессиональные ожидания от специалиста на основе контекста: {context} и роли ($specialization)
-
-        Инструкции:
-        1. Используй только предоставленный контекст: {context}
-        2. Сгруппируй ключевые ожидания по 3-5 категориям 
-        3. Используй профессиональный язык без общих фраз
-        4. Дай ответ в формате Ожидания от $role: 
-        5. Ограничь ответ 5-7 пунктами
-        6. Учитывай уровень позиции (Regular/Senior/Lead) при наличии в данных
-
-        Формат ответа:
-        Ожидания от [роль]:
-        1. Категория 1: [суть требования]
-        2. Категория 2: [суть требования] 
-        ...
-        5-7. Категория N: [суть требования]
-
-        Требования:
-        - Только конкретные требования из системы
-        - Без примеров и пояснений
-        - Четкие формулировки без воды
-        - Макс. 2000 символов
-
-        Контекст: {context}
-        Вопрос: {input}
-        Ответ: …
-        '''
-    elif (question_id == 19):
-        embedding_retriever = embedding_retriever_3
-        prompt_template = '''
-        Вы исполняете роль $role, а ваша специализация — $specialization.
-
-        Промпт:
-        Ты – эксперт по взаимодействию между специалистами и менеджерами продуктов (PO) и проектными менеджерами (PM). Твоя задача – дать четкий и структурированный ответ на вопрос: "Что я могу ожидать от своего PO/PM?", основываясь на предоставленной базе знаний.
-        Определение роли:
-        Узнай роль пользователя (бизнес-аналитик, системный аналитик, продуктовый аналитик), чтобы адаптировать ответ.
-
-        Структура ответа:
-        Обязанности PO/PM: Опиши ключевые функции Product Owner (PO) и Project Manager (PM), их зоны ответственности и влияние на работу аналитика.
-        Взаимодействие с аналитиком: Разъясни, какую поддержку можно ожидать от PO/PM в работе аналитика: постановка задач, доступ к информации, координация с командой.
-        Ожидания в зависимости от уровня аналитика:
-
-        Для Junior: PO/PM помогает с приоритезацией, обучением, уточнением требований.
-        Для Middle: PO/PM ожидает проактивности в анализе, а сам обеспечивает доступ к бизнес-стейкхолдерам.
-        Для Senior: PO/PM полагается на аналитика в стратегическом планировании и формировании продуктовой/проектной стратегии.
-        Формат вывода:
-        Используй четкую структуру с разделами: Обязанности PO/PM, Как взаимодействует с аналитиком, Ожидания в зависимости от уровня.
-        Добавь примеры реальных ситуаций, где взаимодействие с PO/PM играет ключевую роль.
-        Твой ответ не должен превысить 4096 символов.
-        Контекст: {context}
-        Вопрос: {input}
-        Ответ:
-        '''
-    elif (question_id == 20):
-        embedding_retriever = embedding_retriever_3
-        prompt_template = '''
-        Вы исполняете роль $role, а ваша специализация — $specialization.
-        Ты — HR-аналитик, который структурирует требования к лиду компетенции. На основе контекст: {context} сформируй четкий перечень ожиданий с разделением на hard и soft skills и ответь на вопрос о роли $role ($specialization).
-
-        Инструкции:
-
-        1. Тщательно проанализируй контекст: {context}
-        2. Раздели все требования на две основные категории:
-        - Hard Skills (технические/профессиональные навыки)
-        - Soft Skills (управленческие и личные качества)
-        3. В каждой категории выдели 4-6 ключевых пунктов
-        4. Для hard skills сохрани техническую конкретику из документа
-        5. Для soft skills используй формулировки из документа, но сделай их более лаконичными
-        6. Добавь раздел "Дополнительные ожидания" для особых требований
-
-        Формат ответа:
-        Что ожидается от лида компетенции [роль]:
-
-        Hard Skills:
-        1. [Конкретный технический навык 1]
-        2. [Конкретный технический навык 2]
-        ...
-        5-6. [Конкретный технический навык N]
-
-        Soft Skills:
-        1. [Ключевое управленческое качество 1]
-        2. [Ключевое управленческое качество 2]
-        ...
-        5-6. [Ключевое управленческое качество N]
-
-        Дополнительные ожидания:
-        - [Особые требования из документа]
-
-        Требования к ответу:
-        - Только конкретные требования из документа
-        - Четкое разделение на hard/soft skills
-        - Технические формулировки без упрощения
-        - Управленческие навыки в сжатой форме
-        - Объем: 10-12 пунктов
-        - Без общих фраз и воды
-
-        Контекст: {context}
-        Вопрос: {input}
-        Ответ: …
-        '''
-    
+# Индексы загружаются в фоне после старта сервера; pack_indexes содержит только готовые
+index_registry = IndexRegistry(index_loaders)
+pack_indexes = index_registry.indexes
+
+def index_name(pack_name):
+    """Имя индекса, который обслуживает пакет."""
+    return UNIFIED_INDEX_NAME if INDEX_LAYOUT == "unified" else pack_name
+
+def get_retriever(pack_name, role=None, specialization=None, k=None):
+    """
+    Ретривер для пакета; в режиме unified — срез единого индекса по пакету и специализации.
+    k — число чанков контекста (по умолчанию RETRIEVER_K).
+    """
+    if INDEX_LAYOUT != "unified":
+        return pack_indexes[pack_name].as_retriever(k)
+    # Документы для PO/PM не делятся по специализациям
+    if role == "PO/PM":
+        specialization = None
+    return pack_indexes[UNIFIED_INDEX_NAME].as_retriever(pack_name, specialization, k)
+
+def warm_up_caches(name):
+    # Заранее считаем векторы и результаты поиска для вопросов из меню бота, которые обслуживает индекс.
+    # В режиме unified срез индекса (и ключ кеша поиска) зависит от специализации,
+    # поэтому прогреваются все роли и специализации, которые присылает бот
+    profiles = BOT_PROFILES if INDEX_LAYOUT == "unified" else BOT_PROFILES[:1]
+    for question_id, question in PREDEFINED_QUESTIONS.items():
+        spec = question_spec(question_id)
+        if index_name(spec.pack) == name:
+            for role, specialization in profiles:
+                get_retriever(spec.pack, role, specialization, spec.k).invoke(question)
+    print(f"Кеши предопределенных вопросов {name} прогреты: {retrieval_cache.stats()}")
+
+# Интервал проверки txt_docs на изменения в секундах (0 — наблюдатель выключен)
+TXT_DOCS_WATCH_INTERVAL = int(os.getenv("TXT_DOCS_WATCH_INTERVAL", "0"))
+# Токен для административных эндпоинтов (если не задан, проверка отключена)
+ADMIN_TOKEN = os.getenv("RAG_ADMIN_TOKEN")
+# Сколько секунд запрос ждет загрузки индекса своего пакета
+PACK_WAIT_TIMEOUT = float(os.getenv("PACK_WAIT_TIMEOUT", "60"))
+
+def start_txt_docs_watcher():
+    if TXT_DOCS_WATCH_INTERVAL > 0 and build_manifest is None:
+        start_watcher(pack_indexes, TXT_DOCS_WATCH_INTERVAL)
+        print(f"Наблюдение за txt_docs включено, интервал {TXT_DOCS_WATCH_INTERVAL} с")
+
+@app.on_event("startup")
+async def start_index_loading():
+    # Сервер принимает соединения сразу, индексы загружаются в фоне
+    index_registry.start(on_ready=warm_up_caches, on_done=start_txt_docs_watcher)
+
+@app.get("/healthz")
+async def healthz():
+    """Liveness: процесс жив и обслуживает HTTP."""
+    return {"status": "ok"}
+
+@app.get("/readyz")
+async def readyz(pack: str | None = None):
+    """Readiness: 200, когда загружены все индексы (или индекс пакета pack), иначе 503."""
+    if pack is not None:
+        ready = index_registry.is_ready(index_name(pack))
     else:
-        embedding_retriever = embedding_retriever_full
-
-        prompt_template = '''
-        Вы исполняете роль $role, а ваша специализация — $specialization.
-        Ваши функции включают:
-
-        Решение вопросов, связанных с $specialization, используя данные из контекста.
-        Консультирование и предложение рекомендаций, необходимых для выполнения задач в рамках $role.
-        Предоставление информации и помощь в решении проблем в контексте $specialization и $role.
-        На основе предоставленного контекста, \
-        ответьте на вопрос пользователя, уделяя внимание его роли и специализации. \
-        Если вам не хватает информации для ответа, сообщите об этом пользователю, \
-        а также предложите уточнить вопрос или предоставить дополнительный контекст.
-        Твой ответ не должен превысить 4096 символов.
-
-        Контекст: {context}
-        Вопрос: {input}
-        Ответ:
-        '''        
+        ready = index_registry.all_ready()
+    return JSONResponse(
+        status_code=200 if ready else 503,
+        content={"ready": ready, "indexes": index_registry.report()},
+    )
 
-    print(f"📩 Получен запрос: {question}")
+@app.post("/admin/reindex")
+async def admin_reindex(pack: str | None = None, x_admin_token: str | None = Header(default=None)):
+    """Переиндексирует измененные файлы txt_docs без перезапуска сервиса."""
+    if ADMIN_TOKEN and x_admin_token != ADMIN_TOKEN:
+        raise HTTPException(status_code=403, detail="Неверный токен")
+    if pack is not None and pack not in index_registry.status:
+        raise HTTPException(status_code=404, detail=f"Пакет {pack} не найден")
+    if not index_registry.done.is_set():
+        raise HTTPException(status_code=503, detail="Индексы еще загружаются")
+    if build_manifest is not None:
+        raise HTTPException(status_code=409, detail="Индексы загружены из артефактов, пересоберите их через build_index.py")
+
+    pack_names = [pack] if pack else None
+    # Переиндексация идет в отдельном потоке, /ws продолжает обслуживать запросы
+    reports = await asyncio.to_thread(reindex_packs, pack_indexes, pack_names)
+    return {"reports": reports}
+
+
+# Инициализация модели GigaChat: пулы клиентов на процесс вместо нового клиента на каждый запрос
+llm_pools = create_llm_pools(api_key)
+# Допуск генераций: лимит параллельности на модель, интерактивные вопросы важнее рассылок и напоминаний
+generation_scheduler = GenerationScheduler(llm_pools)
+# Склейка одинаковых первых вопросов, по которым уже идет генерация
+single_flight = SingleFlight()
+# Дедлайны, размыкатели и переключение на запасную модель (LLM_TTFT_DEADLINE, LLM_TOTAL_DEADLINE, LLM_FALLBACK_MODEL)
+fallback_generator = FallbackGenerator(generation_scheduler, llm_pools)
+# Код закрытия /ws после запасного или прерванного ответа: бот не кеширует такие ответы
+DEGRADED_CLOSE_CODE = 4000
+
+# Метрики запросов /ws: задержки по этапам, исходы, отправленные фрагменты
+stage_seconds = REGISTRY.histogram(
+    "rag_stage_seconds", "Длительность этапов обработки запроса /ws, с",
+    ("stage", "question", "branch", "model"),
+)
+requests_total = REGISTRY.counter(
+    "rag_requests_total", "Запросы /ws по исходу", ("question", "branch", "model", "outcome"),
+)
+stream_chunks_total = REGISTRY.counter(
+    "rag_stream_chunks_total", "Фрагменты ответа, отправленные в /ws", ("branch", "model"),
+)
+stream_bytes_total = REGISTRY.counter(
+    "rag_stream_bytes_total", "Байты ответа, отправленные в /ws", ("branch", "model"),
+)
+active_websockets = REGISTRY.gauge("rag_active_websockets", "Открытые соединения /ws")
+active_websockets.set(0)
+
+# Загрузка пулов GigaChat и очередей планировщика: значения копируются из их stats() при каждом /metrics
+pool_clients = REGISTRY.gauge("rag_llm_pool_clients", "Клиенты пула GigaChat по состоянию", ("model", "state"))
+pool_waiting = REGISTRY.gauge("rag_llm_pool_waiting", "Запросы, ждущие свободного клиента пула", ("model",))
+pool_utilization = REGISTRY.gauge("rag_llm_pool_utilization", "Доля занятых клиентов пула", ("model",))
+pool_leases_total = REGISTRY.counter("rag_llm_pool_leases_total", "Выдачи клиентов пула", ("model",))
+pool_wait_seconds_total = REGISTRY.counter(
+    "rag_llm_pool_wait_seconds_total", "Суммарное ожидание клиента пула, с", ("model",),
+)
+generation_running = REGISTRY.gauge(
+    "rag_generation_running", "Идущие генерации по классу приоритета", ("model", "priority"),
+)
+generation_queued = REGISTRY.gauge(
+    "rag_generation_queued", "Генерации в очереди планировщика", ("model", "priority"),
+)
+generation_queue_limit = REGISTRY.gauge(
+    "rag_generation_queue_limit", "Лимит очереди планировщика", ("model", "priority"),
+)
+generation_admitted_total = REGISTRY.counter(
+    "rag_generation_admitted_total", "Допущенные планировщиком генерации", ("model", "priority"),
+)
+generation_shed_total = REGISTRY.counter(
+    "rag_generation_shed_total", "Генерации, отклоненные из-за заполненной очереди", ("model", "priority"),
+)
 
-    retrieval_chain = create_retrieval_chain_from_folder(role, specialization, prompt_template, embedding_retriever)
-
-    # Задаем массив лишних символов
-    unwanted_chars = ["*", "**"]
-    # Запускаем стриминг ответа
-    if (count == 1):
-        async for chunk in retrieval_chain.astream({'input': question}):
-            if chunk:
-                    # Извлекаем ответ
-                answer = chunk.get("answer", "").strip()
-
-                    # Заменяем ненужные символы
-                for char in unwanted_chars:
-                    answer = answer.replace(char, " ")
-                    
-                answer = " ".join(answer.split())  # Удаляем лишние пробелы
-                    
-                await websocket.send_text(answer)  # Отправляем очищенный текстовый ответ
-
-    elif(count > 1 and count < 10):
-        for chunk in GigaChat(credentials=api_key,
-                              verify_ssl_certs=False,
-                                model='GigaChat-Max'
-                                ).stream(f"Использую контекст нашей прошлой беседы {context}, ответь на уточняющий вопрос {question}"):
-            answer = chunk.content.strip()  # Используем атрибут .content
-
-            # Заменяем ненужные символы
-            for char in unwanted_chars:
-                answer = answer.replace(char, " ")
-
-            # Удаляем лишние пробелы
-            answer = " ".join(answer.split())
-
-            # Отправляем ответ через WebSocket
-            await websocket.send_text(answer)
-        
+def question_bucket(question_id):
+    """Метка вопроса: номер вопроса из меню или custom, чтобы число рядов метрик не росло."""
+    return str(question_id) if question_id in PREDEFINED_QUESTIONS else "custom"
+
+def branch_name(count):
+    if count == 1:
+        return "first"
+    if 1 < count < 10:
+        return "followup"
+    return {101: "proactive", 102: "reminder"}.get(count, "other")
+
+async def timed_stream(chunks, labels):
+    """Пропускает фрагменты генерации, замеряя время до первого токена и длительность генерации."""
+    started = time.perf_counter()
+    first_token = False
+    async for chunk in chunks:
+        if chunk_text(chunk) and not first_token:
+            first_token = True
+            stage_seconds.observe(time.perf_counter() - started, stage="ttft", **labels)
+        yield chunk
+    stage_seconds.observe(time.perf_counter() - started, stage="generation", **labels)
+
+async def send_answer(websocket, answer, labels):
+    await websocket.send_text(answer)
+    stream_chunks_total.inc(branch=labels["branch"], model=labels["model"])
+    stream_bytes_total.inc(len(answer.encode("utf-8")), branch=labels["branch"], model=labels["model"])
+
+def collect_pool_metrics():
+    for model, pool in llm_pools.items():
+        pool_clients.set(pool.in_use, model=model, state="in_use")
+        pool_clients.set(pool.clients.qsize(), model=model, state="idle")
+        pool_waiting.set(pool.waiting, model=model)
+        pool_utilization.set(pool.in_use / pool.size if pool.size else 0.0, model=model)
+        pool_leases_total.set(pool.leases, model=model)
+        pool_wait_seconds_total.set(pool.wait_seconds, model=model)
+    for model, scheduler in generation_scheduler.schedulers.items():
+        for priority, name in PRIORITY_NAMES.items():
+            generation_running.set(scheduler.running[priority], model=model, priority=name)
+            generation_queued.set(scheduler.queued[priority], model=model, priority=name)
+            generation_queue_limit.set(scheduler.queue_limits[priority], model=model, priority=name)
+            generation_admitted_total.set(scheduler.admitted[priority], model=model, priority=name)
+            generation_shed_total.set(scheduler.shed[priority], model=model, priority=name)
+
+@app.get("/metrics")
+async def metrics():
+    """Метрики процесса в текстовом формате Prometheus."""
+    collect_pool_metrics()
+    return PlainTextResponse(REGISTRY.render(), media_type="text/plain; version=0.0.4")
+
+@app.on_event("startup")
+async def warm_up_llm_pools():
+    for pool in llm_pools.values():
+        asyncio.create_task(pool.warm_up())
+
+@app.get("/stats")
+async def stats():
+    """Загрузка пулов GigaChat и статистика кешей."""
+    return {
+        "llm_pools": {model: pool.stats() for model, pool in llm_pools.items()},
+        "generation_queues": generation_scheduler.stats(),
+        "retrieval_cache": retrieval_cache.stats(),
+        "query_embedding_cache": query_embedding_cache.stats(),
+        "sentence_embedding_cache": sentence_embedding.stats(),
+        "answer_cache": answer_cache.stats(),
+        "single_flight": single_flight.stats(),
+        "generation_fallbacks": fallback_generator.stats(),
+    }
+
+async def reject_overloaded(websocket, priority, error):
+    print(f"Запрос отклонен: {error}")
+    if priority == INTERACTIVE:
+        await websocket.send_text("Сейчас очень много вопросов, пожалуйста, повторите свой через минуту.")
+    # 1013 — "Try Again Later"
+    await websocket.close(code=1013)
+
+def clean_answer(answer):
+    """Убирает из фрагмента ответа символы разметки и лишние пробелы."""
+    answer = answer.strip()
+    for char in ["*", "**"]:
+        answer = answer.replace(char, " ")
+    return " ".join(answer.split())
+
+def observe_queue_wait(labels):
+    def observe(model, seconds):
+        stage_seconds.observe(seconds, stage="queue_wait", **{**labels, "model": model})
+    return observe
+
+async def fallback_answer(cache_key, question_vector, docs):
+    """
+    Запасной ответ, когда ни одна модель не ответила: устаревший ответ из кеша ответов
+    или, если его нет, выдержки из найденных документов.
+    """
+    cached_answer = await asyncio.to_thread(answer_cache.lookup, cache_key, question_vector, True)
+    if cached_answer is not None:
+        return FallbackAnswer("stale_answer", "".join(cached_answer))
+    text = extractive_answer(docs)
+    if text:
+        return FallbackAnswer("extractive", text)
+    return FallbackAnswer("failed", "Не удалось получить ответ, пожалуйста, повторите вопрос чуть позже.")
+
+def followup_prompt(count, question, context):
+    """Промпт для уточняющих вопросов (count 2-9), пятничной рассылки (101) и напоминаний (102)."""
+    if (count > 1 and count < 10):
+        # Память диалога заново укладывается в бюджет: клиенты прежней версии присылают всю историю
+        memory = DialogueMemory.from_payload(context)
+        # Текущий вопрос бот кладет в контекст последним, в промпте он уже есть
+        memory.pop_question(question)
+        return f"Использую контекст нашей прошлой беседы {memory.render()}, ответь на уточняющий вопрос {question}"
     elif(count == 101):
         promt = '''
                 Вы исполняете роль помощника, анализируете информацию и предлагаете темы.
@@ -726,40 +355,178 @@ async def websocket_endpoint(websocket: WebSocket):
         template = string.Template(promt)
         filled_prompt = template.substitute(context=context)
         print(filled_prompt)
-        for chunk in GigaChat(credentials=api_key,
-                              verify_ssl_certs=False,
-                                model='GigaChat'
-                                ).stream(filled_prompt):
-            answer = chunk.content.strip()  # Используем атрибут .content
+        return filled_prompt
+    elif(count == 102):
+        return f"Напомни мне пожалуйста вот об этой теме {context}"
+    return None
 
-            # Заменяем ненужные символы
-            for char in unwanted_chars:
-                answer = answer.replace(char, " ")
+@app.websocket("/ws")
+async def websocket_endpoint(websocket: WebSocket):
+    """Обрабатывает WebSocket соединение и передает стриминг ответа GigaChat."""
+    active_websockets.inc()
+    try:
+        await handle_question(websocket)
+    finally:
+        active_websockets.dec()
 
-            # Удаляем лишние пробелы
-            answer = " ".join(answer.split())
+async def handle_question(websocket):
+    await websocket.accept()
+    received = time.perf_counter()
+    question = await websocket.receive_text()
+    role = await websocket.receive_text()
+    specialization = await websocket.receive_text()
+    question_id = await websocket.receive_text()
+    context = await websocket.receive_text()
+    print(context)
+    count = await websocket.receive_text()
+    question_id = int(question_id)
+    count = int(count)
+    print(question)
+    print(role)
+    print(specialization)
+    print(f"количество {count}")
+    print(f"айди {question_id}")
+    # Пакет, шаблон промпта, модель и число чанков вопроса
+    spec = question_spec(question_id)
+    pack_name = spec.pack
+    # Пятничная рассылка (101) и напоминания (102) — фоновые генерации на модели GigaChat
+    model = "GigaChat" if count in (101, 102) else spec.model
+    priority = BACKGROUND if count in (101, 102) else INTERACTIVE
+    labels = {"question": question_bucket(question_id), "branch": branch_name(count), "model": model}
+    stage_seconds.observe(time.perf_counter() - received, stage="receive", **labels)
 
-            # Отправляем ответ через WebSocket
-            await websocket.send_text(answer)
+    print(f"📩 Получен запрос: {question}")
 
-    elif(count == 102):
-        for chunk in GigaChat(credentials=api_key,
-                              verify_ssl_certs=False,
-                                model='GigaChat'
-                                ).stream(f"Напомни мне пожалуйста вот об этой теме {context}"):
-            answer = chunk.content.strip()  # Используем атрибут .content
-
-            # Заменяем ненужные символы
-            for char in unwanted_chars:
-                answer = answer.replace(char, " ")
-
-            # Удаляем лишние пробелы
-            answer = " ".join(answer.split())
-
-            # Отправляем ответ через WebSocket
-            await websocket.send_text(answer)
-    
-    await websocket.close()    
+    # Поиск по документам нужен только первому вопросу (count == 1)
+    if count == 1:
+        # Запросы к уже загруженным пакетам обслуживаются, не дожидаясь остальных
+        started = time.perf_counter()
+        if not await index_registry.wait_ready(index_name(pack_name), PACK_WAIT_TIMEOUT):
+            requests_total.inc(outcome="not_ready", **labels)
+            await websocket.send_text("База знаний еще загружается, попробуйте повторить вопрос чуть позже.")
+            # 1013 — "Try Again Later": бот не кеширует такой ответ
+            await websocket.close(code=1013)
+            return
+        stage_seconds.observe(time.perf_counter() - started, stage="index_wait", **labels)
+
+        # В кеш ответов попадают все первые ответы: на свободные вопросы он отвечает сразу,
+        # а ответы на вопросы меню выдаются, только если модель не ответила
+        corpus_hash = pack_indexes[index_name(pack_name)].meta["corpus_hash"]
+        cache_key = answer_key(pack_name, corpus_hash, role, specialization,
+                               question_id if question_id in PREDEFINED_QUESTIONS else None)
+        started = time.perf_counter()
+        question_vector = await asyncio.to_thread(embedding.embed_query, question)
+        if question_id not in PREDEFINED_QUESTIONS:
+            cached_answer = await asyncio.to_thread(answer_cache.lookup, cache_key, question_vector)
+            stage_seconds.observe(time.perf_counter() - started, stage="answer_cache", **labels)
+            if cached_answer is not None:
+                for answer in cached_answer:
+                    await send_answer(websocket, answer, labels)
+                requests_total.inc(outcome="cache_hit", **labels)
+                await websocket.close()
+                return
+
+        async def generate_answer():
+            # Ретривер фиксирует текущую версию индекса пакета на все время запроса
+            embedding_retriever = get_retriever(pack_name, role, specialization, spec.k)
+            # Склейка перекрывающихся чанков и отбор предложений под бюджет токенов вопроса
+            embedding_retriever = compress_context(embedding_retriever, sentence_embedding, question_id)
+            # Поиск идет до генерации: его время не входит в дедлайн первого токена,
+            # а ошибки поиска не размыкают цепь модели
+            started = time.perf_counter()
+            try:
+                docs = await asyncio.to_thread(embedding_retriever.invoke, question)
+            except Exception as e:
+                print(f"Поиск документов не удался: {e}")
+                raise await fallback_answer(cache_key, question_vector, []) from e
+            stage_seconds.observe(time.perf_counter() - started, stage="retrieval", **labels)
+            started = time.perf_counter()
+            # Промпт и цепочка компилируются один раз на (вопрос, роль, специализация)
+            retrieval_chain = question_chain(question_id, role, specialization)
+            stage_seconds.observe(time.perf_counter() - started, stage="prompt_build", **labels)
+
+            # Модели, которые начинали генерацию; последняя из них ответила
+            candidates = []
+
+            def make_stream(llm, candidate):
+                candidates.append(candidate)
+                config = chain_config(llm, RunnableLambda(lambda _: docs))
+                return timed_stream(retrieval_chain.astream({'input': question}, config=config),
+                                    {**labels, "model": candidate})
+
+            # Отправленные фрагменты ответа сохраняются в кеш ответов
+            answer_parts = []
+            try:
+                async for chunk in fallback_generator.stream(model, priority, make_stream, observe_queue_wait(labels)):
+                    answer = clean_answer(chunk_text(chunk))
+                    if answer:
+                        answer_parts.append(answer)
+                    yield answer
+            except GenerationFailed as e:
+                raise await fallback_answer(cache_key, question_vector, docs) from e
+            if candidates[-1] != model:
+                # Ответ запасной модели не кешируется ни сервисом, ни ботом
+                raise FallbackAnswer("fallback_model", "")
+            await asyncio.to_thread(answer_cache.put, cache_key, question, question_vector, answer_parts)
+
+        # Одинаковые первые вопросы, пришедшие во время генерации, получают ее фрагменты
+        # (опоздавшие — с начала), а не запускают свою генерацию
+        flight_key = (question_id, question, role, specialization)
+        stream = single_flight.stream(flight_key, generate_answer)
+    else:
+        prompt = followup_prompt(count, question, context)
+        if prompt is None:
+            await websocket.close()
+            return
+
+        candidates = []
+
+        def make_stream(llm, candidate):
+            candidates.append(candidate)
+            return timed_stream(llm.astream(prompt), {**labels, "model": candidate})
+
+        async def clean_stream():
+            async for chunk in fallback_generator.stream(model, priority, make_stream, observe_queue_wait(labels)):
+                yield clean_answer(chunk_text(chunk))
+            if candidates[-1] != model:
+                raise FallbackAnswer("fallback_model", "")
+
+        stream = clean_stream()
+
+    # Запускаем стриминг ответа. Все ветки используют astream: пока одна генерация ждет
+    # очередной фрагмент, цикл событий обслуживает остальные соединения
+    started = time.perf_counter()
+    try:
+        async for answer in stream:
+            await send_answer(websocket, answer, labels)  # Отправляем очищенный текстовый ответ
+    except Overloaded as e:
+        requests_total.inc(outcome="overloaded", **labels)
+        await reject_overloaded(websocket, priority, e)
+        return
+    except FallbackAnswer as e:
+        requests_total.inc(outcome=e.source, **labels)
+        # У ответа запасной модели текста нет: он уже отправлен фрагментами
+        if e.text:
+            await send_answer(websocket, e.text, labels)
+        await websocket.close(code=DEGRADED_CLOSE_CODE)
+        return
+    except GenerationFailed as e:
+        requests_total.inc(outcome="failed", **labels)
+        print(f"Ответ не получен: {e}")
+        # Фоновым рассылкам пустой ответ не отправляется
+        if priority == INTERACTIVE:
+            await websocket.send_text("Не удалось получить ответ, пожалуйста, повторите вопрос чуть позже.")
+        await websocket.close(code=DEGRADED_CLOSE_CODE)
+        return
+    except GenerationInterrupted as e:
+        requests_total.inc(outcome="interrupted", **labels)
+        print(f"Ответ прерван: {e}")
+        await websocket.send_text("\n\nОтвет прерван: модель перестала отвечать.")
+        await websocket.close(code=DEGRADED_CLOSE_CODE)
+        return
+    stage_seconds.observe(time.perf_counter() - started, stage="stream", **labels)
+    requests_total.inc(outcome="answered", **labels)
+    await websocket.close()
 
 if __name__ == "__main__":
     import uvicorn
@@ -0,0 +1,31 @@
+import os
+from dotenv import load_dotenv
+
+load_dotenv()
+
+# Пакеты документов: имя пакета -> каталог с .txt файлами
+DOCS_DIR = os.path.join(os.path.dirname(__file__), "txt_docs")
+PACK_FOLDERS = {
+    # Документы по Специалисту аналитику
+    "docs_pack_1": os.path.join(DOCS_DIR, "docs_pack_1"),
+    # Документы по Лиду аналитику
+    "docs_pack_2": os.path.join(DOCS_DIR, "docs_pack_2"),
+    # Документы по PO/PM
+    "docs_pack_3": os.path.join(DOCS_DIR, "docs_pack_3"),
+    # Полный пакет
+    "docs_pack_full": os.path.join(DOCS_DIR, "docs_pack_full"),
+}
+
+# Параметры чанкинга (входят в хеш снапшота индекса)
+CHUNK_SIZE = 500
+CHUNK_OVERLAP = 100
+
+# Модель эмбеддингов и бэкенд для нее: torch (HuggingFaceEmbeddings) или onnx (int8 ONNX Runtime)
+EMBEDDING_MODEL_NAME = "sentence-transformers/paraphrase-multilingual-mpnet-base-v2"
+EMBEDDING_BACKEND = os.getenv("EMBEDDING_BACKEND", "torch")
+
+# Раскладка индексов: per_pack (отдельный FAISS на пакет) или unified (один индекс с фильтрами)
+INDEX_LAYOUT = os.getenv("INDEX_LAYOUT", "per_pack")
+# Источник индексов: artifacts (только чтение офлайн-сборки build_index.py по манифесту, по умолчанию)
+# или build (сервис сам кодирует корпус и пересобирает индексы при изменении документов — для разработки)
+INDEX_SOURCE = os.getenv("INDEX_SOURCE", "artifacts")
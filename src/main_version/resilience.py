@@ -0,0 +1,256 @@
+import os
+import math
+import time
+import asyncio
+import httpx
+from gigachat.exceptions import GigaChatException
+
+from llm_pool import model_env
+
+# Дедлайны генерации в секундах: до первого токена и на весь ответ (0 — без ограничения)
+TTFT_DEADLINE = float(os.getenv("LLM_TTFT_DEADLINE", "20"))
+TOTAL_DEADLINE = float(os.getenv("LLM_TOTAL_DEADLINE", "120"))
+# Модель, которая отвечает, если основная не уложилась в дедлайн или недоступна
+FALLBACK_MODEL = os.getenv("LLM_FALLBACK_MODEL", "GigaChat")
+# Сколько символов найденных фрагментов отдается в ответе без модели
+EXTRACTIVE_MAX_CHARS = int(os.getenv("EXTRACTIVE_MAX_CHARS", "1500"))
+
+CLOSED = "closed"
+OPEN = "open"
+HALF_OPEN = "half_open"
+
+
+class DeadlineExceeded(Exception):
+    """Модель не уложилась в дедлайн."""
+
+
+# Ошибки, которые говорят о состоянии модели: ответы API GigaChat, транспорт и дедлайны.
+# Остальные (поиск, сжатие контекста, ошибки кода) пробрасываются как есть и размыкатели не трогают
+MODEL_ERRORS = (DeadlineExceeded, GigaChatException, httpx.HTTPError, ConnectionError, TimeoutError)
+
+
+class GenerationFailed(Exception):
+    """Ни одна модель не ответила; клиенту еще ничего не отправлено."""
+
+
+class GenerationInterrupted(Exception):
+    """Генерация прервалась, когда часть ответа уже отправлена."""
+
+
+class FallbackAnswer(Exception):
+    """
+    Вместо ответа основной модели отдается запасной; source — откуда он взят
+    (stale_answer, extractive, failed или fallback_model — тогда text пуст, ответ уже отправлен).
+    """
+
+    def __init__(self, source, text):
+        super().__init__(source)
+        self.source = source
+        self.text = text
+
+
+def chunk_text(chunk):
+    """Текст фрагмента генерации: ответ retrieval_chain (словарь) или сообщение модели."""
+    if isinstance(chunk, dict):
+        return chunk.get("answer", "")
+    return chunk.content
+
+
+class CircuitBreaker:
+    """
+    Размыкатель для одной модели: после failure_threshold ошибок подряд модель не вызывается
+    reset_timeout секунд, затем пропускается один пробный запрос. Успех замыкает цепь,
+    ошибка снова размыкает ее.
+    """
+
+    def __init__(self, model, failure_threshold=5, reset_timeout=30.0):
+        self.model = model
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.state = CLOSED
+        self.failures = 0
+        self.opened_at = 0.0
+        self.trial_started = None
+        self.opened = 0
+        self.rejected = 0
+
+    def allow(self):
+        now = time.monotonic()
+        if self.state == OPEN:
+            if now - self.opened_at < self.reset_timeout:
+                self.rejected += 1
+                return False
+            self.state = HALF_OPEN
+            self.trial_started = None
+        if self.state == HALF_OPEN:
+            # Пробный запрос один; если он пропал без результата, через reset_timeout пускаем следующий
+            if self.trial_started is not None and now - self.trial_started < self.reset_timeout:
+                self.rejected += 1
+                return False
+            self.trial_started = now
+        return True
+
+    def cancel_trial(self):
+        """Пробный запрос завершился не по вине модели — следующий можно пропустить сразу."""
+        self.trial_started = None
+
+    def record_success(self):
+        self.state = CLOSED
+        self.failures = 0
+        self.trial_started = None
+
+    def record_failure(self):
+        self.failures += 1
+        if self.state == HALF_OPEN or self.failures >= self.failure_threshold:
+            if self.state != OPEN:
+                self.opened += 1
+                print(f"Размыкатель модели {self.model} разомкнут после {self.failures} ошибок")
+            self.state = OPEN
+            self.opened_at = time.monotonic()
+            self.trial_started = None
+
+    def stats(self):
+        return {
+            "state": self.state,
+            "failures": self.failures,
+            "opened": self.opened,
+            "rejected": self.rejected,
+        }
+
+
+async def deadline_stream(chunks, ttft, total):
+    """
+    Пропускает фрагменты генерации, пока она укладывается в дедлайны:
+    первый текст — за ttft секунд, весь ответ — за total секунд от начала.
+    """
+    ttft = ttft if ttft > 0 else math.inf
+    total = total if total > 0 else math.inf
+    iterator = chunks.__aiter__()
+    started = time.monotonic()
+    first_text = False
+    try:
+        while True:
+            elapsed = time.monotonic() - started
+            budget = total - elapsed if first_text else min(ttft, total) - elapsed
+            if budget <= 0:
+                raise DeadlineExceeded(f"генерация не уложилась в {total if first_text else min(ttft, total)} с")
+            try:
+                chunk = await asyncio.wait_for(iterator.__anext__(), None if budget == math.inf else budget)
+            except StopAsyncIteration:
+                return
+            except asyncio.TimeoutError:
+                if first_text:
+                    raise DeadlineExceeded(f"ответ не уложился в {total} с") from None
+                raise DeadlineExceeded(f"нет первого токена за {min(ttft, total)} с") from None
+            if chunk_text(chunk):
+                first_text = True
+            yield chunk
+    finally:
+        aclose = getattr(iterator, "aclose", None)
+        if aclose is not None:
+            await aclose()
+
+
+def extractive_answer(docs, max_chars=EXTRACTIVE_MAX_CHARS):
+    """Ответ без модели: начало найденных фрагментов базы знаний, не длиннее max_chars символов."""
+    parts = []
+    used = 0
+    for doc in docs:
+        text = " ".join(doc.page_content.split())[:max_chars - used]
+        if text:
+            parts.append(f"— {text}")
+            used += len(text)
+        if used >= max_chars:
+            break
+    if not parts:
+        return ""
+    return "Модель сейчас не отвечает. Вот что нашлось в базе знаний по вашему вопросу:\n\n" + "\n\n".join(parts)
+
+
+class FallbackGenerator:
+    """
+    Генерация через планировщик с дедлайнами, размыкателями и запасной моделью.
+
+    Если основная модель разомкнута, не дала первый токен за ttft_deadline или упала до первого
+    фрагмента, ответ генерирует запасная модель. Сбой после начала ответа не переключает модель
+    (часть ответа уже у пользователя), а выбрасывает GenerationInterrupted.
+    Сбоями модели считаются только MODEL_ERRORS; поиск документов должен завершиться до вызова stream,
+    чтобы его время не входило в дедлайн первого токена.
+    """
+
+    def __init__(self, scheduler, models, ttft_deadline=TTFT_DEADLINE, total_deadline=TOTAL_DEADLINE,
+                 fallback_model=FALLBACK_MODEL):
+        self.scheduler = scheduler
+        self.ttft_deadline = ttft_deadline
+        self.total_deadline = total_deadline
+        self.fallback_model = fallback_model
+        self.breakers = {
+            model: CircuitBreaker(
+                model,
+                failure_threshold=int(model_env("LLM_BREAKER_FAILURES", model, "5")),
+                reset_timeout=float(model_env("LLM_BREAKER_RESET", model, "30")),
+            )
+            for model in models
+        }
+        self.fallbacks = 0
+        self.deadline_misses = 0
+        self.failed = 0
+
+    def candidates(self, model):
+        if self.fallback_model in self.breakers and self.fallback_model != model:
+            return [model, self.fallback_model]
+        return [model]
+
+    async def stream(self, model, priority, make_stream, on_queue_wait=None):
+        """
+        Фрагменты ответа; make_stream(llm, model) возвращает асинхронный итератор фрагментов генерации,
+        on_queue_wait(model, секунды) получает время ожидания слота планировщика.
+        GenerationFailed — ни одна модель не ответила. Overloaded планировщика пробрасывается как есть.
+        """
+        errors = []
+        for position, candidate in enumerate(self.candidates(model)):
+            breaker = self.breakers[candidate]
+            if not breaker.allow():
+                errors.append(f"{candidate}: размыкатель разомкнут")
+                continue
+            if position > 0:
+                self.fallbacks += 1
+                print(f"Переключение на запасную модель {candidate}: {errors[-1]}")
+            started = time.perf_counter()
+            sent = False
+            try:
+                # Ожидание слота внутри try: Overloaded и отмена в очереди снимают пробный запрос размыкателя
+                generation = await self.scheduler.acquire(candidate, priority)
+                if on_queue_wait is not None:
+                    on_queue_wait(candidate, time.perf_counter() - started)
+                async with generation as llm:
+                    async for chunk in deadline_stream(make_stream(llm, candidate),
+                                                       self.ttft_deadline, self.total_deadline):
+                        sent = sent or bool(chunk_text(chunk))
+                        yield chunk
+                breaker.record_success()
+                return
+            except MODEL_ERRORS as e:
+                breaker.record_failure()
+                if isinstance(e, DeadlineExceeded):
+                    self.deadline_misses += 1
+                print(f"Генерация {candidate} не удалась: {e}")
+                if sent:
+                    raise GenerationInterrupted(f"{candidate}: {e}") from e
+                errors.append(f"{candidate}: {e}")
+            except BaseException:
+                # Ошибка не модели или отмена запроса ничего не говорят о ее состоянии
+                breaker.cancel_trial()
+                raise
+        self.failed += 1
+        raise GenerationFailed("; ".join(errors))
+
+    def stats(self):
+        return {
+            "ttft_deadline": self.ttft_deadline,
+            "total_deadline": self.total_deadline,
+            "fallbacks": self.fallbacks,
+            "deadline_misses": self.deadline_misses,
+            "failed": self.failed,
+            "breakers": {model: breaker.stats() for model, breaker in self.breakers.items()},
+        }
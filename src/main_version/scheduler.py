@@ -0,0 +1,185 @@
+import os
+import time
+import heapq
+import asyncio
+import itertools
+
+# Классы приоритета: меньше — важнее
+INTERACTIVE = 0
+BACKGROUND = 1
+PRIORITY_NAMES = {INTERACTIVE: "interactive", BACKGROUND: "background"}
+
+# Лимиты очередей ожидания по классам приоритета
+QUEUE_LIMITS = {
+    INTERACTIVE: int(os.getenv("LLM_QUEUE_INTERACTIVE", "32")),
+    BACKGROUND: int(os.getenv("LLM_QUEUE_BACKGROUND", "200")),
+}
+# Число процессов сервиса (serve.py): планировщик живет в каждом, поэтому лимит
+# параллельности модели делится между ними. Очереди ожидания остаются на процесс
+RAG_WORKERS = max(1, int(os.getenv("RAG_WORKERS", "1")))
+
+
+class Overloaded(Exception):
+    """Очередь класса приоритета заполнена, запрос отклонен без генерации."""
+
+
+class ModelScheduler:
+    """
+    Допуск генераций одной модели: не больше concurrency одновременно, фоновым генерациям
+    (рассылки, напоминания) — не больше background_slots из них, чтобы интерактивным вопросам
+    всегда оставался свободный слот. Ожидающие упорядочены по приоритету, затем по времени прихода.
+    Если очередь класса заполнена, запрос сразу отклоняется (Overloaded).
+    """
+
+    def __init__(self, model, concurrency, background_slots, queue_limits=QUEUE_LIMITS):
+        self.model = model
+        self.concurrency = concurrency
+        self.background_slots = background_slots
+        self.queue_limits = dict(queue_limits)
+        self.waiters = []
+        self.sequence = itertools.count()
+        self.running = {priority: 0 for priority in PRIORITY_NAMES}
+        self.queued = {priority: 0 for priority in PRIORITY_NAMES}
+        self.admitted = {priority: 0 for priority in PRIORITY_NAMES}
+        self.shed = {priority: 0 for priority in PRIORITY_NAMES}
+        self.wait_seconds = {priority: 0.0 for priority in PRIORITY_NAMES}
+        self.max_wait_seconds = {priority: 0.0 for priority in PRIORITY_NAMES}
+
+    def can_start(self, priority):
+        if sum(self.running.values()) >= self.concurrency:
+            return False
+        return priority != BACKGROUND or self.running[BACKGROUND] < self.background_slots
+
+    def has_waiters(self, priority):
+        """Есть ли ожидающие того же или более высокого приоритета (их нельзя обгонять)."""
+        return any(self.queued[other] for other in PRIORITY_NAMES if other <= priority)
+
+    async def acquire(self, priority):
+        started = time.perf_counter()
+        if self.can_start(priority) and not self.has_waiters(priority):
+            self.running[priority] += 1
+        else:
+            if self.queued[priority] >= self.queue_limits[priority]:
+                self.shed[priority] += 1
+                raise Overloaded(f"Очередь {PRIORITY_NAMES[priority]} модели {self.model} заполнена")
+            future = asyncio.get_running_loop().create_future()
+            heapq.heappush(self.waiters, (priority, next(self.sequence), future))
+            self.queued[priority] += 1
+            try:
+                await future
+            except asyncio.CancelledError:
+                if future.done() and not future.cancelled():
+                    # Слот уже выдан, но ожидающий ушел — возвращаем слот
+                    self.release(priority)
+                else:
+                    self.queued[priority] -= 1
+                raise
+
+        waited = time.perf_counter() - started
+        self.admitted[priority] += 1
+        self.wait_seconds[priority] += waited
+        self.max_wait_seconds[priority] = max(self.max_wait_seconds[priority], waited)
+
+    def release(self, priority):
+        self.running[priority] -= 1
+        self.dispatch()
+
+    def dispatch(self):
+        """Выдает освободившиеся слоты ожидающим в порядке приоритета."""
+        while self.waiters:
+            priority, _, future = self.waiters[0]
+            if future.done():
+                # Ожидающий отменен
+                heapq.heappop(self.waiters)
+                continue
+            if not self.can_start(priority):
+                break
+            heapq.heappop(self.waiters)
+            self.queued[priority] -= 1
+            self.running[priority] += 1
+            future.set_result(None)
+
+    def stats(self):
+        return {
+            "concurrency": self.concurrency,
+            "background_slots": self.background_slots,
+            **{
+                name: {
+                    "running": self.running[priority],
+                    "queued": self.queued[priority],
+                    "queue_limit": self.queue_limits[priority],
+                    "admitted": self.admitted[priority],
+                    "shed": self.shed[priority],
+                    "avg_wait_ms": round(self.wait_seconds[priority] / self.admitted[priority] * 1000, 2)
+                    if self.admitted[priority] else 0.0,
+                    "max_wait_ms": round(self.max_wait_seconds[priority] * 1000, 2),
+                }
+                for priority, name in PRIORITY_NAMES.items()
+            },
+        }
+
+
+class Generation:
+    """Допущенная генерация: держит слот планировщика, клиент модели берется из пула на время async with."""
+
+    def __init__(self, scheduler, pool, priority):
+        self.scheduler = scheduler
+        self.pool = pool
+        self.priority = priority
+        self.lease = None
+        self.released = False
+
+    async def __aenter__(self):
+        self.lease = self.pool.lease()
+        return await self.lease.__aenter__()
+
+    async def __aexit__(self, *exc_info):
+        try:
+            return await self.lease.__aexit__(*exc_info)
+        finally:
+            self.release()
+
+    def release(self):
+        """Освобождает слот; повторный вызов ничего не делает."""
+        if not self.released:
+            self.released = True
+            self.scheduler.release(self.priority)
+
+
+class GenerationScheduler:
+    """
+    Планировщики генераций для всех моделей с пулами клиентов (см. llm_pool).
+    LLM_CONCURRENCY_<МОДЕЛЬ> — лимит на весь сервис: каждому из workers процессов достается его доля
+    (не меньше одного слота, так что при workers больше лимита он превышается).
+    """
+
+    def __init__(self, llm_pools, workers=RAG_WORKERS):
+        self.llm_pools = llm_pools
+        self.schedulers = {}
+        for model, pool in llm_pools.items():
+            env_suffix = model.upper().replace("-", "_")
+            # По умолчанию параллельность равна размеру пула, поэтому клиент из пула выдается без ожидания
+            total_concurrency = int(os.getenv(f"LLM_CONCURRENCY_{env_suffix}", pool.size))
+            concurrency = max(1, total_concurrency // workers)
+            if concurrency * workers != total_concurrency:
+                print(f"Лимит генераций {model}: {total_concurrency} на сервис, {concurrency} на каждый "
+                      f"из {workers} процессов (итого {concurrency * workers})")
+            total_background = int(os.getenv(f"LLM_BACKGROUND_SLOTS_{env_suffix}",
+                                             os.getenv("LLM_BACKGROUND_SLOTS", max(1, total_concurrency // 2))))
+            if concurrency > 1:
+                # Хотя бы один слот процесса всегда остается интерактивным вопросам
+                background_slots = max(1, min(concurrency - 1, total_background // workers))
+            else:
+                background_slots = 1
+                print(f"Внимание: у {model} один слот генерации на процесс, фоновая генерация "
+                      f"может задержать интерактивные вопросы; увеличьте LLM_CONCURRENCY_{env_suffix}")
+            self.schedulers[model] = ModelScheduler(model, concurrency, background_slots)
+
+    async def acquire(self, model, priority):
+        """Ждет слот для генерации; при заполненной очереди выбрасывает Overloaded."""
+        scheduler = self.schedulers[model]
+        await scheduler.acquire(priority)
+        return Generation(scheduler, self.llm_pools[model], priority)
+
+    def stats(self):
+        return {model: scheduler.stats() for model, scheduler in self.schedulers.items()}
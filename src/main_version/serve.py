@@ -0,0 +1,55 @@
+"""
+Запуск rag_service в нескольких процессах uvicorn.
+
+Запуск:
+    RAG_WORKERS=4 python serve.py
+
+По умолчанию (INDEX_SOURCE=artifacts) воркеры только читают готовые снапшоты по манифесту build_index.py;
+если манифеста еще нет, индексы один раз собираются отдельным процессом перед стартом. С INDEX_SOURCE=build
+и RAG_WORKERS > 1 сборка тоже выполняется заранее, а воркеры переключаются на artifacts. Общими для воркеров
+(page cache) страницы векторов становятся только у IVF-индексов (INDEX_TYPE=ivf): faiss-cpu 1.10 отображает
+в память лишь инвертированные списки, flat и HNSW копируются в каждый процесс
+(замер — python index_benchmark.py --worker-memory N).
+Каждый воркер держит только модель для эмбеддингов вопросов (для экономии памяти — EMBEDDING_BACKEND=onnx)
+и docstore с текстами чанков.
+"""
+import os
+import sys
+import subprocess
+import uvicorn
+
+from rag_settings import INDEX_SOURCE
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+
+RAG_HOST = os.getenv("RAG_HOST", "0.0.0.0")
+RAG_PORT = int(os.getenv("RAG_PORT", "8000"))
+RAG_WORKERS = int(os.getenv("RAG_WORKERS", "1"))
+
+
+def manifest_path():
+    # Тот же путь, что index_store.manifest_path, без импорта FAISS и LangChain в родительский процесс
+    cache_dir = os.getenv("INDEX_CACHE_DIR", os.path.join(BASE_DIR, "index_cache"))
+    return os.path.join(cache_dir, "manifest.json")
+
+
+def build_indexes():
+    subprocess.run([sys.executable, os.path.join(BASE_DIR, "build_index.py")], check=True)
+
+
+def main():
+    # Сборка в отдельном процессе: модель и корпус не остаются в памяти родителя
+    if INDEX_SOURCE == "artifacts" and not os.path.exists(manifest_path()):
+        print(f"Манифест {manifest_path()} не найден, собираем индексы")
+        build_indexes()
+    elif INDEX_SOURCE != "artifacts" and RAG_WORKERS > 1:
+        build_indexes()
+        # Воркеры наследуют окружение и только читают готовые артефакты
+        os.environ["INDEX_SOURCE"] = "artifacts"
+
+    print(f"Запускаем сервер на ws://{RAG_HOST}:{RAG_PORT}/ws, воркеров: {RAG_WORKERS}")
+    uvicorn.run("rag_service:app", host=RAG_HOST, port=RAG_PORT, workers=RAG_WORKERS, app_dir=BASE_DIR)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,89 @@
+import asyncio
+
+
+class Flight:
+    """Одна выполняющаяся генерация: уже полученные фрагменты и подписчики, которые их ждут."""
+
+    def __init__(self):
+        self.chunks = []
+        self.done = False
+        self.error = None
+        self.condition = asyncio.Condition()
+        self.task = None
+
+    async def publish(self, chunk):
+        async with self.condition:
+            self.chunks.append(chunk)
+            self.condition.notify_all()
+
+    async def finish(self, error=None):
+        async with self.condition:
+            self.done = True
+            self.error = error
+            self.condition.notify_all()
+
+    async def subscribe(self):
+        """Отдает все фрагменты с начала: опоздавший подписчик сначала получает уже отправленные."""
+        position = 0
+        while True:
+            async with self.condition:
+                await self.condition.wait_for(lambda: position < len(self.chunks) or self.done)
+                chunks = self.chunks[position:]
+                done = self.done
+            for chunk in chunks:
+                yield chunk
+            position += len(chunks)
+            if done and position >= len(self.chunks):
+                if self.error is not None:
+                    raise self.error
+                return
+
+
+class SingleFlight:
+    """
+    Склейка одинаковых запросов, пока генерация по ним еще идет.
+
+    Первый запрос с ключом запускает генерацию в отдельной задаче, остальные с тем же ключом
+    подписываются на ее фрагменты. Генерация не зависит от соединения, которое ее начало:
+    если оно закроется, остальные подписчики дослушают ответ. Ошибка генерации
+    (например, Overloaded) выбрасывается у всех подписчиков.
+    После завершения ключ освобождается, следующий такой же запрос запустит новую генерацию.
+    """
+
+    def __init__(self):
+        self.flights = {}
+        self.started = 0
+        self.joined = 0
+
+    def stream(self, key, produce):
+        """Асинхронный итератор фрагментов ответа; produce() — асинхронный генератор, запускается один раз на ключ."""
+        flight = self.flights.get(key)
+        if flight is None:
+            flight = Flight()
+            self.flights[key] = flight
+            self.started += 1
+            flight.task = asyncio.create_task(self.run(key, flight, produce))
+        else:
+            self.joined += 1
+            print(f"Запрос присоединен к выполняющейся генерации {key}")
+        return flight.subscribe()
+
+    async def run(self, key, flight, produce):
+        error = None
+        try:
+            async for chunk in produce():
+                await flight.publish(chunk)
+        except Exception as e:
+            error = e
+        finally:
+            del self.flights[key]
+            await flight.finish(error)
+
+    def stats(self):
+        requests = self.started + self.joined
+        return {
+            "in_flight": len(self.flights),
+            "generations": self.started,
+            "joined": self.joined,
+            "coalesced_ratio": round(self.joined / requests, 4) if requests else 0.0,
+        }
@@ -0,0 +1,65 @@
+import time
+import random
+import asyncio
+from langchain_core.language_models.chat_models import BaseChatModel
+from langchain_core.messages import AIMessage, AIMessageChunk
+from langchain_core.outputs import ChatGeneration, ChatGenerationChunk, ChatResult
+
+
+class StubChatModel(BaseChatModel):
+    """
+    Заглушка GigaChat для бенчмарков и нагрузочных тестов без обращения к API.
+    Отдает фиксированный ответ по словам: первое слово через ttft секунд, остальные — через token_delay.
+
+    Для проверки дедлайнов и переключения на запасную модель можно внести сбои:
+    с вероятностью stall_rate первое слово задерживается еще на stall секунд,
+    с вероятностью fail_rate генерация падает с ошибкой (до первого слова или на fail_after-м слове).
+    """
+
+    ttft: float = 0.5
+    token_delay: float = 0.05
+    answer: str = "Это тестовый ответ заглушки модели, который приходит по словам с заданной задержкой."
+    stall_rate: float = 0.0
+    stall: float = 0.0
+    fail_rate: float = 0.0
+    fail_after: int = 0
+
+    @property
+    def _llm_type(self):
+        return "stub"
+
+    def tokens(self):
+        return [word + " " for word in self.answer.split()]
+
+    def plan(self):
+        """Задержки перед каждым словом и номер слова, на котором генерация упадет (None — без сбоя)."""
+        tokens = self.tokens()
+        delays = [self.ttft] + [self.token_delay] * (len(tokens) - 1)
+        if random.random() < self.stall_rate:
+            delays[0] += self.stall
+        fail_at = min(self.fail_after, len(tokens)) if random.random() < self.fail_rate else None
+        return tokens, delays, fail_at
+
+    @staticmethod
+    def fail():
+        raise ConnectionError("Заглушка модели: имитация обрыва соединения с GigaChat")
+
+    def _generate(self, messages, stop=None, run_manager=None, **kwargs):
+        time.sleep(self.ttft + self.token_delay * (len(self.tokens()) - 1))
+        return ChatResult(generations=[ChatGeneration(message=AIMessage(content=self.answer))])
+
+    def _stream(self, messages, stop=None, run_manager=None, **kwargs):
+        tokens, delays, fail_at = self.plan()
+        for position, (token, delay) in enumerate(zip(tokens, delays)):
+            time.sleep(delay)
+            if position == fail_at:
+                self.fail()
+            yield ChatGenerationChunk(message=AIMessageChunk(content=token))
+
+    async def _astream(self, messages, stop=None, run_manager=None, **kwargs):
+        tokens, delays, fail_at = self.plan()
+        for position, (token, delay) in enumerate(zip(tokens, delays)):
+            await asyncio.sleep(delay)
+            if position == fail_at:
+                self.fail()
+            yield ChatGenerationChunk(message=AIMessageChunk(content=token))
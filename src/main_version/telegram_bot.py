@@ -4,7 +4,6 @@ from telebot import types
 import asyncio
 import websockets
 import requests
-import json
 import time
 import os
 import sqlite3
@@ -13,6 +12,8 @@ from datetime import datetime, UTC, timedelta
 import threading
 import pytz
 
+from dialogue_memory import DialogueMemory
+
 load_dotenv()
 
 DATABASE_URL = "/app/src/main_version/AI_agent.db"    
@@ -20,12 +21,20 @@ DATABASE_URL = "/app/src/main_version/AI_agent.db"
 WEBSOCKET_URL = "ws://127.0.0.1:8000/ws"
 moscow_tz = pytz.timezone('Europe/Moscow')
 
+# chat_id -> DialogueMemory: краткое содержание беседы и последние сообщения
 dialogue_context = {}
 count_questions_users = {}
 
 secret_key = os.getenv("TELEGRAM_API_KEY")
 FEEDBACK_BOT_TOKEN = os.getenv("FEEDBACK_BOT_TOKEN")
 FEEDBACK_CHAT_ID = os.getenv("FEEDBACK_CHAT_ID")
+# Через сколько минут повторить напоминание или пятничное сообщение, если сервис не дал ответа
+BACKGROUND_RETRY_MINUTES = int(os.getenv("BACKGROUND_RETRY_MINUTES", "5"))
+# Сколько раз всего пытаться получить напоминание или пятничное сообщение: постоянная ошибка
+# сервиса (например, сломанный пакет) не должна повторяться бесконечно
+BACKGROUND_MAX_ATTEMPTS = int(os.getenv("BACKGROUND_MAX_ATTEMPTS", "6"))
+# Число неудачных попыток по (пользователь, текст напоминания); хранится в памяти процесса бота
+reminder_attempts = {}
 
 feedback_bot = telebot.TeleBot(FEEDBACK_BOT_TOKEN)
 # cache_dict = {3 : ["Уровень Junior\nСофты:\n1. Желание учиться которое подтверждается делом.(Что изучено за последний год? Как это применяется?).\n2. Проактивная работа с заказчиком.(Инициатива по вопросам/запросу ОС должна поступать от специалиста).\n3. Умение принимать ОС.\n4. Многозадачность - в термин (многозадачность) вкладывается НЕ возможность в каждый момент времени думать сразу о нескольких задачах, а возможность переключаться между задачами/проектами (от 2х - оптимально, до 5ти - максимально) без сильной потери эффективности (что какая-то потеря эффективности будет - факт).",
@@ -550,6 +559,46 @@ def process_reminder_input(message):
             conn.close()
 
 
+async def request_background_answer(context_str, count):
+    """
+    Запрашивает у сервиса пятничное сообщение (count=101) или напоминание (count=102).
+    Пустая строка — сервис отклонил фоновую генерацию (1013), не ответил или недоступен.
+    """
+    wanted_simbols = [".", ":"]
+    question_id = 666
+    role = 'Аналитик'
+    specialization = 'Специалист'
+    question = 'without'
+    full_answer = ""
+    try:
+        async with websockets.connect(WEBSOCKET_URL) as websocket:
+            await websocket.send(question) # Отправляем вопрос
+            await websocket.send(role)
+            await websocket.send(specialization)
+            await websocket.send(str(question_id))
+            await websocket.send(context_str)
+            await websocket.send(str(count))
+            try:
+                while True:
+                    answer_part = await websocket.recv()  # Получаем ответ частями
+                    if answer_part:
+                        for char in answer_part:
+                            if (char in wanted_simbols):
+                                answer_part += "\n"
+
+                        full_answer += answer_part
+                    else:
+                        print("Получено пустое сообщение от WebSocket.")
+            except websockets.exceptions.ConnectionClosed as e:
+                if e.rcvd is not None and e.rcvd.code == 1013:
+                    print(f"Сервис отклонил фоновую генерацию {count}: очередь заполнена")
+                    return ""
+    except Exception as e:
+        print(f"Ошибка при запросе фоновой генерации {count}: {e}")
+        return ""
+    return full_answer
+
+
 async def check():
     while True:
         conn = sqlite3.connect(DATABASE_URL)
@@ -585,57 +634,46 @@ async def check():
                 cursor.execute("DELETE FROM Reminder WHERE id_rem=?", (reminder['id_rem'],))
                 conn.commit()
                 chat_id = reminder['user_id']
-                wanted_simbols = [".", ":"]
                 context_str = reminder['reminder_text']
                 if(not context_str):
                     context_str = "История сообщений пустая"
-                question_id = 666
-                role = 'Аналитик'   
-                specialization = 'Специалист'
-                count_for_pro_activity = 102
-                question = 'without'
-                
+                full_answer = await request_background_answer(context_str, 102)
+                attempts_key = (chat_id, reminder['reminder_text'])
+                if not full_answer:
+                    attempts = reminder_attempts.get(attempts_key, 0) + 1
+                    if attempts >= BACKGROUND_MAX_ATTEMPTS:
+                        reminder_attempts.pop(attempts_key, None)
+                        print(f"Напоминание пользователю {chat_id} не отправлено после {attempts} попыток, "
+                              f"оно удалено")
+                        continue
+                    reminder_attempts[attempts_key] = attempts
+                    # Сервис отклонил фоновую генерацию или не ответил — напоминание переносится, а не теряется
+                    retry_time = datetime.now() + timedelta(minutes=BACKGROUND_RETRY_MINUTES)
+                    cursor.execute(
+                        "INSERT INTO Reminder (user_id, reminder_text, reminder_time) VALUES (?, ?, ?)",
+                        (chat_id, reminder['reminder_text'], retry_time.strftime("%Y-%m-%d %H:%M:%S")),
+                    )
+                    conn.commit()
+                    print(f"Напоминание пользователю {chat_id} перенесено на {retry_time:%H:%M}")
+                    continue
+                reminder_attempts.pop(attempts_key, None)
+                markup = types.InlineKeyboardMarkup(row_width=1)
+                question = [
+                    types.InlineKeyboardButton(text="Вернуться в начало", callback_data="start"),
+                    types.InlineKeyboardButton(text="Задать вопрос", callback_data="question_custom"),
+                ]
+                markup.add(*question)
                 try:
-                    async with websockets.connect(WEBSOCKET_URL) as websocket:
-                        await websocket.send(question) # Отправляем вопрос
-                        await websocket.send(role)
-                        await websocket.send(specialization)
-                        await websocket.send(str(question_id))
-                        await websocket.send(context_str)
-                        await websocket.send(str(count_for_pro_activity))
-                        try:
-                            full_answer = ""
-                            while True:
-                                answer_part = await websocket.recv()  # Получаем ответ частями
-                                if answer_part:
-                                    for char in answer_part:
-                                        if (char in wanted_simbols):
-                                            answer_part += "\n"
-                                    
-                                    full_answer += answer_part
-                                else:
-                                    print("Получено пустое сообщение от WebSocket.")
-                            
-                        except websockets.exceptions.ConnectionClosed:
-                            markup = types.InlineKeyboardMarkup(row_width=1)
-                            question = [
-                                types.InlineKeyboardButton(text="Вернуться в начало", callback_data="start"),
-                                types.InlineKeyboardButton(text="Задать вопрос", callback_data="question_custom"),
-                            ]
-                            markup.add(*question)
-                            try:
-                                # Пытаемся отправить сообщение
-                                bot.send_message(chat_id=chat_id, text=full_answer, reply_markup=markup)
-                                print(f"Сообщение отправлено пользователю {chat_id}")
-                            except telebot.apihelper.ApiException as e:
-                                # Если пользователь заблокировал бота, вы получите исключение
-                                if "Forbidden: bot was blocked by the user" in str(e):
-                                    print(f"Пользователь {chat_id} заблокировал бота.")
-                                else:
-                                    # Обработка других возможных ошибок
-                                    print(f"Ошибка при отправке сообщения: {e}")
-                except Exception as e:
-                    print(f"Ошибка при обработке напоминания: {e}")
+                    # Пытаемся отправить сообщение
+                    bot.send_message(chat_id=chat_id, text=full_answer, reply_markup=markup)
+                    print(f"Сообщение отправлено пользователю {chat_id}")
+                except telebot.apihelper.ApiException as e:
+                    # Если пользователь заблокировал бота, вы получите исключение
+                    if "Forbidden: bot was blocked by the user" in str(e):
+                        print(f"Пользователь {chat_id} заблокировал бота.")
+                    else:
+                        # Обработка других возможных ошибок
+                        print(f"Ошибка при отправке сообщения: {e}")
         
         conn.close()
         await asyncio.sleep(60)  # Проверяем каждую минуту
@@ -661,7 +699,43 @@ def run_async_task():
 threading.Thread(target=run_async_task, daemon=True).start()
 
 # Асинхронная функция для проверки и отправки напоминаний
+async def send_friday_message(chat_id):
+    """Отправляет пятничное сообщение; False — сервис не дал ответа, отправку нужно повторить."""
+    # Получаем историю диалога пользователя
+    context_str = take_history_dialog_from_db(chat_id)
+    print(f"context_str type: {type(context_str)}")
+    if context_str is None:
+        context_str = "История сообщений пустая"
+    elif not isinstance(context_str, str):
+        context_str = str(context_str)  # преобразуем в строку
+
+    full_answer = await request_background_answer(context_str, 101)
+    if not full_answer:
+        return False
+    # Создаем клавиатуру
+    markup = types.InlineKeyboardMarkup(row_width=1)
+    buttons = [
+        types.InlineKeyboardButton(text="Вернуться в начало", callback_data="start"),
+        types.InlineKeyboardButton(text="Задать вопрос", callback_data="question_custom"),
+    ]
+    markup.add(*buttons)
+
+    try:
+        # Отправляем сообщение
+        bot.send_message(chat_id=chat_id, text=full_answer, reply_markup=markup)
+        print(f"Пятничное сообщение отправлено пользователю {chat_id}")
+    except telebot.apihelper.ApiException as e:
+        if "Forbidden: bot was blocked by the user" in str(e):
+            print(f"Пользователь {chat_id} заблокировал бота.")
+        else:
+            print(f"Ошибка при отправке сообщения: {e}")
+    return True
+
 async def check_for_daily_msg():
+    # Пользователи, которым пятничное сообщение еще не отправлено (с числом неудачных попыток),
+    # и время следующей попытки
+    pending_users = {}
+    retry_at = datetime.now()
     while True:
         try:
             # Получаем текущую дату и время
@@ -680,66 +754,28 @@ async def check_for_daily_msg():
                 users_results = cursor.fetchall()
                 conn.close()
 
-                # Отправляем сообщение каждому пользователю
-                for user in users_results:
-                    chat_id = user['user_id']
-                    wanted_simbols = [".", ":"]
-                    
-                    # Получаем историю диалога пользователя
-                    context_str = take_history_dialog_from_db(chat_id)
-                    print(f"context_str type: {type(context_str)}")
-                    if context_str is None:
-                        context_str = "История сообщений пустая"
-                    elif not isinstance(context_str, str):
-                        context_str = str(context_str)  # преобразуем в строку
-                    
-                    question_id = 666   
-                    role = 'Аналитик'   
-                    specialization = 'Специалист'
-                    count_for_pro_activity = 101
-                    question = 'without'
-                    
-                    try:
-                        async with websockets.connect(WEBSOCKET_URL) as websocket:
-                            await websocket.send(question)
-                            await websocket.send(role)
-                            await websocket.send(specialization)
-                            await websocket.send(str(question_id))
-                            await websocket.send(context_str)
-                            await websocket.send(str(count_for_pro_activity))
-                            
-                            full_answer = ""
-                            try:
-                                while True:
-                                    answer_part = await websocket.recv()
-                                    if answer_part:
-                                        for char in answer_part:
-                                            if (char in wanted_simbols):
-                                                answer_part += "\n"
-                                        full_answer += answer_part
-                                    else:
-                                        print("Получено пустое сообщение от WebSocket.")
-                            except websockets.exceptions.ConnectionClosed:
-                                # Создаем клавиатуру
-                                markup = types.InlineKeyboardMarkup(row_width=1)
-                                buttons = [
-                                    types.InlineKeyboardButton(text="Вернуться в начало", callback_data="start"),
-                                    types.InlineKeyboardButton(text="Задать вопрос", callback_data="question_custom"),
-                                ]
-                                markup.add(*buttons)
-                                
-                                try:
-                                    # Отправляем сообщение
-                                    bot.send_message(chat_id=chat_id, text=full_answer, reply_markup=markup)
-                                    print(f"Пятничное сообщение отправлено пользователю {chat_id}")
-                                except telebot.apihelper.ApiException as e:
-                                    if "Forbidden: bot was blocked by the user" in str(e):
-                                        print(f"Пользователь {chat_id} заблокировал бота.")
-                                    else:
-                                        print(f"Ошибка при отправке сообщения: {e}")
-                    except Exception as e:
-                        print(f"Ошибка при обработке пользователя {chat_id}: {e}")
+                # Сообщение отправляется каждому пользователю, неотправленные повторяются позже
+                pending_users = {user['user_id']: 0 for user in users_results}
+                retry_at = now
                 
+            if pending_users and datetime.now() >= retry_at:
+                failed_users = {}
+                for chat_id, attempts in pending_users.items():
+                    if await send_friday_message(chat_id):
+                        continue
+                    if attempts + 1 >= BACKGROUND_MAX_ATTEMPTS:
+                        print(f"Пятничное сообщение пользователю {chat_id} не отправлено после "
+                              f"{attempts + 1} попыток")
+                        continue
+                    failed_users[chat_id] = attempts + 1
+                pending_users = failed_users
+                if pending_users:
+                    # Сервис отклонил фоновые генерации — повторяем позже, а не пропускаем пользователей
+                    retry_at = datetime.now() + timedelta(minutes=BACKGROUND_RETRY_MINUTES)
+                    print(f"Пятничное сообщение не отправлено {len(pending_users)} пользователям, "
+                          f"повтор в {retry_at:%H:%M}")
+
+            if current_day == 4 and current_time == "16:00":
                 # После отправки всем пользователям ждем чуть больше минуты, 
                 # чтобы не отправить сообщения дважды
                 await asyncio.sleep(70)
@@ -786,7 +822,7 @@ def handle_role(call):
 
 def clear_dialog_context(chat_id):
     if chat_id in dialogue_context:
-        dialogue_context[chat_id] = []
+        dialogue_context[chat_id].clear()
     if chat_id in count_questions_users:
         count_questions_users[chat_id] = 0
 
@@ -1187,8 +1223,8 @@ def handling_cached_requests(question_id, message, question, specialization):
 
     chat_id = message.chat.id
     if chat_id not in dialogue_context:
-        dialogue_context[chat_id] = []
-    dialogue_context[chat_id].append({"role": "user", "content": question})
+        dialogue_context[chat_id] = DialogueMemory()
+    dialogue_context[chat_id].add("user", question)
     if chat_id not in count_questions_users:
         count_questions_users[chat_id] = 0
     count_questions_users[chat_id] += 1
@@ -1200,7 +1236,7 @@ def handling_cached_requests(question_id, message, question, specialization):
         full_ans_for_context += i
         time.sleep(1)
     
-    dialogue_context[chat_id].append({"role": "assistant", "content": full_ans_for_context})
+    dialogue_context[chat_id].add("assistant", full_ans_for_context)
     save_message_in_db(chat_id, "assistant", full_ans_for_context)
     markup = types.InlineKeyboardMarkup()
     button = [types.InlineKeyboardButton(text="Ввести уточняющее сообщение", callback_data="question_custom"),
@@ -1216,10 +1252,10 @@ async def websocket_question_from_user(question, message, role, specialization,
     chat_id = message.chat.id
     print(chat_id)
     if chat_id not in dialogue_context:
-        dialogue_context[chat_id] = []
-    dialogue_context[chat_id].append({"role": "user", "content": question})
+        dialogue_context[chat_id] = DialogueMemory()
+    dialogue_context[chat_id].add("user", question)
     save_message_in_db(chat_id, "user", question)
-    context_str = json.dumps(dialogue_context[chat_id], ensure_ascii=False, indent=4)
+    context_str = dialogue_context[chat_id].to_json()
     if chat_id not in count_questions_users:
         count_questions_users[chat_id] = 0
     count_questions_users[chat_id] += 1
@@ -1266,13 +1302,15 @@ async def websocket_question_from_user(question, message, role, specialization,
                 else:
                     print("Получено пустое сообщение от WebSocket.")
             
-        except websockets.exceptions.ConnectionClosed:
+        except websockets.exceptions.ConnectionClosed as e:
             if (full_answer != ""):
                 message_2 = bot.send_message(chat_id=message_2.chat.id, text=full_answer)
                 answer_for_cache.append(full_answer)
                 answer_for_countinue_dialog += full_answer
             print("")
-            if(question_id != 777):
+            # Кешируем только полный ответ модели: запасные и прерванные ответы,
+            # как и отказы при перегрузке, сервис закрывает с кодом ошибки
+            if(question_id != 777 and isinstance(e, websockets.exceptions.ConnectionClosedOK)):
                 if(question_id not in [1, 2, 3, 4, 5, 18, 19, 20]):
                     cache_dict[question_id] = answer_for_cache
                 else:
@@ -1280,7 +1318,7 @@ async def websocket_question_from_user(question, message, role, specialization,
                         cache_by_specialization[question_id] = {}
                     cache_by_specialization[question_id][specialization] = answer_for_cache
             
-        dialogue_context[chat_id].append({"role": "assistant", "content": answer_for_countinue_dialog})
+        dialogue_context[chat_id].add("assistant", answer_for_countinue_dialog)
         save_message_in_db(chat_id, "assistant", answer_for_countinue_dialog)
         markup = types.InlineKeyboardMarkup()
         if(count_questions_users[chat_id] < 6):
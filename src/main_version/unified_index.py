@@ -0,0 +1,160 @@
+import threading
+from typing import Any
+import numpy as np
+import faiss
+from langchain_core.retrievers import BaseRetriever
+
+from ingestion import ANY_SPECIALIZATION, merge_duplicate_chunks
+from faiss_indexes import search_parameters, rescore, is_compressed
+from pack_index import PackIndex, PackState
+from rag_cache import normalize_query
+from lexical_index import BM25Retriever, HybridRetriever
+
+UNIFIED_INDEX_NAME = "docs_unified"
+
+
+class FilterSets:
+    """
+    Битовые маски чанков единого индекса по пакету и специализации.
+    Маски строятся один раз на версию индекса, селекторы FAISS для пар (пакет, специализация)
+    создаются при первом запросе и переиспользуются.
+    """
+
+    def __init__(self, vector_store):
+        n_vectors = vector_store.index.ntotal
+        self.n_vectors = n_vectors
+        self.pack_masks = {}
+        self.specialization_masks = {}
+        for position in range(n_vectors):
+            metadata = vector_store.docstore.search(vector_store.index_to_docstore_id[position]).metadata
+            for pack in metadata.get("packs") or [metadata.get("pack")]:
+                self.mask(self.pack_masks, pack)[position] = True
+            for specialization in metadata.get("specializations") or [metadata.get("specialization")]:
+                self.mask(self.specialization_masks, specialization or ANY_SPECIALIZATION)[position] = True
+        self.selectors = {}
+        self.lock = threading.Lock()
+
+    def mask(self, masks, name):
+        if name not in masks:
+            masks[name] = np.zeros(self.n_vectors, dtype=bool)
+        return masks[name]
+
+    def select(self, pack_name=None, specialization=None):
+        """
+        Возвращает пару (IDSelector FAISS, булева маска) для фильтра.
+        Общие документы (без специализации) проходят фильтр по любой специализации.
+        Неизвестная специализация (например, у роли PO/PM) не фильтрует.
+        """
+        key = (pack_name, specialization)
+        with self.lock:
+            entry = self.selectors.get(key)
+            if entry is None:
+                allowed = np.ones(self.n_vectors, dtype=bool)
+                if pack_name is not None:
+                    allowed &= self.pack_masks.get(pack_name, np.zeros(self.n_vectors, dtype=bool))
+                if specialization in self.specialization_masks and specialization != ANY_SPECIALIZATION:
+                    allowed &= self.specialization_masks[specialization] | self.mask(
+                        self.specialization_masks, ANY_SPECIALIZATION
+                    )
+                bitmap = np.packbits(allowed, bitorder="little")
+                selector = faiss.IDSelectorBitmap(len(bitmap), faiss.swig_ptr(bitmap))
+                # bitmap хранится рядом с селектором: FAISS не копирует его
+                entry = self.selectors[key] = (selector, allowed, bitmap)
+        return entry[0], entry[1]
+
+
+class FilteredRetriever(BaseRetriever):
+    """
+    Поиск по единому индексу с фильтром по метаданным внутри FAISS (IDSelector),
+    без перебора лишних кандидатов и постфильтрации.
+    """
+
+    vector_store: Any
+    search_params: Any
+    cache_name: str
+    version: int
+    k: int = 5
+    cache: Any = None
+    embedding: Any = None
+    rescore_factor: int = 0
+
+    def _get_relevant_documents(self, query, *, run_manager=None):
+        key = (self.cache_name, self.version, self.k, normalize_query(query))
+        if self.cache is not None:
+            docs = self.cache.get(key)
+            if docs is not None:
+                return list(docs)
+
+        query_vector = self.embedding.embed_query(query)
+        n_candidates = self.k * self.rescore_factor if self.rescore_factor > 1 else self.k
+        _, positions = self.vector_store.index.search(
+            np.asarray([query_vector], dtype=np.float32), n_candidates, params=self.search_params
+        )
+        docs = [
+            self.vector_store.docstore.search(self.vector_store.index_to_docstore_id[position])
+            for position in positions[0].tolist() if position != -1
+        ]
+        if self.rescore_factor > 1:
+            exact_vectors = self.embedding.embed_documents([doc.page_content for doc in docs])
+            docs = [doc for doc, _ in rescore(query_vector, docs, exact_vectors, self.k)]
+
+        if self.cache is not None:
+            self.cache.put(key, tuple(docs))
+        return docs
+
+
+class UnifiedIndex(PackIndex):
+    """
+    Один FAISS-индекс по всем пакетам вместо отдельного хранилища на пакет.
+    Одинаковые чанки из пересекающихся пакетов хранятся один раз, принадлежность
+    к пакетам и специализациям — в метаданных, нужный срез выбирается фильтром при поиске.
+    """
+
+    def __init__(self, folder_paths, embedding, model_name, chunk_size, chunk_overlap, ingest,
+                 index_config, **kwargs):
+        def ingest_unique(file_paths, label, **options):
+            return merge_duplicate_chunks(*ingest(file_paths, label, **options))
+
+        super().__init__(UNIFIED_INDEX_NAME, folder_paths, embedding, model_name,
+                         chunk_size, chunk_overlap, ingest_unique, index_config,
+                         full_rebuild=True, **kwargs)
+
+    def make_state(self, vector_store, lexical_index, version):
+        return PackState(vector_store, lexical_index, version, FilterSets(vector_store))
+
+    def owns_cache_key(self, key):
+        return key[0] == self.pack_name or key[0].startswith(self.pack_name + "|")
+
+    def as_retriever(self, pack_name=None, specialization=None, k=None):
+        k = k or self.k
+        state = self.state
+        selector, allowed = state.filters.select(pack_name, specialization)
+        cache_name = f"{self.pack_name}|{pack_name}|{specialization}"
+        dense = FilteredRetriever(
+            vector_store=state.vector_store,
+            search_params=search_parameters(self.index_config, selector),
+            cache_name=cache_name,
+            version=state.version,
+            k=k,
+            cache=self.retrieval_cache,
+            embedding=self.embedding,
+            rescore_factor=self.index_config["rescore_factor"] if is_compressed(self.index_config) else 0,
+        )
+        if self.retriever_mode != "hybrid":
+            return dense
+
+        sparse = BM25Retriever(
+            lexical_index=state.lexical_index,
+            docstore=state.vector_store.docstore,
+            k=k,
+            allowed=allowed,
+        )
+        return HybridRetriever(
+            dense=dense,
+            sparse=sparse,
+            pack_name=cache_name,
+            version=state.version,
+            k=k,
+            sparse_weight=self.sparse_weight,
+            cache=self.retrieval_cache,
+        )